@@ -0,0 +1,87 @@
+"""Compare decoding large responses with decode_json and json.loads
+
+Responses are given to `decode_json` in chunks of bytes, as the transport reads
+them, and to `json.loads` as a whole, as gql does.
+
+Usage::
+
+    python benchmarks/decode.py [--number N] [--memory]
+"""
+
+import argparse
+import json
+import timeit
+import tracemalloc
+from typing import Callable, Dict
+
+from mothrpy.payload import CHUNK_SIZE, decode_json, iter_text
+
+
+def responses() -> Dict[str, bytes]:
+    """Encoded GraphQL responses of the shapes MOTHR returns"""
+    jobs = [
+        {
+            "jobId": f"job-{i}",
+            "service": "echo",
+            "status": "complete",
+            "submittedAt": "2021-01-01T00:00:00.123456789Z",
+            "waitTime": i * 0.5,
+            "runTime": 1.25,
+            "worker": {"workerId": f"worker-{i % 16}"},
+            "result": "line 1\nline 2",
+        }
+        for i in range(60000)
+    ]
+    escaped = 'tab\there "quoted" back\\slash é\n' * 250000
+    plain = "x" * 50_000_000
+    return {
+        "jobs list": json.dumps({"data": {"jobs": jobs}}).encode(),
+        "escaped result": json.dumps({"data": {"job": {"result": escaped}}}).encode(),
+        "plain result": json.dumps({"data": {"job": {"result": plain}}}).encode(),
+    }
+
+
+def chunked(content: bytes) -> Callable[[], object]:
+    """Decode content with `decode_json`, as chunks of `CHUNK_SIZE` bytes"""
+
+    def decode():
+        chunks = (
+            content[i : i + CHUNK_SIZE] for i in range(0, len(content), CHUNK_SIZE)
+        )
+        return decode_json(iter_text(chunks))
+
+    return decode
+
+
+def peak(function: Callable[[], object]) -> float:
+    """Peak memory allocated by a call, in MB"""
+    tracemalloc.start()
+    function()
+    _, size = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return size / 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--number", "-n", type=int, default=3)
+    parser.add_argument("--memory", action="store_true", help="Report peak memory")
+    args = parser.parse_args()
+
+    for name, content in responses().items():
+        functions = {
+            "json.loads": lambda content=content: json.loads(content.decode()),
+            "decode_json": chunked(content),
+        }
+        assert functions["json.loads"]() == functions["decode_json"]()
+        print(f"{name} ({len(content) / 1e6:.1f} MB)")
+        for label, function in functions.items():
+            seconds = min(timeit.repeat(function, number=1, repeat=args.number))
+            line = f"  {label:<12} {seconds * 1000:10.1f} ms"
+            if args.memory:
+                line += f"  {peak(function):8.1f} MB peak"
+            print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,418 @@
+"""Local stand-in for a MOTHR server, used by the benchmarks
+
+Implements ``mothrpy/schema.graphql`` over HTTP and websockets (``graphql-ws``
+protocol) with in-memory jobs that finish after a configurable duration.
+Requires aiohttp, installed with the ``async`` extra.
+
+Usage::
+
+    python benchmarks/server.py [--port 8080] [--job-duration 0.1] [--latency 0]
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import threading
+import time
+import uuid
+from collections import Counter
+from functools import lru_cache
+from typing import Any, AsyncIterator, Dict, List, Optional, Set
+
+from aiohttp import WSMsgType, web
+from graphql import (
+    DocumentNode,
+    ExecutionResult,
+    GraphQLError,
+    build_ast_schema,
+    execute,
+    parse,
+    subscribe,
+    validate,
+)
+
+from mothrpy.client import SCHEMA_PATH
+
+TERMINAL_STATUSES = ("complete", "failed", "cancelled")
+
+
+class FakeMothr:  # pylint: disable=too-many-instance-attributes
+    """In-memory MOTHR server running on a background event loop
+
+    Args:
+        job_duration (float, optional): Time, in seconds, a job spends running,
+            default 0
+        queue_time (float, optional): Time, in seconds, a job spends queued
+            before running, default 0
+        latency (float, optional): Delay, in seconds, added to every HTTP
+            response, default 0
+        jitter (float, optional): Fraction of `job_duration` and `latency` added
+            or removed at random, default 0
+        failure_rate (float, optional): Fraction of jobs that fail, default 0
+        result_size (int, optional): Size, in bytes, of each job result, by
+            default the result echoes the job parameters
+        host (str, optional): Address to listen on, default ``127.0.0.1``
+        port (int, optional): Port to listen on, default a free port
+    """
+
+    def __init__(self, **kwargs):
+        self.job_duration = kwargs.pop("job_duration", 0.0)
+        self.queue_time = kwargs.pop("queue_time", 0.0)
+        self.latency = kwargs.pop("latency", 0.0)
+        self.jitter = kwargs.pop("jitter", 0.0)
+        self.failure_rate = kwargs.pop("failure_rate", 0.0)
+        self.result_size = kwargs.pop("result_size", None)
+        self.host = kwargs.pop("host", "127.0.0.1")
+        self.port = kwargs.pop("port", 0)
+        if kwargs:
+            raise TypeError(f"Unexpected arguments: {', '.join(kwargs)}")
+
+        self.jobs: Dict[str, Dict] = {}
+        self.stats: Counter = Counter()
+        self.services = [
+            {"serviceId": "echo-latest", "name": "echo", "version": "latest"},
+            {"serviceId": "echo-dev", "name": "echo", "version": "dev"},
+        ]
+        self._waiters: Dict[str, List[asyncio.Future]] = {}
+        self._listeners: Dict[str, Set[asyncio.Queue]] = {}
+        self._websockets: Set[web.WebSocketResponse] = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._runner: Optional[web.AppRunner] = None
+        self._validated: Dict[str, List[GraphQLError]] = {}
+        with open(SCHEMA_PATH, encoding="utf-8") as f:
+            self.schema = build_ast_schema(parse(f.read()))
+        self._bind_resolvers()
+
+    @property
+    def url(self) -> str:
+        """HTTP endpoint of the server"""
+        return f"http://{self.host}:{self.port}/api"
+
+    def start(self) -> str:
+        """Start serving in a background thread
+
+        Returns:
+            str: HTTP endpoint of the server
+        """
+        self._loop = asyncio.new_event_loop()
+        started = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, args=(started,), name="fake-mothr", daemon=True
+        )
+        self._thread.start()
+        started.wait()
+        return self.url
+
+    def stop(self):
+        """Stop the server"""
+        if self._loop is None or self._thread is None:
+            return
+        asyncio.run_coroutine_threadsafe(self._shutdown(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+        self._loop = self._thread = None
+
+    def __enter__(self) -> "FakeMothr":
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def publish(self, channel: str, message: str):
+        """Publish a message to ``subscribeEvent`` subscribers, thread-safe"""
+        assert self._loop is not None
+        self._loop.call_soon_threadsafe(
+            self._publish, channel, {"channel": channel, "message": message}
+        )
+
+    def reset(self):
+        """Forget every job and clear the request statistics"""
+        self.jobs.clear()
+        self.stats.clear()
+
+    def _run(self, started: threading.Event):
+        assert self._loop is not None
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_until_complete(self._serve())
+        started.set()
+        self._loop.run_forever()
+
+    async def _serve(self):
+        app = web.Application()
+        app.router.add_route("*", "/api", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = self._runner.addresses[0][1]
+
+    async def _shutdown(self):
+        for waiters in self._waiters.values():
+            for waiter in waiters:
+                waiter.cancel()
+        # Open websockets would keep cleanup waiting on their handlers, closing
+        # them ends the handlers, which cancel their operations
+        await asyncio.gather(
+            *(ws.close() for ws in list(self._websockets)), return_exceptions=True
+        )
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    def _delay(self, seconds: float) -> float:
+        if not seconds or not self.jitter:
+            return seconds
+        return max(0.0, seconds * (1 + random.uniform(-self.jitter, self.jitter)))
+
+    async def _handle(self, request: web.Request) -> web.StreamResponse:
+        if request.headers.get("Upgrade", "").lower() == "websocket":
+            return await self._websocket(request)
+        self.stats["http_requests"] += 1
+        self.stats["bytes_received"] += request.content_length or 0
+        payload = await request.json()
+        if self.latency:
+            await asyncio.sleep(self._delay(self.latency))
+        result = self._execute(payload["query"], payload.get("variables"))
+        body = json.dumps(result.formatted)
+        self.stats["bytes_sent"] += len(body)
+        return web.Response(text=body, content_type="application/json")
+
+    async def _websocket(self, request: web.Request) -> web.WebSocketResponse:
+        ws = web.WebSocketResponse(protocols=("graphql-ws",))
+        await ws.prepare(request)
+        self.stats["ws_connections"] += 1
+        self._websockets.add(ws)
+        tasks: Dict[str, asyncio.Task] = {}
+        try:
+            async for msg in ws:
+                if msg.type != WSMsgType.TEXT:
+                    break
+                message = json.loads(msg.data)
+                kind, op_id = message.get("type"), message.get("id")
+                if kind == "connection_init":
+                    await ws.send_json({"type": "connection_ack"})
+                elif kind == "start":
+                    tasks[op_id] = asyncio.ensure_future(
+                        self._operation(ws, op_id, message["payload"])
+                    )
+                    tasks[op_id].add_done_callback(lambda _, i=op_id: tasks.pop(i))
+                elif kind == "stop" and op_id in tasks:
+                    # Clients wait for the complete message of stopped operations
+                    tasks[op_id].cancel()
+                    await ws.send_json({"type": "complete", "id": op_id})
+                elif kind == "connection_terminate":
+                    break
+        finally:
+            self._websockets.discard(ws)
+            for task in list(tasks.values()):
+                task.cancel()
+        return ws
+
+    async def _operation(self, ws: web.WebSocketResponse, op_id: str, payload: Dict):
+        self.stats["subscriptions"] += 1
+        try:
+            document = _parse(payload["query"])
+            stream = await subscribe(
+                self.schema, document, variable_values=payload.get("variables")
+            )
+            if isinstance(stream, ExecutionResult):
+                await ws.send_json(
+                    {"type": "data", "id": op_id, "payload": stream.formatted}
+                )
+            else:
+                async for result in stream:
+                    await ws.send_json(
+                        {"type": "data", "id": op_id, "payload": result.formatted}
+                    )
+        except GraphQLError as e:
+            await ws.send_json({"type": "error", "id": op_id, "payload": e.formatted})
+        if not ws.closed:
+            await ws.send_json({"type": "complete", "id": op_id})
+
+    def _execute(self, query: str, variables: Optional[Dict]) -> ExecutionResult:
+        try:
+            document = _parse(query)
+        except GraphQLError as e:
+            return ExecutionResult(data=None, errors=[e])
+        errors = self._validated.get(query)
+        if errors is None:
+            errors = self._validated[query] = validate(self.schema, document)
+        if errors:
+            return ExecutionResult(data=None, errors=list(errors))
+        for field in _top_level_fields(document):
+            self.stats[f"field.{field}"] += 1
+        result = execute(self.schema, document, variable_values=variables)
+        assert isinstance(result, ExecutionResult)
+        return result
+
+    def _bind_resolvers(self):
+        query = self.schema.query_type
+        mutation = self.schema.mutation_type
+        subscription = self.schema.subscription_type
+        assert query and mutation and subscription
+        query.fields["job"].resolve = lambda _, info, jobId: self.jobs.get(jobId)
+        query.fields["jobs"].resolve = self._resolve_jobs
+        query.fields["service"].resolve = self._resolve_service
+        query.fields["services"].resolve = lambda _, info, **kwargs: self.services
+        mutation.fields["submitJob"].resolve = self._submit_job
+        mutation.fields["cancelJob"].resolve = self._cancel_job
+        mutation.fields["login"].resolve = lambda _, info, **kwargs: {
+            "token": uuid.uuid4().hex,
+            "refresh": uuid.uuid4().hex,
+        }
+        mutation.fields["refresh"].resolve = lambda _, info, token: {
+            "token": uuid.uuid4().hex
+        }
+        for name, generator in (
+            ("subscribeJobComplete", self._job_complete),
+            ("subscribeJobs", lambda _, info: self._listen("jobs")),
+            ("subscribeEvent", lambda _, info, event: self._listen(f"event.{event}")),
+            ("subscribeJobMessages", lambda _, info, jobId: self._listen(jobId)),
+        ):
+            subscription.fields[name].subscribe = generator
+            subscription.fields[name].resolve = lambda payload, info, **kwargs: payload
+
+    def _resolve_jobs(self, _, info, status=None, service=None) -> List[Dict]:
+        return [
+            job
+            for job in self.jobs.values()
+            if (status is None or job["status"] == status)
+            and (service is None or job["service"] == service)
+        ]
+
+    def _resolve_service(self, _, info, name, version=None, latest=None) -> List[Dict]:
+        return [
+            s
+            for s in self.services
+            if s["name"] == name and version in (None, "*", s["version"])
+        ]
+
+    def _submit_job(self, _, info, request: Dict) -> Dict:
+        assert self._loop is not None
+        job_id = uuid.uuid4().hex
+        job = {
+            "jobId": job_id,
+            "service": request["service"],
+            "version": request.get("version") or "latest",
+            "status": "submitted",
+            "parameters": request.get("parameters") or [],
+            "inputs": request.get("inputs"),
+            "outputs": request.get("outputs"),
+            "inputStream": request.get("inputStream"),
+            "submittedAt": time.time(),
+            "messages": [],
+        }
+        self.jobs[job_id] = job
+        self.stats["jobs_submitted"] += 1
+        self._loop.call_later(self._delay(self.queue_time), self._start_job, job_id)
+        return {"job": job}
+
+    def _cancel_job(self, _, info, jobId: str) -> Optional[Dict]:
+        job = self.jobs.get(jobId)
+        if job is not None and job["status"] not in TERMINAL_STATUSES:
+            self._finish_job(jobId, "cancelled")
+        return job
+
+    def _start_job(self, job_id: str):
+        job = self.jobs.get(job_id)
+        if job is None or job["status"] in TERMINAL_STATUSES:
+            return
+        job["status"] = "running"
+        job["waitTime"] = time.time() - job["submittedAt"]
+        self._publish("jobs", {"jobId": job_id, "type": "running", "total": None})
+        assert self._loop is not None
+        status = "failed" if random.random() < self.failure_rate else "complete"
+        self._loop.call_later(
+            self._delay(self.job_duration), self._finish_job, job_id, status
+        )
+
+    def _finish_job(self, job_id: str, status: str):
+        job = self.jobs.get(job_id)
+        if job is None or job["status"] in TERMINAL_STATUSES:
+            return
+        job["status"] = status
+        job["runTime"] = time.time() - job["submittedAt"] - job.get("waitTime", 0)
+        if status == "complete":
+            if self.result_size is not None:
+                job["result"] = "x" * self.result_size
+            else:
+                job["result"] = " ".join(str(p["value"]) for p in job["parameters"])
+            job["error"] = ""
+            job["exitCode"] = 0
+        else:
+            job["result"] = ""
+            job["error"] = f"job {status}"
+            job["exitCode"] = 1
+        self._publish("jobs", {"jobId": job_id, "type": status, "total": None})
+        for waiter in self._waiters.pop(job_id, []):
+            if not waiter.done():
+                waiter.set_result(job)
+
+    async def _job_complete(self, _, info, jobId: str) -> AsyncIterator[Dict]:
+        job = self.jobs.get(jobId)
+        if job is None or job["status"] not in TERMINAL_STATUSES:
+            assert self._loop is not None
+            waiter = self._loop.create_future()
+            self._waiters.setdefault(jobId, []).append(waiter)
+            job = await waiter
+        yield job
+
+    async def _listen(self, channel: str) -> AsyncIterator[Any]:
+        queue: asyncio.Queue = asyncio.Queue()
+        self._listeners.setdefault(channel, set()).add(queue)
+        try:
+            while True:
+                yield await queue.get()
+        finally:
+            self._listeners[channel].discard(queue)
+
+    def _publish(self, channel: str, payload: Any):
+        for queue in self._listeners.get(channel, ()):
+            queue.put_nowait(payload)
+
+
+@lru_cache(maxsize=256)
+def _parse(query: str) -> DocumentNode:
+    return parse(query)
+
+
+def _top_level_fields(document: DocumentNode) -> List[str]:
+    fields = []
+    for definition in document.definitions:
+        selection_set = getattr(definition, "selection_set", None)
+        for selection in selection_set.selections if selection_set else ():
+            fields.append(selection.name.value)
+    return fields
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--job-duration", type=float, default=0.0)
+    parser.add_argument("--queue-time", type=float, default=0.0)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    args = parser.parse_args()
+    server = FakeMothr(
+        host=args.host,
+        port=args.port,
+        job_duration=args.job_duration,
+        queue_time=args.queue_time,
+        latency=args.latency,
+        jitter=args.jitter,
+        failure_rate=args.failure_rate,
+    )
+    print(f"Serving MOTHR at {server.start()}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
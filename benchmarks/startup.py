@@ -0,0 +1,50 @@
+"""Measure client startup and job request construction time
+
+Usage::
+
+    python benchmarks/startup.py [--number N]
+"""
+
+import argparse
+import subprocess
+import sys
+import timeit
+
+
+def import_time() -> float:
+    """Time to import mothrpy in a fresh interpreter, in seconds"""
+    start = timeit.default_timer()
+    subprocess.run([sys.executable, "-c", "import mothrpy"], check=True)
+    return timeit.default_timer() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--number", "-n", type=int, default=200)
+    args = parser.parse_args()
+
+    # pylint: disable=import-outside-toplevel
+    from mothrpy import JobRequest, MothrClient
+
+    first = timeit.timeit(MothrClient, number=1)
+    client = MothrClient()
+    results = {
+        "import mothrpy (subprocess)": import_time(),
+        "first MothrClient()": first,
+        "MothrClient()": timeit.timeit(MothrClient, number=args.number) / args.number,
+        "JobRequest(client=client)": timeit.timeit(
+            lambda: JobRequest(client=client, service="echo"), number=args.number
+        )
+        / args.number,
+        "JobRequest()": timeit.timeit(
+            lambda: JobRequest(service="echo"), number=args.number
+        )
+        / args.number,
+    }
+    width = max(len(name) for name in results)
+    for name, seconds in results.items():
+        print(f"{name:<{width}}  {seconds * 1000:10.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
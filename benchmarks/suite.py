@@ -0,0 +1,242 @@
+"""Measure client performance against a local stand-in MOTHR server
+
+Runs each benchmark at every job count given with ``--jobs`` and writes a JSON
+report. Pass a previous report with ``--compare`` to print the change in every
+measurement.
+
+Usage::
+
+    python benchmarks/suite.py [--jobs 1 10 100] [--out report.json]
+        [--compare baseline.json] [--only submit polling ...]
+"""
+
+import argparse
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import timeit
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Callable, Dict, List
+
+from server import FakeMothr
+
+from mothrpy import JobRequest, MothrClient
+
+BENCHMARKS: Dict[str, Callable] = {}
+
+
+def benchmark(name: str):
+    """Register a benchmark, called with the server, job count and arguments"""
+
+    def register(func: Callable) -> Callable:
+        BENCHMARKS[name] = func
+        return func
+
+    return register
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    """Summary of latency samples, in seconds"""
+    ordered = sorted(samples)
+
+    def rank(q: float) -> float:
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    return {
+        "mean": statistics.mean(ordered),
+        "p50": rank(0.5),
+        "p95": rank(0.95),
+        "p99": rank(0.99),
+        "max": ordered[-1],
+    }
+
+
+def requests(jobs: int, client: MothrClient) -> List[JobRequest]:
+    return [
+        JobRequest(client=client, service="echo").add_parameter(value=str(i))
+        for i in range(jobs)
+    ]
+
+
+@benchmark("construction")
+def construction(server: FakeMothr, jobs: int, args) -> Dict:
+    """Time to create a client and job requests"""
+    number = max(jobs, 100)
+    client = MothrClient(url=server.url)
+    return {
+        "client_seconds": timeit.timeit(
+            lambda: MothrClient(url=server.url), number=number
+        )
+        / number,
+        "request_seconds": timeit.timeit(
+            lambda: JobRequest(client=client, service="echo"), number=number
+        )
+        / number,
+    }
+
+
+@benchmark("submit")
+def submit(server: FakeMothr, jobs: int, args) -> Dict:
+    """Submit throughput, batched and one request per job"""
+    client = MothrClient(url=server.url, pool_maxsize=args.threads)
+    batch = requests(jobs, client)
+    start = time.perf_counter()
+    client.submit_many(batch)
+    batched = time.perf_counter() - start
+
+    single = requests(jobs, client)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        list(pool.map(lambda r: r.submit(), single))
+    individual = time.perf_counter() - start
+    client.close()
+    return {
+        "submit_many_seconds": batched,
+        "submit_many_jobs_per_second": jobs / batched,
+        "submit_seconds": individual,
+        "submit_jobs_per_second": jobs / individual,
+    }
+
+
+@benchmark("polling")
+def polling(server: FakeMothr, jobs: int, args) -> Dict:
+    """Cost of waiting on jobs with the shared tracker"""
+    client = MothrClient(url=server.url, pool_maxsize=args.threads)
+    client.tracker.poll_frequency = args.poll_frequency
+    params = ([{"type": "parameter", "value": str(i)}] for i in range(jobs))
+    server.reset()
+    start = time.perf_counter()
+    for _ in client.as_completed("echo", params, max_in_flight=jobs):
+        pass
+    elapsed = time.perf_counter() - start
+    client.close()
+    return {
+        "seconds": elapsed,
+        "jobs_per_second": jobs / elapsed,
+        "http_requests_per_job": server.stats["http_requests"] / jobs,
+        "status_queries_per_job": server.stats["field.job"] / jobs,
+        "bytes_per_job": (server.stats["bytes_sent"] + server.stats["bytes_received"])
+        / jobs,
+    }
+
+
+@benchmark("run_job")
+def run_job(server: FakeMothr, jobs: int, args) -> Dict:
+    """End-to-end latency of JobRequest.run_job, with jobs run concurrently"""
+    client = MothrClient(url=server.url, pool_maxsize=args.threads)
+    client.tracker.poll_frequency = args.poll_frequency
+    results = {}
+    for mode in args.modes:
+
+        def run(request: JobRequest) -> float:
+            start = time.perf_counter()
+            request.run_job(poll_frequency=args.poll_frequency, mode=mode)
+            return time.perf_counter() - start
+
+        with ThreadPoolExecutor(max_workers=min(jobs, args.threads)) as pool:
+            samples = list(pool.map(run, requests(jobs, client)))
+        results.update(
+            {f"{mode}_{k}_seconds": v for k, v in percentiles(samples).items()}
+        )
+    client.close()
+    return results
+
+
+@benchmark("subscriptions")
+def subscriptions(server: FakeMothr, jobs: int, args) -> Dict:
+    """Subscription fan-out, many job subscriptions on one websocket"""
+    client = MothrClient(url=server.url)
+    job_ids = client.submit_many(requests(jobs, client))
+    server.stats.clear()
+    start = time.perf_counter()
+    futures = [client.subscriptions.watch(job_id) for job_id in job_ids]
+    for future in futures:
+        future.result(timeout=args.timeout)
+    elapsed = time.perf_counter() - start
+    client.close()
+    return {
+        "seconds": elapsed,
+        "jobs_per_second": jobs / elapsed,
+        "ws_connections": server.stats["ws_connections"],
+    }
+
+
+def environment() -> Dict:
+    try:
+        revision = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            check=True,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        revision = None
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "revision": revision,
+    }
+
+
+def compare(report: Dict, baseline: Dict):
+    """Print the relative change of every measurement present in both reports"""
+    rows = []
+    for name, metrics in report["results"].items():
+        for metric, value in metrics.items():
+            previous = baseline["results"].get(name, {}).get(metric)
+            if isinstance(previous, (int, float)) and previous:
+                change = (value - previous) / previous * 100
+                rows.append((f"{name} {metric}", previous, value, change))
+    width = max((len(row[0]) for row in rows), default=0)
+    for label, previous, value, change in rows:
+        print(f"{label:<{width}}  {previous:12.6g}  {value:12.6g}  {change:+8.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--jobs", type=int, nargs="+", default=[1, 10, 100, 1000])
+    parser.add_argument("--only", nargs="+", choices=list(BENCHMARKS))
+    parser.add_argument("--modes", nargs="+", default=["poll", "track", "subscribe"])
+    parser.add_argument("--job-duration", type=float, default=0.05)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--poll-frequency", type=float, default=0.05)
+    parser.add_argument("--threads", type=int, default=64)
+    parser.add_argument("--timeout", type=float, default=300)
+    parser.add_argument("--out", help="Write the JSON report to this file")
+    parser.add_argument("--compare", help="Report to compare the results with")
+    args = parser.parse_args()
+
+    report = {
+        "created": datetime.now(timezone.utc).isoformat(),
+        "environment": environment(),
+        "config": {k: v for k, v in vars(args).items() if k not in ("out", "compare")},
+        "results": {},
+    }
+    with FakeMothr(
+        job_duration=args.job_duration, latency=args.latency, jitter=args.jitter
+    ) as server:
+        for name in args.only or BENCHMARKS:
+            for jobs in args.jobs:
+                key = f"{name}/{jobs}"
+                print(f"Running {key}", file=sys.stderr)
+                report["results"][key] = BENCHMARKS[name](server, jobs, args)
+                server.reset()
+
+    output = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare(report, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
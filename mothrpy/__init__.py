@@ -2,5 +2,21 @@
 # Use of this source code is governed by a BSD-style
 # license that can be found in the LICENSE file.
 
+from .admission import AdmissionController, Limit
+from .analytics import JobTable
+from .async_client import AsyncMothrClient
+from .auth import AuthManager
+from .cache import ResultCache, TTLCache
 from .client import MothrClient
+from .index import JobStateIndex
+from .journal import SubmissionJournal
+from .metrics import Metrics
+from .payload import StreamSource
+from .pipeline import Pipeline
+from .polling import AdaptivePolicy, BackoffPolicy, FixedPolicy, PollPolicy
 from .request import JobRequest
+from .result import JobResult
+from .stream import MessageStream
+from .subscriptions import SubscriptionManager
+from .tracker import JobTracker
+from .validation import RequestValidator, ServiceSpec
@@ -0,0 +1,262 @@
+# Copyright 2020 Resilient Solutions Inc. All rights reserved.
+# Use of this source code is governed by a BSD-style
+# license that can be found in the LICENSE file.
+
+import math
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, Optional, Tuple
+
+# Limited resource, (`total`, None), (`service`, name) or (`queue`, name)
+Key = Tuple[str, Optional[str]]
+
+
+class Limit:  # pylint: disable=too-few-public-methods
+    """Rate and concurrency limits of job submissions
+
+    Args:
+        rate (float, optional): Jobs submitted per second, unlimited by default
+        burst (int, optional): Jobs that can be submitted at once before `rate`
+            applies, default one second's worth
+        max_in_flight (int, optional): Maximum number of submit requests sent
+            but not yet answered, unlimited by default. The ceiling of the
+            concurrency limit in adaptive mode
+    """
+
+    __slots__ = ("rate", "burst", "max_in_flight")
+
+    def __init__(
+        self,
+        rate: Optional[float] = None,
+        burst: Optional[int] = None,
+        max_in_flight: Optional[int] = None,
+    ):
+        if rate is not None and rate <= 0:
+            raise ValueError("rate must be positive")
+        if max_in_flight is not None and max_in_flight < 1:
+            raise ValueError("max_in_flight must be at least 1")
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1, math.ceil(rate or 1))
+        self.max_in_flight = max_in_flight
+
+
+class Ticket:  # pylint: disable=too-few-public-methods
+    """Admission of one submit request, set `error` if the request failed"""
+
+    __slots__ = ("waited", "error")
+
+    def __init__(self, waited: float):
+        self.waited = waited
+        self.error = False
+
+
+class _Gate:  # pylint: disable=too-few-public-methods
+    """Token bucket and in-flight count of one service, queue or the total"""
+
+    __slots__ = ("limit", "tokens", "updated", "in_flight", "concurrency", "decreased")
+
+    def __init__(self, limit: Limit, concurrency: float, now: float):
+        self.limit = limit
+        self.tokens = float(limit.burst)
+        self.updated = now
+        self.in_flight = 0
+        self.concurrency = concurrency
+        self.decreased = -math.inf
+
+    def delay(self, count: int, now: float) -> Optional[float]:
+        """Time until `count` jobs can be submitted, None if waiting on a slot"""
+        if self.in_flight + 1 > max(1.0, self.concurrency):
+            return None
+        if self.limit.rate is None:
+            return 0.0
+        self.tokens = min(
+            self.limit.burst, self.tokens + (now - self.updated) * self.limit.rate
+        )
+        self.updated = now
+        # Requests larger than the burst are let through with a full bucket and
+        # leave it in debt, so they are never blocked indefinitely
+        needed = min(count, self.limit.burst)
+        return max(0.0, (needed - self.tokens) / self.limit.rate)
+
+
+class AdmissionController:  # pylint: disable=too-many-instance-attributes
+    """Limit the rate and concurrency of job submissions per service and queue
+
+    Each job submission passes the limits of its service, its queue and the
+    `total` limit. Submissions beyond a limit wait locally until they are
+    admitted instead of failing. Rates are enforced with token buckets and
+    concurrency by counting submit requests that have been sent but not yet
+    answered, a batch of jobs sent with `MothrClient.submit_many` counts as one
+    request per service and queue and takes a token per job.
+
+    In adaptive mode the concurrency limit of each service, queue and the total
+    is adjusted by additive increase, multiplicative decrease (AIMD). Every
+    request answered within `target_latency` raises the limit by
+    `increase / limit`, about `increase` per round of requests, and a failed or
+    slow request multiplies it by `decrease`, at most once per `target_latency`.
+    The limit never exceeds the `max_in_flight` of the `Limit`.
+
+    Args:
+        services (dict, optional): `Limit` for each service name
+        queues (dict, optional): `Limit` for each queue
+        default (Limit, optional): Limit of each service without its own,
+            services are unlimited by default
+        total (Limit, optional): Limit of every submission together
+        adaptive (bool, optional): Adjust concurrency limits to the observed
+            submit latency and errors. Default False
+        target_latency (float, optional): Submit latency, in seconds, above
+            which the concurrency limit is lowered, default 1
+        initial (int, optional): Starting concurrency limit in adaptive mode,
+            default 8
+        increase (float, optional): Additive increase, default 1
+        decrease (float, optional): Multiplicative decrease, default 0.5
+        timer (callable, optional): Clock, default `time.monotonic`
+    """
+
+    # pylint: disable=too-many-arguments
+    def __init__(
+        self,
+        services: Optional[Dict[str, Limit]] = None,
+        queues: Optional[Dict[str, Limit]] = None,
+        default: Optional[Limit] = None,
+        total: Optional[Limit] = None,
+        adaptive: bool = False,
+        target_latency: float = 1.0,
+        initial: int = 8,
+        increase: float = 1.0,
+        decrease: float = 0.5,
+        timer: Callable[[], float] = time.monotonic,
+    ):
+        if not 0 < decrease < 1:
+            raise ValueError("decrease must be between 0 and 1")
+        self.services = dict(services or {})
+        self.queues = dict(queues or {})
+        self.default = default
+        self.total = total
+        self.adaptive = adaptive
+        self.target_latency = target_latency
+        self.initial = initial
+        self.increase = increase
+        self.decrease = decrease
+        self.timer = timer
+        self.waiting = 0
+        self._gates: Dict[Key, _Gate] = {}
+        self._cond = threading.Condition()
+
+    def limit(
+        self, service: Optional[str] = None, queue: Optional[str] = None
+    ) -> float:
+        """Current concurrency limit of a service, a queue or, by default, the total
+
+        Returns:
+            float: Maximum number of submit requests in flight, `inf` if unlimited
+        """
+        key: Key = ("total", None)
+        if service is not None:
+            key = ("service", service)
+        elif queue is not None:
+            key = ("queue", queue)
+        with self._cond:
+            gate = self._gate(key)
+        return math.inf if gate is None else gate.concurrency
+
+    @contextmanager
+    def admit(self, jobs: Iterable[Tuple[str, Optional[str]]]) -> Iterator[Ticket]:
+        """Wait until a submit request may be sent
+
+        The request is counted as in flight until the block exits, and its
+        latency and any exception raised are used to adapt the limits.
+
+        Args:
+            jobs (list<tuple>): `(service, queue)` of each job in the request
+
+        Yields:
+            Ticket: Set its `error` to report a request that failed without
+                raising
+        """
+        gates: Counter = Counter()
+        for service, queue in jobs:
+            gates.update((("total", None), ("service", service), ("queue", queue)))
+        ticket = Ticket(self._acquire(gates))
+        start = self.timer()
+        try:
+            yield ticket
+        except BaseException:
+            ticket.error = True
+            raise
+        finally:
+            self._release(gates, self.timer() - start, ticket.error)
+
+    def _gate(self, key: Key) -> Optional[_Gate]:
+        """Gate of a key, created on first use, or None if it is unlimited"""
+        gate = self._gates.get(key)
+        if gate is not None:
+            return gate
+        kind, name = key
+        limit: Optional[Limit] = self.total
+        if kind == "service":
+            limit = self.default if name is None else self.services.get(name)
+            limit = limit or self.default
+        elif kind == "queue":
+            limit = None if name is None else self.queues.get(name)
+        if limit is None:
+            return None
+        if limit.max_in_flight is None:
+            concurrency = self.initial if self.adaptive else math.inf
+        elif self.adaptive:
+            concurrency = min(self.initial, limit.max_in_flight)
+        else:
+            concurrency = limit.max_in_flight
+        gate = self._gates[key] = _Gate(limit, concurrency, self.timer())
+        return gate
+
+    def _acquire(self, counts: Counter) -> float:
+        """Block until every gate admits its jobs, then take tokens and slots"""
+        start = self.timer()
+        with self._cond:
+            gates = [
+                (gate, count)
+                for gate, count in ((self._gate(key), n) for key, n in counts.items())
+                if gate is not None
+            ]
+            self.waiting += 1
+            try:
+                while True:
+                    now = self.timer()
+                    delays = [gate.delay(count, now) for gate, count in gates]
+                    if all(delay == 0 for delay in delays):
+                        break
+                    timeouts = [delay for delay in delays if delay]
+                    self._cond.wait(max(timeouts) if timeouts else None)
+            finally:
+                self.waiting -= 1
+            for gate, count in gates:
+                gate.tokens -= count
+                gate.in_flight += 1
+        return self.timer() - start
+
+    def _release(self, counts: Counter, latency: float, error: bool):
+        now = self.timer()
+        with self._cond:
+            for key in counts:
+                gate = self._gates.get(key)
+                if gate is None:
+                    continue
+                gate.in_flight -= 1
+                if self.adaptive:
+                    self._adapt(gate, latency, error, now)
+            self._cond.notify_all()
+
+    def _adapt(self, gate: _Gate, latency: float, error: bool, now: float):
+        """Adjust a gate's concurrency limit by AIMD"""
+        ceiling = gate.limit.max_in_flight or math.inf
+        if error or latency > self.target_latency:
+            if now - gate.decreased >= self.target_latency:
+                gate.concurrency = max(1.0, gate.concurrency * self.decrease)
+                gate.decreased = now
+        else:
+            gate.concurrency = min(
+                ceiling, gate.concurrency + self.increase / gate.concurrency
+            )
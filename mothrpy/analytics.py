@@ -0,0 +1,310 @@
+# Copyright 2020 Resilient Solutions Inc. All rights reserved.
+# Use of this source code is governed by a BSD-style
+# license that can be found in the LICENSE file.
+
+import math
+import re
+from array import array
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None  # type: ignore
+
+
+# Fields fetched by `MothrClient.jobs` by default
+JOB_FIELDS = [
+    "jobId",
+    "service",
+    "queue",
+    "status",
+    "worker.workerId",
+    "submittedAt",
+    "waitTime",
+    "runTime",
+    "maxMemory",
+    "numCpu",
+    "cpuUsage",
+]
+
+# Fields stored as floats, missing values are NaN
+NUMERIC_FIELDS = {"waitTime", "runTime", "exitCode", "maxMemory", "numCpu", "cpuUsage"}
+
+# DateTime fields, stored as seconds since the epoch
+TIME_FIELDS = {"submittedAt", "serviceCreationDate"}
+
+# Names `JobTable.summary` accepts for `by`, with the field they group on
+GROUPS = {"service": "service", "queue": "queue", "worker": "worker.workerId"}
+
+# Date and time, fraction of a second and UTC offset of an ISO 8601 time.
+# `datetime.fromisoformat` only accepts 3 or 6 digit fractions before 3.11
+_TIME = re.compile(r"(.*T\d{2}:\d{2}:\d{2})(?:\.(\d+))?(.*)")
+
+
+def parse_time(value: Optional[str]) -> float:
+    """Seconds since the epoch of an ISO 8601 time, NaN if it is missing
+
+    Fractions of a second of any precision, such as the nanoseconds of
+    RFC 3339 times, are rounded down to microseconds.
+    """
+    if not value:
+        return math.nan
+    match = _TIME.match(value)
+    if match is not None:
+        date_time, fraction, offset = match.groups()
+        if fraction:
+            date_time += "." + fraction[:6].ljust(6, "0")
+        value = date_time + ("+00:00" if offset in ("Z", "z") else offset)
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        return math.nan
+
+
+class JobTable:
+    """Job records stored column by column
+
+    Numeric and time fields are kept in float arrays, other fields as an
+    integer code per job and a list of the distinct values, so hundreds of
+    thousands of jobs take little memory. Columns are NumPy arrays when NumPy
+    is installed, `array.array` otherwise.
+
+    Example::
+
+        table = client.jobs(status="complete")
+        len(table)  # Number of jobs
+        table["runTime"]  # Run time of each job
+        table.summary(by="queue")
+
+    Args:
+        jobs (list<dict>): Job records, as returned by a ``jobs`` query
+        fields (list<str>): Fields to keep, nested fields are specified using
+            dot notation. Only scalar fields are supported
+
+    Raises:
+        ValueError: If a field is not a scalar
+    """
+
+    def __init__(self, jobs: Iterable[Dict], fields: Sequence[str]):
+        jobs = jobs if isinstance(jobs, list) else list(jobs)
+        self.fields = list(fields)
+        self._length = len(jobs)
+        self._numbers: Dict[str, Any] = {}
+        self._codes: Dict[str, Any] = {}
+        self._labels: Dict[str, List[Any]] = {}
+        # Decoded a column at a time, so each job is only walked once per field
+        for field in self.fields:
+            values = _values(jobs, field)
+            try:
+                if field in TIME_FIELDS:
+                    self._numbers[field] = _column([parse_time(v) for v in values])
+                elif field in NUMERIC_FIELDS:
+                    self._numbers[field] = _column(
+                        [math.nan if v is None else v for v in values]
+                    )
+                else:
+                    lookup: Dict[Any, int] = {}
+                    codes = [lookup.setdefault(v, len(lookup)) for v in values]
+                    self._codes[field] = _column(codes, "i")
+                    self._labels[field] = list(lookup)
+            except TypeError:
+                raise ValueError(f"Field {field} is not a scalar") from None
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __getitem__(self, field: str) -> Union[Sequence[float], List[Any]]:
+        """Values of a field for every job
+
+        Returns:
+            array|list: Floats for numeric and time fields, the field's values
+                for other fields
+        """
+        if field in self._numbers:
+            return self._numbers[field]
+        if field not in self._codes:
+            raise KeyError(field)
+        labels = self._labels[field]
+        return [labels[code] for code in self._codes[field]]
+
+    def codes(self, field: str) -> Tuple[Sequence[int], List[Any]]:
+        """Value of a non numeric field for every job, as codes into its values
+
+        Returns:
+            tuple<array, list>: Index into the values of each job, and the
+                distinct values
+        """
+        return self._codes[field], self._labels[field]
+
+    def groups(self, by: Optional[str]) -> Dict[Any, Any]:
+        """Indexes of the jobs with each value of a field
+
+        Args:
+            by (str): `service`, `queue`, `worker` or another non numeric field.
+                Every job is in a single group, None, if `by` is None
+
+        Returns:
+            dict: Job indexes by value
+        """
+        if by is None:
+            if np is not None:
+                return {None: np.arange(self._length)}
+            return {None: list(range(self._length))}
+        codes, labels = self.codes(GROUPS.get(by, by))
+        if np is not None:
+            order = np.argsort(codes, kind="stable")
+            counts = np.bincount(codes, minlength=len(labels))
+            splits = np.split(order, np.cumsum(counts)[:-1])
+            return {labels[i]: s for i, s in enumerate(splits) if len(s)}
+        groups: Dict[Any, List[int]] = {}
+        for i, code in enumerate(codes):
+            groups.setdefault(labels[code], []).append(i)
+        return groups
+
+    def summary(
+        self,
+        by: Optional[str] = "service",
+        metrics: Sequence[str] = ("waitTime", "runTime"),
+        percentiles: Sequence[float] = (50, 90, 99),
+    ) -> Dict[Any, Dict[str, Any]]:
+        """Percentiles and throughput of each group of jobs
+
+        Throughput is the number of jobs divided by the time from the first
+        submission to the last job finishing, `submittedAt` plus `waitTime`
+        and `runTime`. It is None unless those fields are in the table.
+
+        Args:
+            by (str, optional): Group jobs by `service`, `queue`, `worker` or
+                another non numeric field, default `service`. Every job is in
+                a single group, None, if `by` is None
+            metrics (list<str>, optional): Numeric fields to summarize, default
+                `waitTime` and `runTime`. Fields not in the table are left out
+            percentiles (list<float>, optional): Percentiles, between 0 and 100,
+                of each metric, default 50, 90 and 99
+
+        Returns:
+            dict: For each group, its `count`, `throughput` in jobs per second,
+                and for each metric a dict of its `mean`, `min`, `max` and
+                percentiles, e.g. `p90`. Missing values are left out
+
+            Example::
+
+                {
+                    'echo': {
+                        'count': 1000,
+                        'throughput': 12.5,
+                        'runTime': {'mean': 1.2, 'min': 0.4, 'max': 9.1,
+                                    'p50': 1.0, 'p90': 2.2, 'p99': 6.3},
+                    }
+                }
+        """
+        summaries = {}
+        for group, indexes in self.groups(by).items():
+            summary: Dict[str, Any] = {
+                "count": len(indexes),
+                "throughput": self._throughput(indexes),
+            }
+            for metric in metrics:
+                if metric not in self._numbers:
+                    continue
+                summary[metric] = _describe(
+                    _take(self._numbers[metric], indexes), percentiles
+                )
+            summaries[group] = summary
+        return summaries
+
+    def _throughput(self, indexes: Sequence[int]) -> Optional[float]:
+        """Jobs per second from the first submission to the last finish"""
+        columns = ("submittedAt", "waitTime", "runTime")
+        if not all(c in self._numbers for c in columns):
+            return None
+        start, wait, run = (_take(self._numbers[c], indexes) for c in columns)
+        if np is not None:
+            known = ~np.isnan(start)
+            finish = start + np.nan_to_num(wait) + np.nan_to_num(run)
+            first = start[known].min(initial=np.inf)
+            last = finish[known].max(initial=-np.inf)
+        else:
+            pairs = [
+                (s, s + _or_zero(w) + _or_zero(r))
+                for s, w, r in zip(start, wait, run)
+                if not math.isnan(s)
+            ]
+            first = min((s for s, _ in pairs), default=math.inf)
+            last = max((f for _, f in pairs), default=-math.inf)
+        if last <= first:
+            return None
+        return len(indexes) / float(last - first)
+
+
+def _values(jobs: List[Dict], field: str) -> List[Any]:
+    """Value of a field, given in dot notation, in each job, None if missing"""
+    if "." not in field:
+        return [job.get(field) for job in jobs]
+    values = []
+    path = field.split(".")
+    for job in jobs:
+        value: Any = job
+        for name in path:
+            if value is None:
+                break
+            value = value.get(name)
+        values.append(value)
+    return values
+
+
+def _column(values: List[Any], typecode: str = "d") -> Any:
+    """Compact array of numbers, a NumPy array if NumPy is installed"""
+    column = array(typecode, values)
+    if np is None:
+        return column
+    return np.frombuffer(column, dtype=typecode)
+
+
+def _or_zero(value: float) -> float:
+    return 0.0 if math.isnan(value) else value
+
+
+def _take(column: Any, indexes: Any) -> Any:
+    """Values of a column at the given indexes, an array with NumPy"""
+    if np is not None:
+        return column[indexes]
+    return [column[i] for i in indexes]
+
+
+def _describe(
+    values: Sequence[float], percentiles: Sequence[float]
+) -> Dict[str, float]:
+    """Mean, range and percentiles of the values that are not NaN"""
+    if np is not None:
+        present = values[~np.isnan(values)]  # type: ignore
+        if len(present) == 0:
+            return {}
+        stats = {
+            "mean": float(present.mean()),
+            "min": float(present.min()),
+            "max": float(present.max()),
+        }
+        points = np.percentile(present, percentiles)
+        stats.update({f"p{p:g}": float(v) for p, v in zip(percentiles, points)})
+        return stats
+    ordered = sorted(v for v in values if not math.isnan(v))
+    if not ordered:
+        return {}
+    stats = {
+        "mean": sum(ordered) / len(ordered),
+        "min": ordered[0],
+        "max": ordered[-1],
+    }
+    stats.update({f"p{p:g}": _percentile(ordered, p) for p in percentiles})
+    return stats
+
+
+def _percentile(ordered: List[float], percentile: float) -> float:
+    """Percentile of sorted values, interpolated linearly like NumPy"""
+    rank = (len(ordered) - 1) * percentile / 100
+    low = math.floor(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
@@ -0,0 +1,419 @@
+# Copyright 2020 Resilient Solutions Inc. All rights reserved.
+# Use of this source code is governed by a BSD-style
+# license that can be found in the LICENSE file.
+
+from __future__ import annotations
+import asyncio
+import logging
+import time
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+from gql import Client
+from gql.client import AsyncClientSession
+from gql.dsl import DSLField, DSLSchema, query as dsl_query
+from gql.transport.exceptions import TransportQueryError, TransportServerError
+from gql.transport.websockets import WebsocketsTransport
+from graphql import DocumentNode
+
+from .auth import AUTH_OPERATIONS, is_auth_error
+from .client import VALIDATED_SHAPES, BaseMothrClient, get_schema
+from .metrics import operation_name
+from .polling import FixedPolicy, PollPolicy
+from .selection import CachedValidationClient
+from .subscriptions import RECONNECT_ERRORS, first_result
+from .tracker import RESULT_FIELDS, TERMINAL_STATUSES
+
+if TYPE_CHECKING:
+    from .request import JobRequest
+
+
+log = logging.getLogger(__name__)
+
+
+class AsyncMothrClient(BaseMothrClient):  # pylint: disable=too-many-instance-attributes
+    """Asynchronous client for connecting to MOTHR
+
+    Requests are sent with gql's aiohttp transport and subscriptions share a
+    single websocket connection. Requires the ``async`` extra,
+    ``pip install mothrpy[async]``.
+
+    Unlike `MothrClient`, job requests are submitted as they are: there is no
+    `AdmissionController` or `RequestValidator`, and no `ResultCache` is used
+    even if one is given. Jobs recorded in a `SubmissionJournal` are still
+    reattached to.
+
+    Example::
+
+        async with AsyncMothrClient() as client:
+            request = JobRequest(client=client, service="echo")
+            request.add_parameter(value="Hello MOTHR!")
+            result = await client.run_job(request)
+
+    Args:
+        url (str, optional): Endpoint to send the job request,
+            checks for ``MOTHR_ENDPOINT`` in environment variables otherwise
+            defaults to ``http://localhost:8080/query``
+        token (str, optional): Access token to use for authentication, the library
+            also looks for ``MOTHR_ACCESS_TOKEN`` in the environment as a fallback
+        username (str, optional): Username for logging in, if not given the library
+            will attempt to use ``MOTHR_USERNAME`` environment variable. If neither
+            are found the request will be made without authentication.
+        password (str, optional): Password for logging in, if not given the library
+            will attempt to use the ``MOTHR_PASSWORD`` environment variable. If
+            neither are found the request will be made without authentication.
+        auth (AuthManager, optional): Tokens shared with other clients, refreshed
+            once for all of them. Default, a manager used by this client alone
+        service_cache_ttl (float, optional): Cache `service` and `services`
+            results for this many seconds, results are not cached by default
+        service_cache_size (int, optional): Maximum number of cached `service` and
+            `services` results, default 128
+        metrics (Metrics, optional): Records request latency, errors and other
+            client metrics, nothing is recorded by default
+        poll_policy (PollPolicy, optional): Decides the delay between status
+            queries in `run_job`, e.g. an `AdaptivePolicy`. Default, poll at the
+            requested `poll_frequency`
+        max_concurrency (int, optional): Maximum number of requests sent to MOTHR
+            at the same time, default 100
+    """
+
+    def __init__(self, **kwargs):
+        # Imported here so aiohttp is only required by the async client
+        from gql.transport.aiohttp import (  # pylint: disable=import-outside-toplevel
+            AIOHTTPTransport,
+        )
+
+        self.max_concurrency = kwargs.pop("max_concurrency", 100)
+        if self.max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1")
+        super().__init__(**kwargs)
+        self.client = CachedValidationClient(
+            transport=AIOHTTPTransport(url=self.url),
+            schema=get_schema(),
+            validated=VALIDATED_SHAPES,
+        )
+        self.ds = DSLSchema(self.client)
+        self.ws_client: Optional[Client] = None
+        self._session: Optional[AsyncClientSession] = None
+        self._ws_session: Optional[AsyncClientSession] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._connect_lock: Optional[asyncio.Lock] = None
+        self._refresh_task: Optional[asyncio.Future] = None
+
+    async def __aenter__(self) -> AsyncMothrClient:
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+    async def connect(self):
+        """Open the HTTP session and login if credentials were provided"""
+        # pylint: disable=import-outside-toplevel
+        import aiohttp
+
+        if self._session is not None:
+            return
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._connect_lock = asyncio.Lock()
+        self.client.transport.client_session_args = {
+            "connector": aiohttp.TCPConnector(limit=self.max_concurrency)
+        }
+        await self.client.transport.connect()
+        self._session = AsyncClientSession(client=self.client)
+        if self.token is None and all((self._username, self._password)):
+            await self.login(self._username, self._password)
+
+    async def close(self):
+        """Close the HTTP session and the subscription websocket"""
+        if self._ws_session is not None:
+            await self.ws_client.transport.close()
+            self._ws_session = None
+        if self._session is not None:
+            await self.client.transport.close()
+            self._session = None
+
+    async def execute(self, *fields: DSLField, operation: str = "query") -> Dict:
+        """Execute a query or mutation
+
+        Args:
+            fields (`gql.dsl.DSLField`): Fields to include in the operation
+            operation (str, optional): Operation type, `query` or `mutation`
+
+        Returns:
+            dict: Response data
+        """
+        document = dsl_query(*fields, operation=operation)
+        auth = self.auth
+        if auth.refresh_token is None or operation_name(document) in AUTH_OPERATIONS:
+            return await self._execute(document)
+        token = auth.token
+        if auth.expiring(0):
+            token = await self._refresh(token)
+        try:
+            return await self._execute(document)
+        except (TransportQueryError, TransportServerError) as e:
+            if not is_auth_error(str(e)):
+                raise
+        await self._refresh(token)
+        return await self._execute(document)
+
+    async def _execute(self, document: DocumentNode) -> Dict:
+        if self._session is None:
+            await self.connect()
+        assert self._session is not None and self._semaphore is not None
+        async with self._semaphore:
+            if self.metrics is None:
+                return await self._session.execute(
+                    document, extra_args={"headers": dict(self.headers)}
+                )
+            start = time.perf_counter()
+            try:
+                return await self._session.execute(
+                    document, extra_args={"headers": dict(self.headers)}
+                )
+            except Exception:
+                error = True
+                raise
+            else:
+                error = False
+            finally:
+                self.metrics.request(
+                    operation_name(document), time.perf_counter() - start, error
+                )
+
+    async def login(
+        self, username: Optional[str] = None, password: Optional[str] = None
+    ) -> Tuple[str, str]:
+        """Retrieve a web token from MOTHR
+
+        See `MothrClient.login`
+        """
+        q = self._login_query(username, password)
+        resp = await self.execute(q, operation="mutation")
+        return self._set_login_tokens(resp)
+
+    async def refresh_token(self) -> str:
+        """Refresh an expired access token
+
+        See `MothrClient.refresh_token`
+
+        Returns:
+            str: New access token
+        """
+        return await self._refresh()
+
+    async def _refresh(self, stale: Optional[str] = None) -> str:
+        """Refresh the access token, sharing any refresh already in flight"""
+        if self.auth.refresher is not None:
+            # Share the refresh with the synchronous clients using the manager
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(None, self.auth.refresh, stale)
+        token = self.auth.token
+        if stale is not None and token is not None and token != stale:
+            return token
+        if self._refresh_task is None:
+            self._refresh_task = asyncio.ensure_future(self._request_token())
+        task = self._refresh_task
+        try:
+            return await asyncio.shield(task)
+        finally:
+            if task.done() and self._refresh_task is task:
+                self._refresh_task = None
+
+    async def _request_token(self) -> str:
+        resp = await self.execute(self._refresh_query(), operation="mutation")
+        return self._set_refreshed_token(resp)
+
+    async def service(
+        self,
+        name: str,
+        version: Optional[str] = "*",
+        fields: Optional[List[str]] = None,
+    ) -> List[Dict]:
+        """Query a service by name
+
+        See `MothrClient.service`
+        """
+        key = self._service_key(name, version, fields)
+        cached = self._cached_services(key)
+        if cached is not None:
+            return cached
+        resp = await self.execute(self._service_query(name, version, fields))
+        return self._cache_services(key, resp["service"])
+
+    async def services(self, fields: Optional[List[str]] = None) -> List[Dict]:
+        """Retrieve all services registered with MOTHR
+
+        See `MothrClient.services`
+        """
+        key = self._services_key(fields)
+        cached = self._cached_services(key)
+        if cached is not None:
+            return cached
+        resp = await self.execute(self._services_query(fields))
+        return self._cache_services(key, resp["services"])
+
+    async def submit(self, request: JobRequest) -> str:
+        """Submit a job request
+
+        The request is neither validated, admitted nor looked up in a result
+        cache, see `JobRequest.submit` for the synchronous client.
+
+        Args:
+            request (JobRequest): Job request to submit
+
+        Returns:
+            str: The unique job identifier
+        """
+        resumed = self._claim(request)
+        if resumed is not None:
+            return resumed
+        resp = await self.execute(self._submit_query(request), operation="mutation")
+        job = resp["submitJob"]["job"]
+        request.job_id = job["jobId"]
+        request.status = job["status"]
+        self._record(request)
+        return job["jobId"]
+
+    async def query_job(self, request: JobRequest, fields: List[str]) -> Dict:
+        """Query information about a job request
+
+        Args:
+            request (JobRequest): Submitted job request
+            fields (list<str>): Fields to return in the query response
+
+        Returns:
+            dict: Query result for the job request
+
+        Raises:
+            ValueError: If job ID does not exist
+        """
+        if request.job_id is None:
+            raise ValueError("Job ID is None, have you submitted the job?")
+        resp = await self.execute(self._job_query(request.job_id, fields))
+        return resp["job"]
+
+    async def cancel_job(self, job_id: str) -> Dict:
+        """Cancel a job
+
+        Args:
+            job_id (str): Job to cancel
+
+        Returns:
+            dict: The job's `jobId` and `status`
+        """
+        resp = await self.execute(self._cancel_query(job_id), operation="mutation")
+        return resp["cancelJob"]
+
+    # pylint: disable=too-many-arguments
+    async def run_job(
+        self,
+        request: JobRequest,
+        poll_frequency: float = 0.25,
+        return_failed: bool = False,
+        policy: Optional[PollPolicy] = None,
+        timeout: Optional[float] = None,
+    ) -> Dict:
+        """Submit a job request and wait for it to finish
+
+        See `JobRequest.run_job`
+
+        Args:
+            request (JobRequest): Job request to execute
+            poll_frequency (float, optional): Frequency, in seconds, to poll for job
+                status. Default, poll 0.25 seconds. Ignored when a poll policy
+                is given to the request or the client
+            return_failed (bool, optional): Return failed job results instead of
+                raising an exception. Default False
+            policy (PollPolicy, optional): Decides the delay between polls,
+                defaults to the client's `poll_policy`
+            timeout (float, optional): Time, in seconds, to wait for the job
+                after submitting it before cancelling it. Default, wait until
+                the job finishes
+
+        Returns:
+            dict: The job result
+
+        Raises:
+            RuntimeError: If the job failed, unless `return_failed` is True
+            TimeoutError: If the job did not finish within `timeout`, the job is
+                cancelled
+        """
+        policy = policy or self.poll_policy or FixedPolicy(poll_frequency)
+        job_id = await self.submit(request)
+        try:
+            await asyncio.wait_for(self._wait(request, policy), timeout)
+        except asyncio.TimeoutError:
+            request.status = (await self.cancel_job(job_id))["status"]
+            raise TimeoutError(
+                f"Job {job_id} did not finish within {timeout}s and was cancelled"
+            ) from None
+        result = await self.query_job(request, RESULT_FIELDS)
+        if result["status"] != "complete" and return_failed is False:
+            raise RuntimeError(f"Job {job_id} failed: {result['error']}")
+        return result
+
+    async def _wait(self, request: JobRequest, policy: PollPolicy):
+        """Poll a submitted job's status until it finishes"""
+        service = request.req_args.get("service")
+        version = request.req_args.get("version", "latest")
+        fields = ["status", *policy.fields]
+        start = time.monotonic()
+        job = await self.query_job(request, fields)
+        while job["status"] not in TERMINAL_STATUSES:
+            await asyncio.sleep(
+                policy.delay(time.monotonic() - start, service, version)
+            )
+            job = await self.query_job(request, fields)
+        policy.observe(service, version, job)
+        request.status = job["status"]
+
+    async def subscribe(self, request: JobRequest) -> Dict:
+        """Wait for a submitted job's complete event
+
+        Args:
+            request (JobRequest): Submitted job request
+
+        Returns:
+            dict: The job result
+        """
+        session = await self._websocket()
+        q = self.ds.Subscription.subscribe_job_complete.args(jobId=request.job_id)
+        q = self.select(q, "Job", RESULT_FIELDS)
+        try:
+            result = await first_result(session, q)
+        except RECONNECT_ERRORS:
+            # The next subscription connects again, with the current headers
+            await self._drop_websocket(session)
+            raise
+        if result is None:
+            raise RuntimeError(f"Subscription to job {request.job_id} closed")
+        return result["subscribeJobComplete"]
+
+    async def _websocket(self):
+        """Websocket session shared by every subscription"""
+        if self._session is None:
+            await self.connect()
+        assert self._connect_lock is not None
+        async with self._connect_lock:
+            if self._ws_session is None:
+                transport = WebsocketsTransport(
+                    url=self.ws_url, headers=dict(self.headers)
+                )
+                self.ws_client = Client(transport=transport, schema=get_schema())
+                await transport.connect()
+                self._ws_session = AsyncClientSession(client=self.ws_client)
+        return self._ws_session
+
+    async def _drop_websocket(self, session: AsyncClientSession):
+        """Close the websocket if it has not already been replaced"""
+        assert self._connect_lock is not None
+        transport = session.transport
+        async with self._connect_lock:
+            if session is not self._ws_session:
+                return
+            self._ws_session = None
+        try:
+            await transport.close()
+        except Exception as e:  # pylint: disable=broad-except
+            log.debug("Error closing websocket: %r", e)
@@ -0,0 +1,211 @@
+# Copyright 2020 Resilient Solutions Inc. All rights reserved.
+# Use of this source code is governed by a BSD-style
+# license that can be found in the LICENSE file.
+
+import base64
+import binascii
+import inspect
+import json
+import logging
+import re
+import threading
+import time
+import weakref
+from concurrent.futures import Future
+from typing import Callable, List, Optional
+
+log = logging.getLogger(__name__)
+
+# Operations that must not wait on a token refresh, they obtain the tokens
+AUTH_OPERATIONS = ("login", "refresh")
+
+# Error messages returned when a request is rejected for its access token
+AUTH_ERROR = re.compile(
+    r"\b401\b|unauthori[sz]ed|unauthenticated|token (is )?(expired|invalid)"
+    r"|(expired|invalid) token",
+    re.IGNORECASE,
+)
+
+
+def token_expiry(token: Optional[str]) -> Optional[float]:
+    """Expiry time of a JWT, read from its `exp` claim without verification
+
+    Args:
+        token (str): JSON web token
+
+    Returns:
+        float: Expiry as a Unix timestamp, or None if the token is not a JWT
+            or does not expire
+    """
+    if token is None:
+        return None
+    try:
+        payload = token.split(".")[1]
+        claims = json.loads(
+            base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4))
+        )
+        return float(claims["exp"])
+    except (IndexError, KeyError, TypeError, ValueError, binascii.Error):
+        return None
+
+
+def is_auth_error(message: str) -> bool:
+    """Whether an error message means the access token was rejected"""
+    return AUTH_ERROR.search(message) is not None
+
+
+class AuthManager:  # pylint: disable=too-many-instance-attributes
+    """Access and refresh tokens shared by one or more clients
+
+    When the access token is a JWT with an expiry and a refresh token is known,
+    the access token is refreshed in a background thread `margin` seconds
+    before it expires. Concurrent calls to `refresh` share a single request to
+    MOTHR, and every client using the manager is given the new token.
+
+    Args:
+        token (str, optional): Access token
+        refresh_token (str, optional): Token used to request new access tokens
+        margin (float, optional): Time, in seconds, before the access token
+            expires to refresh it, default 60
+        background (bool, optional): Refresh ahead of expiry in a background
+            thread, default True
+    """
+
+    def __init__(
+        self,
+        token: Optional[str] = None,
+        refresh_token: Optional[str] = None,
+        margin: float = 60.0,
+        background: bool = True,
+    ):
+        self.token = token
+        self.refresh_token = refresh_token
+        self.margin = margin
+        self.background = background
+        self.refresher: Optional[Callable[[], str]] = None
+        self._listeners: List[Callable[[], Optional[Callable]]] = []
+        self._lock = threading.Lock()
+        self._inflight: Optional[Future] = None
+        self._timer: Optional[threading.Timer] = None
+
+    @property
+    def expires_at(self) -> Optional[float]:
+        """Expiry of the access token as a Unix timestamp, if known"""
+        return token_expiry(self.token)
+
+    @property
+    def can_refresh(self) -> bool:
+        """Whether a refresh token and a client to send it with are available"""
+        return self.refresh_token is not None and self.refresher is not None
+
+    def expiring(self, margin: Optional[float] = None) -> bool:
+        """Whether the access token expires within `margin` seconds
+
+        Args:
+            margin (float, optional): Defaults to the manager's margin
+        """
+        expires_at = self.expires_at
+        if expires_at is None:
+            return False
+        margin = self.margin if margin is None else margin
+        return expires_at - time.time() <= margin
+
+    def subscribe(self, callback: Callable[[Optional[str]], None]):
+        """Call `callback` with every new access token
+
+        Bound methods are held by weak reference, so subscribing a client does
+        not keep it alive.
+        """
+        with self._lock:
+            self._listeners.append(
+                weakref.WeakMethod(callback)  # type: ignore
+                if inspect.ismethod(callback)
+                else (lambda: callback)
+            )
+
+    def bind(self, refresher: Callable[[], str]):
+        """Use `refresher` to request new access tokens, unless one is bound
+
+        Args:
+            refresher (callable): Sends ``Mutation.refresh`` and returns the new
+                access token, which it passes to `set_tokens`
+        """
+        if self.refresher is None:
+            self.refresher = refresher
+            self._schedule()
+
+    def set_tokens(self, token: Optional[str], refresh_token: Optional[str] = None):
+        """Replace the access token, and the refresh token if given
+
+        Every subscribed client is given the new access token.
+        """
+        with self._lock:
+            self.token = token
+            if refresh_token is not None:
+                self.refresh_token = refresh_token
+            listeners = list(self._listeners)
+        for ref in listeners:
+            callback = ref()
+            if callback is not None:
+                callback(token)
+        self._schedule()
+
+    def refresh(self, stale: Optional[str] = None) -> str:
+        """Request a new access token, sharing any refresh already in flight
+
+        Args:
+            stale (str, optional): Access token that was rejected. If the access
+                token has changed since, it is returned without a new request
+
+        Returns:
+            str: The new access token
+
+        Raises:
+            ValueError: If no refresh token or client is available, or the
+                refresh failed
+        """
+        with self._lock:
+            if stale is not None and self.token != stale and self.token is not None:
+                return self.token
+            future = self._inflight
+            owner = future is None
+            if future is None:
+                future = self._inflight = Future()
+        if not owner:
+            return future.result()
+        try:
+            if self.refresher is None or self.refresh_token is None:
+                raise ValueError("No refresh token, have you logged in?")
+            future.set_result(self.refresher())
+        except Exception as e:  # pylint: disable=broad-except
+            future.set_exception(e)
+        finally:
+            with self._lock:
+                self._inflight = None
+        return future.result()
+
+    def close(self):
+        """Stop refreshing in the background"""
+        with self._lock:
+            timer, self._timer = self._timer, None
+        if timer is not None:
+            timer.cancel()
+
+    def _schedule(self):
+        """Start a timer refreshing the access token before it expires"""
+        self.close()
+        expires_at = self.expires_at
+        if not self.background or expires_at is None or not self.can_refresh:
+            return
+        delay = max(0.0, expires_at - self.margin - time.time())
+        timer = threading.Timer(delay, self._refresh_ahead, args=(self.token,))
+        timer.daemon = True
+        with self._lock:
+            self._timer = timer
+        timer.start()
+
+    def _refresh_ahead(self, token: str):
+        try:
+            self.refresh(stale=token)
+        except Exception as e:  # pylint: disable=broad-except
+            log.warning("Background token refresh failed: %r", e)
@@ -0,0 +1,47 @@
+# Copyright 2020 Resilient Solutions Inc. All rights reserved.
+# Use of this source code is governed by a BSD-style
+# license that can be found in the LICENSE file.
+
+from typing import Dict, Iterator, List, Optional, Sequence, TypeVar
+
+from gql.transport.exceptions import TransportQueryError
+
+
+T = TypeVar("T")
+
+# Maximum number of aliased operations packed into a single GraphQL document
+MAX_BATCH_SIZE = 100
+
+
+def chunks(items: Sequence[T], size: int) -> Iterator[Sequence[T]]:
+    """Split a sequence into chunks of at most `size` items
+
+    Raises:
+        ValueError: If size is less than 1
+    """
+    if size < 1:
+        raise ValueError("chunk_size must be at least 1")
+    for start in range(0, len(items), size):
+        yield items[start : start + size]
+
+
+def alias(index: int) -> str:
+    """Alias used for the operation at `index` in a batched document"""
+    return f"job{index}"
+
+
+def aliases(count: int) -> List[str]:
+    """Aliases for every operation in a batched document of `count` operations"""
+    return [alias(i) for i in range(count)]
+
+
+def errors_by_alias(error: TransportQueryError) -> Dict[Optional[str], str]:
+    """Map the errors returned for a batched document to the failing aliases
+
+    Errors that are not associated with a path are stored under the ``None`` key.
+    """
+    errors: Dict[Optional[str], str] = {}
+    for err in error.errors or []:
+        path = err.get("path") or [None]
+        errors.setdefault(path[0], err.get("message", str(err)))
+    return errors
@@ -0,0 +1,359 @@
+# Copyright 2020 Resilient Solutions Inc. All rights reserved.
+# Use of this source code is governed by a BSD-style
+# license that can be found in the LICENSE file.
+
+import copy
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable, Iterable, Optional, Tuple
+
+from .payload import StreamSource
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries expire a fixed time after being set
+
+    Values are copied when they are stored and when they are retrieved, so
+    callers are free to modify them.
+
+    Args:
+        maxsize (int, optional): Maximum number of entries, the least recently
+            used entry is evicted once full. Default 128
+        ttl (float, optional): Time, in seconds, an entry remains valid.
+            Default 300
+        timer (callable, optional): Clock used to expire entries,
+            default `time.monotonic`
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 128,
+        ttl: float = 300.0,
+        timer: Callable[[], float] = time.monotonic,
+    ):
+        if maxsize < 1:
+            raise ValueError("maxsize must be at least 1")
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.timer = timer
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Get an entry, or `default` if it is missing or has expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            expires, value = entry
+            if expires <= self.timer():
+                del self._entries[key]
+                return default
+            self._entries.move_to_end(key)
+        return copy.deepcopy(value)
+
+    def set(self, key: Hashable, value: Any):
+        """Add or replace an entry"""
+        value = copy.deepcopy(value)
+        with self._lock:
+            self._entries[key] = (self.timer() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, predicate: Optional[Callable[[Any], bool]] = None) -> int:
+        """Remove entries
+
+        Args:
+            predicate (callable, optional): Called with each key, entries it
+                returns True for are removed. Every entry is removed by default
+
+        Returns:
+            int: Number of entries removed
+        """
+        with self._lock:
+            keys = [k for k in self._entries if predicate is None or predicate(k)]
+            for key in keys:
+                del self._entries[key]
+        return len(keys)
+
+
+class ResultCache:  # pylint: disable=too-many-instance-attributes
+    """Results of completed jobs stored on disk, keyed by the job request
+
+    Requests are identified by a hash of their service, version, parameters and
+    every other submitted argument, so a rerun of an identical request of a
+    deterministic service can reuse the earlier result instead of running
+    again. Only the results of services listed in `services` are stored, and
+    only for jobs that completed. Requests for the `latest` version keep
+    matching results of earlier versions until they are evicted, pin versions
+    or set `max_age` for services that change.
+
+    Identical requests submitted while an earlier one is still running share
+    its job instead of being submitted again. The shared job is only cancelled
+    by a request giving up on it once no other request waits on it, see `leave`.
+
+    Args:
+        path (str): SQLite database file, created if it does not exist. Use
+            ``:memory:`` for a cache that lasts as long as the process
+        services (list<str>): Services whose results are cached
+        max_entries (int, optional): Maximum number of results kept, the least
+            recently used are evicted first. Default 10000
+        max_bytes (int, optional): Maximum total size of the stored results,
+            in bytes, unbounded by default
+        max_age (float, optional): Time, in seconds, a result remains valid
+            after it is stored, results do not expire by default
+        timer (callable, optional): Clock used to expire results,
+            default `time.time`
+    """
+
+    # pylint: disable=too-many-arguments
+    def __init__(
+        self,
+        path: str,
+        services: Iterable[str],
+        max_entries: int = 10000,
+        max_bytes: Optional[int] = None,
+        max_age: Optional[float] = None,
+        timer: Callable[[], float] = time.time,
+    ):
+        if max_entries < 1:
+            raise ValueError("max_entries must be at least 1")
+        self.path = path
+        self.services = set(services)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.timer = timer
+        self._inflight: Dict[str, Future] = {}
+        self._waiters: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        with self._db:
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, "
+                "service TEXT NOT NULL, result TEXT NOT NULL, size INTEGER NOT NULL, "
+                "created REAL NOT NULL, accessed REAL NOT NULL)"
+            )
+            self._db.execute(
+                "CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed)"
+            )
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def enabled(self, service: Optional[str]) -> bool:
+        """Whether results of a service are cached"""
+        return service in self.services
+
+    @staticmethod
+    def key(req_args: Dict) -> Optional[str]:
+        """Hash identifying a job request's arguments
+
+        A `StreamSource` input stream is identified by a digest of its content.
+
+        Args:
+            req_args (dict): Arguments submitted with the request
+
+        Returns:
+            str: Hex digest of the canonical JSON encoding of the arguments, or
+                None if the request streams a file that can only be read once
+        """
+        args = dict(req_args)
+        args.setdefault("version", "latest")
+        try:
+            canonical = json.dumps(
+                args, sort_keys=True, separators=(",", ":"), default=_key_value
+            ).encode("utf-8")
+        except _Unkeyable:
+            return None
+        return hashlib.sha256(canonical).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict]:
+        """Get a stored result, or None if it is missing or has expired"""
+        now = self.timer()
+        with self._lock, self._db:
+            row = self._db.execute(
+                "SELECT result, created FROM results WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if self.max_age is not None and row[1] <= now - self.max_age:
+                self._db.execute("DELETE FROM results WHERE key = ?", (key,))
+                return None
+            self._db.execute(
+                "UPDATE results SET accessed = ? WHERE key = ?", (now, key)
+            )
+        return json.loads(row[0])
+
+    def set(self, key: str, result: Dict):
+        """Store the result of a completed job, other results are ignored
+
+        Args:
+            key (str): Key of the job request, see `key`
+            result (dict): The job result
+        """
+        self.release(key)
+        if result.get("status") != "complete":
+            return
+        value = json.dumps(result, separators=(",", ":"))
+        now = self.timer()
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?)",
+                (key, result.get("service") or "", value, len(value), now, now),
+            )
+            self._evict(now)
+
+    def coalesce(
+        self,
+        key: str,
+        submit: Callable[[], str],
+        running: Optional[Callable[[str], bool]] = None,
+    ) -> str:
+        """Submit a request, unless an identical request is already running
+
+        Args:
+            key (str): Key of the job request, see `key`
+            submit (callable): Submits the request and returns its job ID
+            running (callable, optional): Called with the ID of a job submitted
+                earlier for the request, returns whether it is still running.
+                A job that has finished without its result being stored, or
+                was cancelled, is forgotten and the request submitted again
+
+        Returns:
+            str: ID of the job running the request
+        """
+        while True:
+            with self._lock:
+                future = self._inflight.get(key)
+                owner = future is None
+                if future is None:
+                    future = self._inflight[key] = Future()
+                submitted = future.done()
+            if owner:
+                try:
+                    future.set_result(submit())
+                except Exception as e:
+                    with self._lock:
+                        del self._inflight[key]
+                    future.set_exception(e)
+            job_id = future.result()
+            # A job that was still being submitted is running
+            if not submitted or running is None or running(job_id):
+                with self._lock:
+                    if self._inflight.get(key) is future:
+                        self._waiters[key] = self._waiters.get(key, 0) + 1
+                return job_id
+            self.release(key, job_id)
+
+    def release(self, key: str, job_id: Optional[str] = None):
+        """Forget the running job of a request once it has finished
+
+        Args:
+            key (str): Key of the job request, see `key`
+            job_id (str, optional): Only forget the job if it has this ID
+        """
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is None or not future.done():
+                return
+            if future.exception() is None and job_id in (None, future.result()):
+                del self._inflight[key]
+                self._waiters.pop(key, None)
+
+    def leave(self, key: str, job_id: str) -> bool:
+        """Stop waiting on the running job of a request
+
+        Args:
+            key (str): Key of the job request, see `key`
+            job_id (str): ID of the job returned by `coalesce`
+
+        Returns:
+            bool: Whether no other request is waiting on the job, in which case
+                it is forgotten
+        """
+        with self._lock:
+            future = self._inflight.get(key)
+            if (
+                future is None
+                or not future.done()
+                or future.exception() is not None
+                or future.result() != job_id
+            ):
+                return True
+            waiters = self._waiters.get(key, 1) - 1
+            if waiters > 0:
+                self._waiters[key] = waiters
+                return False
+            del self._inflight[key]
+            self._waiters.pop(key, None)
+            return True
+
+    def invalidate(self, service: Optional[str] = None) -> int:
+        """Remove stored results
+
+        Args:
+            service (str, optional): Only remove results of this service
+
+        Returns:
+            int: Number of results removed
+        """
+        with self._lock, self._db:
+            if service is None:
+                cursor = self._db.execute("DELETE FROM results")
+            else:
+                cursor = self._db.execute(
+                    "DELETE FROM results WHERE service = ?", (service,)
+                )
+        return cursor.rowcount
+
+    def close(self):
+        """Close the database"""
+        with self._lock:
+            self._db.close()
+
+    def _evict(self, now: float):
+        """Remove expired results, then the least recently used over the limits"""
+        if self.max_age is not None:
+            self._db.execute(
+                "DELETE FROM results WHERE created <= ?", (now - self.max_age,)
+            )
+        self._db.execute(
+            "DELETE FROM results WHERE key IN (SELECT key FROM results "
+            "ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
+        if self.max_bytes is None:
+            return
+        total, evicted = 0, []
+        rows = self._db.execute("SELECT key, size FROM results ORDER BY accessed DESC")
+        for key, size in rows:
+            total += size
+            if total > self.max_bytes:
+                evicted.append((key,))
+        self._db.executemany("DELETE FROM results WHERE key = ?", evicted)
+
+
+class _Unkeyable(Exception):
+    """Raised for request arguments that cannot be hashed"""
+
+
+def _key_value(value: Any) -> str:
+    """JSON encoding of request arguments that are not JSON types"""
+    if isinstance(value, StreamSource):
+        digest = value.digest()
+        if digest is None:
+            raise _Unkeyable()
+        return f"StreamSource:sha256:{digest}"
+    return str(value)
@@ -0,0 +1,291 @@
+# Copyright 2020 Resilient Solutions Inc. All rights reserved.
+# Use of this source code is governed by a BSD-style
+# license that can be found in the LICENSE file.
+
+import argparse
+import json
+import os
+import sys
+import time
+from contextlib import ExitStack, nullcontext
+from typing import (
+    IO,
+    Any,
+    ContextManager,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    TextIO,
+)
+
+from .client import MothrClient
+from .journal import SubmissionJournal
+from .parallel import JobPool
+from .request import JobRequest
+
+
+class Progress:  # pylint: disable=too-many-instance-attributes
+    """Counts of submitted and finished jobs, reported periodically to a stream
+
+    Args:
+        stream (file): Where to write progress lines
+        interval (float): Time, in seconds, between progress lines, nothing is
+            reported before the summary if 0
+    """
+
+    def __init__(self, stream: TextIO, interval: float):
+        self.stream = stream
+        self.interval = interval
+        self.submitted = 0
+        self.skipped = 0
+        self.complete = 0
+        self.failed = 0
+        self.start = time.monotonic()
+        self._reported = self.start
+
+    @property
+    def finished(self) -> int:
+        """Jobs that have finished, whether they completed or not"""
+        return self.complete + self.failed
+
+    def add(self, status: str):
+        """Count a finished job and report progress if it is due"""
+        if status == "complete":
+            self.complete += 1
+        else:
+            self.failed += 1
+        now = time.monotonic()
+        if 0 < self.interval <= now - self._reported:
+            self._reported = now
+            self.report()
+
+    def report(self, final: bool = False):
+        """Write a progress line"""
+        elapsed = time.monotonic() - self.start
+        rate = self.finished / elapsed if elapsed > 0 else 0.0
+        prefix = "done" if final else "running"
+        print(
+            f"{prefix}: {self.submitted} submitted, {self.complete} complete, "
+            f"{self.failed} failed, {self.skipped} skipped, {rate:.1f} jobs/s, "
+            f"{elapsed:.1f}s",
+            file=self.stream,
+            flush=True,
+        )
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(
+        prog="mothrpy", description="Command line client for MOTHR"
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+    command = commands.add_parser(
+        "run",
+        help="Run the jobs in a JSON lines file",
+        description=(
+            "Run one job per line of a JSON lines file. Each line holds the "
+            "keyword arguments of a JobRequest (service, version, parameters, "
+            "inputs, outputs, ...) and an optional id. One result is written per "
+            "line as jobs finish, with the id, or the line number if there is none."
+        ),
+    )
+    command.add_argument(
+        "--in", dest="input", default="-", help="Job file, default standard input"
+    )
+    command.add_argument(
+        "--out", dest="output", default="-", help="Result file, default standard output"
+    )
+    command.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=64,
+        help="Maximum number of jobs in flight, default 64",
+    )
+    command.add_argument("--service", help="Service of jobs that do not name one")
+    command.add_argument(
+        "--mode",
+        choices=("track", "subscribe"),
+        default="track",
+        help="Wait for jobs by polling or with subscriptions, default track",
+    )
+    command.add_argument(
+        "--resume",
+        action="store_true",
+        help="Skip jobs whose results are already in the result file, and append",
+    )
+    command.add_argument(
+        "--journal",
+        help="Record submitted jobs in this file, so a resumed run reattaches to "
+        "jobs that were still running",
+    )
+    command.add_argument("--timeout", type=float, help="Seconds to run every job")
+    command.add_argument("--job-timeout", type=float, help="Seconds to run each job")
+    command.add_argument(
+        "--fail-fast", action="store_true", help="Stop once a job fails"
+    )
+    command.add_argument(
+        "--progress",
+        type=float,
+        default=10.0,
+        help="Seconds between progress reports on standard error, 0 to disable, "
+        "default 10",
+    )
+    command.add_argument("--url", help="MOTHR endpoint, default MOTHR_ENDPOINT")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Entry point of the ``mothrpy`` command
+
+    Returns:
+        int: Exit status, 1 if any job did not complete
+    """
+    args = parse_args(argv)
+    if args.jobs < 1:
+        print("mothrpy: error: --jobs must be at least 1", file=sys.stderr)
+        return 2
+    return run(args)
+
+
+def run(args: argparse.Namespace) -> int:
+    """Run the jobs of the `run` command
+
+    Returns:
+        int: Exit status
+    """
+    done = _finished(args.output) if args.resume else set()
+    kwargs: Dict[str, Any] = {}
+    if args.url is not None:
+        kwargs["url"] = args.url
+    journal = None if args.journal is None else SubmissionJournal(args.journal)
+    client = MothrClient(journal=journal, **kwargs)
+    if journal is not None and args.resume:
+        journal.resume(client)
+    progress = Progress(sys.stderr, args.progress)
+    pool = JobPool(
+        client,
+        max_in_flight=args.jobs,
+        return_failed=True,
+        mode=args.mode,
+        timeout=args.timeout,
+        job_timeout=args.job_timeout,
+        fail_fast=args.fail_fast,
+    )
+    ids: Dict[int, Any] = {}
+    with ExitStack() as stack:
+        if journal is not None:
+            stack.callback(journal.close)
+        stack.callback(client.close)
+        stack.callback(progress.report, final=True)
+        source = sys.stdin
+        if args.input != "-":
+            source = stack.enter_context(open(args.input, encoding="utf-8"))
+        sink = stack.enter_context(_open_output(args.output, append=args.resume))
+        requests = _requests(client, source, sink, args.service, done, ids, progress)
+        try:
+            for index, result in pool.run(requests):
+                _write(sink, {"id": ids.pop(index), **result})
+                progress.add(result["status"])
+        except Exception as e:  # pylint: disable=broad-except
+            # A timeout or an error reaching MOTHR, the pool cancelled its jobs.
+            # Report progress first so the error is the last line
+            stack.close()
+            print(f"mothrpy: {e}", file=sys.stderr)
+            return 1
+    return 0 if progress.failed == 0 else 1
+
+
+def _requests(  # pylint: disable=too-many-arguments
+    client: MothrClient,
+    source: IO[str],
+    sink: IO[str],
+    service: Optional[str],
+    done: Set[Any],
+    ids: Dict[int, Any],
+    progress: Progress,
+) -> Iterator[JobRequest]:
+    """Read job specs line by line, skipping finished jobs
+
+    Invalid specs are written to `sink` as failed results. The id of each
+    request is stored in `ids` by its position among the yielded requests.
+    """
+    position = 0
+    for line_number, line in enumerate(source, start=1):
+        if not line.strip():
+            continue
+        try:
+            spec = json.loads(line)
+            if not isinstance(spec, dict):
+                raise ValueError("expected a JSON object")
+        except ValueError as e:
+            _write(sink, _invalid(line_number, f"Invalid job spec: {e}"))
+            progress.add("failed")
+            continue
+        job_id = spec.pop("id", line_number)
+        if job_id in done:
+            progress.skipped += 1
+            continue
+        if service is not None:
+            spec.setdefault("service", service)
+        if "service" not in spec:
+            _write(sink, _invalid(job_id, "Invalid job spec: no service"))
+            progress.add("failed")
+            continue
+        ids[position] = job_id
+        position += 1
+        progress.submitted += 1
+        yield JobRequest(client=client, **spec)
+
+
+def _invalid(job_id: Any, error: str) -> Dict:
+    return {"id": job_id, "jobId": None, "status": "failed", "error": error}
+
+
+def _write(sink: IO[str], record: Dict):
+    sink.write(json.dumps(record) + "\n")
+    sink.flush()
+
+
+def _finished(path: str) -> Set[Any]:
+    """IDs of the results in an existing result file"""
+    if path == "-" or not os.path.exists(path):
+        return set()
+    done = set()
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                done.add(json.loads(line)["id"])
+            except (ValueError, KeyError, TypeError):
+                # A line cut short when the previous run stopped
+                continue
+    return done
+
+
+def _open_output(path: str, append: bool) -> ContextManager[IO[str]]:
+    """Open the result file, dropping a partial last line when appending"""
+    if path == "-":
+        return nullcontext(sys.stdout)
+    if append and os.path.exists(path):
+        with open(path, "rb+") as f:
+            f.truncate(_last_line_end(f))
+    return open(path, "a" if append else "w", encoding="utf-8")
+
+
+def _last_line_end(f: IO[bytes], block_size: int = 1 << 16) -> int:
+    """Offset after the last newline of a file, read backwards a block at a time"""
+    end = f.seek(0, os.SEEK_END)
+    position = end
+    while position > 0:
+        start = max(position - block_size, 0)
+        f.seek(start)
+        block = f.read(position - start)
+        if position == end and block.endswith(b"\n"):
+            return end
+        newline = block.rfind(b"\n")
+        if newline >= 0:
+            return start + newline + 1
+        position = start
+    return 0
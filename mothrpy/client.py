@@ -2,21 +2,60 @@
 # Use of this source code is governed by a BSD-style
 # license that can be found in the LICENSE file.
 
+from __future__ import annotations
 import os
-from typing import Dict, List, Optional, Tuple
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    Hashable,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    Union,
+)
 from urllib.parse import urlsplit, urlunsplit
 
 from gql import Client
-from gql.dsl import DSLField, DSLSchema, DSLType
-from gql.transport.requests import RequestsHTTPTransport
+from gql.dsl import DSLField, DSLSchema, DSLType, query as dsl_query
+from gql.transport.exceptions import TransportQueryError
 from gql.transport.websockets import WebsocketsTransport
-
-
-with open(
-    os.path.join(os.path.realpath(os.path.dirname(__file__)), "schema.graphql")
-) as f:
-    schema = f.read()
-
+from graphql import GraphQLSchema, build_ast_schema, parse
+
+from .admission import AdmissionController, Ticket
+from .analytics import JOB_FIELDS, JobTable
+from .auth import AuthManager
+from .batch import MAX_BATCH_SIZE, alias, aliases, chunks, errors_by_alias
+from .cache import ResultCache, TTLCache
+from .index import JobStateIndex
+from .journal import SubmissionJournal
+from .metrics import Metrics
+from .parallel import JobPool, request_kwargs
+from .payload import StreamSource, bind_variable, declare_variables, stream_variables
+from .pipeline import Pipeline
+from .polling import PollPolicy
+from .selection import CachedValidationClient, SelectionCache, copy_selection_set
+from .subscriptions import SubscriptionManager
+from .tracker import JobTracker
+from .transport import PooledHTTPTransport
+from .validation import RequestValidator
+
+if TYPE_CHECKING:
+    from .request import JobRequest
+
+
+SCHEMA_PATH = os.path.join(
+    os.path.realpath(os.path.dirname(__file__)), "schema.graphql"
+)
 
 USERNAME_VAR = "MOTHR_USERNAME"
 PASSWORD_VAR = "MOTHR_PASSWORD"
@@ -24,8 +63,25 @@ URL_VAR = "MOTHR_ENDPOINT"
 TOKEN_VAR = "MOTHR_ACCESS_TOKEN"
 
 
-class MothrClient:
-    """Client for connecting to MOTHR
+@lru_cache(maxsize=None)
+def get_schema() -> GraphQLSchema:
+    """Parsed MOTHR schema, built on first use and shared by every client"""
+    with open(SCHEMA_PATH, encoding="utf-8") as f:
+        return build_ast_schema(parse(f.read()))
+
+
+@lru_cache(maxsize=None)
+def get_selections() -> SelectionCache:
+    """Compiled selection sets for the shared MOTHR schema"""
+    return SelectionCache(get_schema())
+
+
+# Document shapes already validated against the shared MOTHR schema
+VALIDATED_SHAPES: Set[Hashable] = set()
+
+
+class BaseMothrClient:  # pylint: disable=too-many-instance-attributes
+    """Connection settings and query construction shared by the MOTHR clients
 
     Args:
         url (str, optional): Endpoint to send the job request,
@@ -39,44 +95,400 @@ class MothrClient:
         password (str, optional): Password for logging in, if not given the library
             will attempt to use the ``MOTHR_PASSWORD`` environment variable. If
             neither are found the request will be made without authentication.
+        auth (AuthManager, optional): Tokens shared with other clients, refreshed
+            once for all of them. Default, a manager used by this client alone
+        service_cache_ttl (float, optional): Cache `service` and `services`
+            results for this many seconds, results are not cached by default
+        service_cache_size (int, optional): Maximum number of cached `service` and
+            `services` results, default 128
+        result_cache (ResultCache, optional): Reuses results of identical job
+            requests of the services it is enabled for, see `JobRequest.submit`
+        journal (SubmissionJournal, optional): Records submitted jobs, so a
+            restarted process reattaches to them instead of submitting them again
+        metrics (Metrics, optional): Records request latency, errors and other
+            client metrics, nothing is recorded by default
+        poll_policy (PollPolicy, optional): Decides the delay between status
+            queries of jobs waited on by polling, e.g. an `AdaptivePolicy`.
+            Default, poll at the requested `poll_frequency`
     """
 
+    ds: DSLSchema
+
     def __init__(self, **kwargs):
         schemes = {"http": "ws", "https": "wss"}
         self.headers: Dict[str, str] = {}
         endpoint = os.getenv(URL_VAR, "http://localhost:8080/api")
-        url = kwargs.pop("url", endpoint)
-        split_url = urlsplit(url)
-        ws_url = urlunsplit(split_url._replace(scheme=schemes[split_url.scheme]))
-
-        transport = RequestsHTTPTransport(url=url, headers=self.headers)
-        client = Client(transport=transport, schema=schema)
-        self.ds = DSLSchema(client)
-
-        ws_transport = WebsocketsTransport(url=ws_url)
-        self.ws_client = Client(transport=ws_transport, schema=schema)
+        self.url = kwargs.pop("url", endpoint)
+        split_url = urlsplit(self.url)
+        self.ws_url = urlunsplit(split_url._replace(scheme=schemes[split_url.scheme]))
 
         self.token = kwargs.pop("token", os.getenv(TOKEN_VAR))
-        username = kwargs.pop("username", os.getenv(USERNAME_VAR))
-        password = kwargs.pop("password", os.getenv(PASSWORD_VAR))
+        self.access: Optional[str] = None
+        self.refresh: Optional[str] = None
+        self._owns_auth = "auth" not in kwargs
+        self.auth: AuthManager = kwargs.pop("auth", None) or AuthManager(self.token)
+        if self.auth.token is not None:
+            self.token = self.auth.token
+        self.auth.subscribe(self._set_token)
+        self._username = kwargs.pop("username", os.getenv(USERNAME_VAR))
+        self._password = kwargs.pop("password", os.getenv(PASSWORD_VAR))
+        self._selections: Optional[SelectionCache] = None
+        self.metrics: Optional[Metrics] = kwargs.pop("metrics", None)
+        self.poll_policy: Optional[PollPolicy] = kwargs.pop("poll_policy", None)
+        self.result_cache: Optional[ResultCache] = kwargs.pop("result_cache", None)
+        self.journal: Optional[SubmissionJournal] = kwargs.pop("journal", None)
+        cache_ttl = kwargs.pop("service_cache_ttl", None)
+        cache_size = kwargs.pop("service_cache_size", 128)
+        self.service_cache: Optional[TTLCache] = (
+            TTLCache(maxsize=cache_size, ttl=cache_ttl)
+            if cache_ttl is not None
+            else None
+        )
         if self.token is not None:
-            self.headers = {"Authorization": f"Bearer {self.token}"}
-        elif all((username, password)):
-            self.login(username, password)
-
-        # Mapping for nested fields
-        self.field_map = {
-            "Job": {
-                "outputMetadata": self.ds.Metadata,
-                "parameters": self.ds.Parameter,
-                "user": self.ds.User,
-                "worker": self.ds.Worker,
-            },
-            "Service": {
-                "parameters": self.ds.ServiceParameter,
-                "fileType": self.ds.FileType,
-            },
+            self.headers["Authorization"] = f"Bearer {self.token}"
+
+    @property
+    def selections(self) -> SelectionCache:
+        """Compiled selection sets for the schema used by this client"""
+        if self._selections is None:
+            schema = self.ds.schema
+            if schema is get_schema():
+                self._selections = get_selections()
+            else:
+                self._selections = SelectionCache(schema)
+        return self._selections
+
+    def _set_authorization(self, token: Optional[str]):
+        """Swap in request headers carrying a new access token
+
+        The headers are replaced rather than modified in place, so requests sent
+        from other threads see either the old or the new token.
+        """
+        headers = {k: v for k, v in self.headers.items() if k != "Authorization"}
+        if token is not None:
+            headers["Authorization"] = f"Bearer {token}"
+        self.headers = headers
+
+    def _set_token(self, token: Optional[str]):
+        """Use a new access token from the `AuthManager`"""
+        self.token = token
+        self._set_authorization(token)
+
+    def _login_query(
+        self, username: Optional[str] = None, password: Optional[str] = None
+    ) -> DSLField:
+        username = username if username is not None else os.getenv("MOTHR_USERNAME")
+        password = password if password is not None else os.getenv("MOTHR_PASSWORD")
+        if username is None:
+            raise ValueError("Username not provided")
+        if password is None:
+            raise ValueError("Password not provided")
+
+        credentials = {"username": username, "password": password}
+        return self.ds.Mutation.login.args(**credentials).select(
+            self.ds.LoginResponse.token, self.ds.LoginResponse.refresh
+        )
+
+    def _set_login_tokens(self, resp: Dict) -> Tuple[str, str]:
+        tokens = resp["login"]
+        if tokens is None:
+            raise ValueError("Login failed")
+        access, refresh = tokens["token"], tokens["refresh"]
+        self.access, self.refresh = access, refresh
+        self.auth.set_tokens(access, refresh)
+        return access, refresh
+
+    def _refresh_query(self) -> DSLField:
+        return self.ds.Mutation.refresh.args(token=self.auth.refresh_token).select(
+            self.ds.RefreshResponse.token
+        )
+
+    def _set_refreshed_token(self, resp: Dict) -> str:
+        if resp["refresh"] is None:
+            raise ValueError("Token refresh failed")
+        token = resp["refresh"]["token"]
+        self.auth.set_tokens(token)
+        return token
+
+    def _submit_query(
+        self, request: JobRequest, variable: Optional[str] = None
+    ) -> DSLField:
+        """Build the ``submitJob`` field of a request
+
+        An input stream read from a `StreamSource` is bound to the `variable`
+        given, or read in full and embedded in the field if there is none.
+        """
+        args = request.request_args()
+        stream = args.get("inputStream")
+        if isinstance(stream, StreamSource):
+            if variable is None:
+                args["inputStream"] = stream.read()
+            else:
+                del args["inputStream"]
+        q = self.ds.Mutation.submit_job.args(request=args)
+        if isinstance(stream, StreamSource) and variable is not None:
+            bind_variable(q, "inputStream", variable)
+        return self.select(q, "JobRequestResponse", ["job.jobId", "job.status"])
+
+    def _claim(self, request: JobRequest) -> Optional[str]:
+        """Reattach a request to its job recorded in the journal, if any"""
+        if self.journal is None:
+            return None
+        key = self.journal.key(request.req_args)
+        entry = None if key is None else self.journal.claim(key)
+        if entry is None:
+            return None
+        request.job_id, request.status = entry
+        return request.job_id
+
+    def _record(self, request: JobRequest):
+        """Record a submitted request's job in the journal"""
+        if self.journal is None or request.job_id is None:
+            return
+        key = self.journal.key(request.req_args)
+        if key is not None:
+            self.journal.record(key, request.job_id, request.req_args.get("service"))
+
+    def _cancel_query(self, job_id: str) -> DSLField:
+        q = self.ds.Mutation.cancel_job.args(jobId=job_id)
+        return self.select(q, "Job", ["jobId", "status"])
+
+    def _job_query(self, job_id: str, fields: List[str]) -> DSLField:
+        return self.select(self.ds.Query.job.args(jobId=job_id), "Job", fields)
+
+    def _service_query(
+        self, name: str, version: Optional[str], fields: Optional[List[str]]
+    ) -> DSLField:
+        fields = fields if fields is not None else ["name", "version"]
+        q = self.ds.Query.service.args(name=name, version=version)
+        return self.select(q, "Service", fields)
+
+    def _jobs_query(
+        self, status: Optional[str], service: Optional[str], fields: List[str]
+    ) -> DSLField:
+        args = {
+            k: v for k, v in (("status", status), ("service", service)) if v is not None
+        }
+        return self.select(self.ds.Query.jobs.args(**args), "Job", fields)
+
+    def _services_query(self, fields: Optional[List[str]]) -> DSLField:
+        fields = fields if fields is not None else ["name", "version"]
+        return self.select(self.ds.Query.services, "Service", fields)
+
+    @staticmethod
+    def _service_key(
+        name: str, version: Optional[str], fields: Optional[List[str]]
+    ) -> Tuple:
+        return ("service", name, version, tuple(fields) if fields else None)
+
+    @staticmethod
+    def _services_key(fields: Optional[List[str]]) -> Tuple:
+        return ("services", tuple(fields) if fields else None)
+
+    def _cached_services(self, key: Tuple) -> Optional[List[Dict]]:
+        if self.service_cache is None:
+            return None
+        return self.service_cache.get(key)
+
+    def _cache_services(self, key: Tuple, services: List[Dict]) -> List[Dict]:
+        if self.service_cache is not None and services is not None:
+            self.service_cache.set(key, services)
+        return services
+
+    def invalidate_services(self, name: Optional[str] = None) -> int:
+        """Drop cached `service` and `services` results
+
+        Args:
+            name (str, optional): Only drop results that may include this service,
+                every result is dropped by default
+
+        Returns:
+            int: Number of cached results dropped
+        """
+        if self.service_cache is None:
+            return 0
+        return self.service_cache.invalidate(
+            lambda key: name is None or key[0] == "services" or key[1] == name
+        )
+
+    def resolve_field(self, obj: DSLType, field: str) -> DSLField:
+        """Resolve paths to nested fields
+
+        Args:
+            obj (`gql.dsl.DSLType`): Root type belonging to the field
+            field (str): Field to resolve, nested fields are specified using
+                dot notation
+
+        Returns: `gql.dsl.DSLField`
+        """
+        if self.metrics is not None:
+            start = time.perf_counter()
+        name, _, nested = field.partition(".")
+        dsl_field = getattr(obj, name)
+        if nested:
+            field_type = self.selections.field_type(obj._type.name, name)
+            dsl_field.ast_field.selection_set = copy_selection_set(
+                self.selections.selection_set(field_type, [nested])
+            )
+        if self.metrics is not None:
+            self.metrics.observe("resolve_field_seconds", time.perf_counter() - start)
+        return dsl_field
+
+    def select(self, field: DSLField, type_name: str, fields: List[str]) -> DSLField:
+        """Select fields of a type using the compiled selection cache
+
+        Args:
+            field (`gql.dsl.DSLField`): Field to select subfields from
+            type_name (str): Name of the type returned by `field`
+            fields (list<str>): Fields to select, nested fields are specified
+                using dot notation
+
+        Returns: `gql.dsl.DSLField`
+        """
+        field.ast_field.selection_set = copy_selection_set(
+            self.selections.selection_set(type_name, fields)
+        )
+        return field
+
+
+class MothrClient(BaseMothrClient):  # pylint: disable=too-many-instance-attributes
+    """Client for connecting to MOTHR
+
+    A client can be shared by many threads, requests are sent over a pool of
+    keep-alive connections and authentication updates are atomic.
+
+    Args:
+        url (str, optional): Endpoint to send the job request,
+            checks for ``MOTHR_ENDPOINT`` in environment variables otherwise
+            defaults to ``http://localhost:8080/query``
+        token (str, optional): Access token to use for authentication, the library
+            also looks for ``MOTHR_ACCESS_TOKEN`` in the environment as a fallback
+        username (str, optional): Username for logging in, if not given the library
+            will attempt to use ``MOTHR_USERNAME`` environment variable. If neither
+            are found the request will be made without authentication.
+        password (str, optional): Password for logging in, if not given the library
+            will attempt to use the ``MOTHR_PASSWORD`` environment variable. If
+            neither are found the request will be made without authentication.
+        auth (AuthManager, optional): Tokens shared with other clients, refreshed
+            once for all of them. Default, a manager used by this client alone
+        service_cache_ttl (float, optional): Cache `service` and `services`
+            results for this many seconds, results are not cached by default
+        service_cache_size (int, optional): Maximum number of cached `service` and
+            `services` results, default 128
+        result_cache (ResultCache, optional): Reuses results of identical job
+            requests of the services it is enabled for, see `JobRequest.submit`
+        journal (SubmissionJournal, optional): Records submitted jobs, so a
+            restarted process reattaches to them instead of submitting them again
+        metrics (Metrics, optional): Records request latency, errors and other
+            client metrics, nothing is recorded by default
+        poll_policy (PollPolicy, optional): Decides the delay between status
+            queries of jobs waited on by polling, e.g. an `AdaptivePolicy`.
+            Default, poll at the requested `poll_frequency`
+        pool_connections (int, optional): Number of per-host connection pools to
+            keep, default 10
+        pool_maxsize (int, optional): Maximum number of keep-alive connections to
+            MOTHR, bounds the number of requests sent in parallel without opening
+            extra connections, default 10
+        pool_block (bool, optional): Wait for a free pooled connection instead of
+            opening a temporary one when all connections are in use, default False
+        timeout (int, optional): Timeout, in seconds, for HTTP requests
+        admission (AdmissionController, optional): Limits the rate and
+            concurrency of job submissions per service and queue, submissions
+            beyond the limits wait. Default, submissions are not limited
+        validator (RequestValidator, optional): Checks job requests against
+            their service definitions and rejects invalid requests before they
+            are submitted. Default, requests are not checked
+        compress (bool, optional): gzip request bodies, default False
+        stream_responses (bool, optional): Decode responses larger than 1 MiB
+            as they are read, so a large `result` is not held several times
+            over. Default False
+    """
+
+    def __init__(self, **kwargs):
+        pool_args = {
+            key: kwargs.pop(key)
+            for key in (
+                "pool_connections",
+                "pool_maxsize",
+                "pool_block",
+                "timeout",
+                "compress",
+                "stream_responses",
+            )
+            if key in kwargs
         }
+        self.admission: Optional[AdmissionController] = kwargs.pop("admission", None)
+        self.validator: Optional[RequestValidator] = kwargs.pop("validator", None)
+        super().__init__(**kwargs)
+        self.transport = PooledHTTPTransport(
+            url=self.url,
+            headers=self.headers,
+            metrics=self.metrics,
+            auth_manager=self.auth,
+            **pool_args,
+        )
+        client = CachedValidationClient(
+            transport=self.transport, schema=get_schema(), validated=VALIDATED_SHAPES
+        )
+        self.ds = DSLSchema(client)
+        self._ws_client: Optional[Client] = None
+        self._tracker: Optional[JobTracker] = None
+        self._subscriptions: Optional[SubscriptionManager] = None
+        self._job_index: Optional[JobStateIndex] = None
+        self.auth.bind(self._request_token)
+
+        if self.token is None and all((self._username, self._password)):
+            self.login(self._username, self._password)
+
+    def _set_authorization(self, token: Optional[str]):
+        super()._set_authorization(token)
+        self.transport.headers = self.headers
+
+    def close(self):
+        """Stop background polling and subscriptions and close pooled connections
+
+        Buffered journal records are written, the journal is left open.
+        """
+        if self._tracker is not None:
+            self._tracker.close()
+        if self._job_index is not None:
+            self._job_index.close()
+        if self._subscriptions is not None:
+            self._subscriptions.close()
+        if self.journal is not None:
+            self.journal.flush()
+        if self._owns_auth:
+            self.auth.close()
+        self.transport.shutdown()
+
+    @property
+    def ws_client(self) -> Client:
+        """Websocket client used for subscriptions, created on first use"""
+        if self._ws_client is None:
+            transport = WebsocketsTransport(url=self.ws_url)
+            self._ws_client = Client(transport=transport, schema=get_schema())
+        return self._ws_client
+
+    @property
+    def tracker(self) -> JobTracker:
+        """`JobTracker` shared by every job waiting on this client"""
+        if self._tracker is None:
+            self._tracker = JobTracker(self, policy=self.poll_policy)
+        return self._tracker
+
+    @property
+    def subscriptions(self) -> SubscriptionManager:
+        """`SubscriptionManager` multiplexing job subscriptions over one websocket"""
+        if self._subscriptions is None:
+            self._subscriptions = SubscriptionManager(self)
+        return self._subscriptions
+
+    @property
+    def job_index(self) -> JobStateIndex:
+        """`JobStateIndex` following the status of every job, started on first use"""
+        if self._job_index is None:
+            self._job_index = JobStateIndex(self).start()
+        return self._job_index
 
     def login(
         self, username: Optional[str] = None, password: Optional[str] = None
@@ -98,42 +510,420 @@ class MothrClient:
             ValueError: If a username or password are not provided and are not found
                 in the current environment
         """
-        username = username if username is not None else os.getenv("MOTHR_USERNAME")
-        password = password if password is not None else os.getenv("MOTHR_PASSWORD")
-        if username is None:
-            raise ValueError("Username not provided")
-        if password is None:
-            raise ValueError("Password not provided")
-
-        credentials = {"username": username, "password": password}
-        q = self.ds.Mutation.login.args(**credentials).select(
-            self.ds.LoginResponse.token, self.ds.LoginResponse.refresh
-        )
-        resp = self.ds.mutate(q)
-        tokens = resp["login"]
-        if tokens is None:
-            raise ValueError("Login failed")
-        self.access = tokens["token"]
-        self.refresh = tokens["refresh"]
-        self.headers["Authorization"] = f"Bearer {self.token}"
-        return self.access, self.refresh
+        resp = self.ds.mutate(self._login_query(username, password))
+        return self._set_login_tokens(resp)
 
     def refresh_token(self) -> str:
         """Refresh an expired access token
 
+        Concurrent calls, from this or any client sharing its `AuthManager`,
+        share a single request to MOTHR.
+
         Returns:
             str: New access token
         """
-        q = self.ds.Mutation.refresh.args(token=self.refresh).select(
-            self.ds.RefreshResponse.token
+        return self.auth.refresh()
+
+    def _request_token(self) -> str:
+        resp = self.ds.mutate(self._refresh_query())
+        return self._set_refreshed_token(resp)
+
+    @contextmanager
+    def admit(self, requests: Iterable[JobRequest]) -> Iterator[Optional[Ticket]]:
+        """Wait for the `AdmissionController` to admit a submit request
+
+        Args:
+            requests (list<JobRequest>): Job requests sent in the submit request
+
+        Yields:
+            Ticket: Admission of the request, None without an admission controller
+        """
+        if self.admission is None:
+            yield None
+            return
+        jobs = [(r.req_args.get("service"), r.req_args.get("queue")) for r in requests]
+        with self.admission.admit(jobs) as ticket:  # type: ignore
+            if self.metrics is not None:
+                self.metrics.observe("admission_wait_seconds", ticket.waited)
+            yield ticket
+
+    def validate(self, requests: Sequence[JobRequest]) -> List[Optional[ValueError]]:
+        """Check job requests with the client's `RequestValidator`
+
+        Invalid requests are rejected the same way by `JobRequest.submit` and
+        `submit_many`, use this to check a batch before submitting any of it.
+
+        Args:
+            requests (list<JobRequest>): Job requests to check
+
+        Returns:
+            list<ValueError|None>: None for each valid request, or a ValueError
+                describing why the request is invalid. Every request is valid
+                without a validator
+        """
+        if self.validator is None:
+            return [None] * len(requests)
+        return self.validator.validate(self, requests)
+
+    def submit_many(
+        self, requests: Iterable[JobRequest], chunk_size: int = MAX_BATCH_SIZE
+    ) -> List[Union[str, ValueError]]:
+        """Submit multiple job requests with a single round trip per chunk
+
+        Each chunk of requests is sent as one mutation containing an aliased
+        ``submitJob`` operation per request. The ``job_id`` and ``status`` of each
+        successfully submitted request are updated in place.
+
+        Requests with a result stored in the client's `ResultCache` are not
+        submitted and get the job ID of the stored result. Unlike
+        `JobRequest.submit`, identical requests still running are not shared,
+        each is submitted.
+
+        Args:
+            requests (list<JobRequest>): Job requests to submit
+            chunk_size (int, optional): Maximum number of requests sent in a single
+                mutation, default 100
+
+        Returns:
+            list<str|ValueError>: The job ID of each request in the order given, or
+                a ValueError describing why the request could not be submitted
+
+        Raises:
+            ValueError: If chunk_size is less than 1
+        """
+        job_ids: List[Union[str, ValueError]] = []
+        for chunk in chunks(list(requests), chunk_size):
+            job_ids.extend(self._submit_chunk(chunk))
+        return job_ids
+
+    def _submit_chunk(
+        self, requests: Sequence[JobRequest]
+    ) -> List[Union[str, ValueError]]:
+        """Submit a chunk of job requests in a single mutation"""
+        results: Dict[str, Union[str, ValueError]] = {}
+        streams: Dict[str, StreamSource] = {}
+        fields = self._submit_fields(requests, results, streams)
+        resp: Dict = {}
+        errors: Dict[Optional[str], str] = {}
+        if fields:
+            submitted = [
+                r
+                for key, r in zip(aliases(len(requests)), requests)
+                if key not in results
+            ]
+            with self.admit(submitted) as ticket:
+                try:
+                    resp = self._mutate(fields, streams)
+                except TransportQueryError as e:
+                    # Errors are reported per alias, keep the jobs that succeeded
+                    resp = e.data or {}
+                    errors = errors_by_alias(e)
+                    if ticket is not None:
+                        ticket.error = True
+
+        for key, request in zip(aliases(len(requests)), requests):
+            if key in results:
+                continue
+            job = (resp.get(key) or {}).get("job")
+            if job is None:
+                error = errors.get(key, errors.get(None, "no job returned"))
+                results[key] = ValueError(f"Error submitting job request: {error}")
+                continue
+            request.job_id = job["jobId"]
+            request.status = job["status"]
+            results[key] = job["jobId"]
+            self._record(request)
+        return [results[key] for key in aliases(len(requests))]
+
+    def _submit_fields(
+        self,
+        requests: Sequence[JobRequest],
+        results: Dict[str, Union[str, ValueError]],
+        streams: Dict[str, StreamSource],
+    ) -> List[DSLField]:
+        """Build the aliased ``submitJob`` fields of a chunk
+
+        Requests with a result stored in the `ResultCache`, requests reattached
+        to a journaled job and invalid requests get their job ID or error in
+        `results` instead of a field. Input streams read from a `StreamSource`
+        are added to `streams` by variable name.
+        """
+        fields = []
+        unclaimed = []
+        for i, request in enumerate(requests):
+            cached = request._lookup()
+            if cached is not None:
+                results[alias(i)] = cached["jobId"]
+                continue
+            resumed = self._claim(request)
+            if resumed is not None:
+                results[alias(i)] = resumed
+            else:
+                unclaimed.append((i, request))
+        invalid = self.validate([request for _, request in unclaimed])
+        for (i, request), error in zip(unclaimed, invalid):
+            if error is not None:
+                results[alias(i)] = ValueError(f"Invalid job request: {error}")
+                continue
+            variable = f"inputStream{i}"
+            try:
+                fields.append(self._submit_query(request, variable).alias(alias(i)))
+            except (KeyError, TypeError, ValueError) as e:
+                results[alias(i)] = ValueError(f"Invalid job request: {e}")
+                continue
+            streams.update(stream_variables(request.req_args, variable))
+        return fields
+
+    def _mutate(self, fields: List[DSLField], streams: Dict[str, StreamSource]) -> Dict:
+        """Send a mutation, streaming input streams bound to variables
+
+        Args:
+            fields (list<`gql.dsl.DSLField`>): Fields of the mutation
+            streams (dict): `StreamSource` of each variable used by the fields
+
+        Returns:
+            dict: Response data
+        """
+        if not streams:
+            return self.ds.mutate(*fields)
+        document = dsl_query(*fields, operation="mutation")
+        declare_variables(document, streams)
+        return self.ds.client.execute(document, variable_values=streams)
+
+    def cancel_job(self, job_id: str) -> Dict[str, str]:
+        """Cancel a job
+
+        Args:
+            job_id (str): Job to cancel
+
+        Returns:
+            dict: The job's `jobId` and `status`
+        """
+        return self.ds.mutate(self._cancel_query(job_id))["cancelJob"]
+
+    def cancel_many(
+        self, job_ids: Iterable[str], chunk_size: int = MAX_BATCH_SIZE
+    ) -> List[Union[Dict[str, Any], ValueError]]:
+        """Cancel multiple jobs with a single round trip per chunk
+
+        Each chunk of jobs is cancelled by one mutation containing an aliased
+        ``cancelJob`` operation per job.
+
+        Args:
+            job_ids (list<str>): Jobs to cancel
+            chunk_size (int, optional): Maximum number of jobs cancelled in a
+                single mutation, default 100
+
+        Returns:
+            list<dict|ValueError>: The `jobId` and `status` of each job in the
+                order given, or a ValueError describing why it was not cancelled
+
+        Raises:
+            ValueError: If chunk_size is less than 1
+        """
+        return self._batched(
+            self.ds.mutate, self._cancel_query, job_ids, chunk_size, "cancelling"
         )
-        resp = self.ds.mutate(q)
-        if resp["refresh"] is None:
-            raise ValueError("Token refresh failed")
-        token = resp["refresh"]["token"]
-        self.token = token
-        self.headers["Authorization"] = f"Bearer {self.token}"
-        return token
+
+    def query_jobs(
+        self,
+        job_ids: Iterable[str],
+        fields: List[str],
+        chunk_size: int = MAX_BATCH_SIZE,
+    ) -> List[Union[Dict[str, Any], ValueError]]:
+        """Query multiple jobs with a single round trip per chunk
+
+        Args:
+            job_ids (list<str>): Jobs to query
+            fields (list<str>): Fields to return for each job
+            chunk_size (int, optional): Maximum number of jobs queried in a
+                single request, default 100
+
+        Returns:
+            list<dict|ValueError>: Each job in the order given, or a ValueError
+                describing why it could not be queried, e.g. it does not exist
+
+        Raises:
+            ValueError: If chunk_size is less than 1
+        """
+        return self._batched(
+            self.ds.query,
+            lambda job_id: self._job_query(job_id, fields),
+            job_ids,
+            chunk_size,
+            "querying",
+        )
+
+    def jobs(
+        self,
+        status: Optional[str] = None,
+        service: Optional[str] = None,
+        fields: Optional[List[str]] = None,
+    ) -> JobTable:
+        """Query every job, optionally in a status or of a service
+
+        The jobs are decoded into a columnar `JobTable` instead of a dict per
+        job, see `JobTable.summary` for percentiles and throughput.
+
+        Args:
+            status (str, optional): Only return jobs in this status
+            service (str, optional): Only return jobs of this service
+            fields (list<str>, optional): Scalar fields to return for each job,
+                default `JOB_FIELDS`
+
+        Returns:
+            JobTable: The jobs, one column per field
+        """
+        fields = fields if fields is not None else JOB_FIELDS
+        resp = self.ds.query(self._jobs_query(status, service, fields))
+        return JobTable(resp["jobs"] or [], fields)
+
+    @staticmethod
+    def _batched(
+        execute: Callable[..., Dict],
+        field: Callable[[str], DSLField],
+        job_ids: Iterable[str],
+        chunk_size: int,
+        action: str,
+    ) -> List[Union[Dict[str, Any], ValueError]]:
+        """Send an aliased operation per job, one request per chunk of jobs"""
+        results: List[Union[Dict[str, Any], ValueError]] = []
+        for chunk in chunks(list(job_ids), chunk_size):
+            fields = [field(job_id).alias(alias(i)) for i, job_id in enumerate(chunk)]
+            errors: Dict[Optional[str], str] = {}
+            try:
+                resp = execute(*fields)
+            except TransportQueryError as e:
+                # Errors are reported per alias, keep the jobs that succeeded
+                resp = e.data or {}
+                errors = errors_by_alias(e)
+            for key in aliases(len(chunk)):
+                job = resp.get(key)
+                if job is None:
+                    error = errors.get(key, errors.get(None, "job not found"))
+                    job = ValueError(f"Error {action} job: {error}")
+                results.append(job)
+        return results
+
+    def pipeline(self, return_failed: bool = False, mode: str = "track") -> Pipeline:
+        """Create a `Pipeline` of job requests run with this client
+
+        Args:
+            return_failed (bool, optional): Return failed and skipped stage
+                results instead of raising an exception. Default False
+            mode (str, optional): How to wait for jobs, `track` or `subscribe`.
+                Default `track`
+
+        Returns:
+            Pipeline
+        """
+        return Pipeline(self, return_failed=return_failed, mode=mode)
+
+    # pylint: disable=too-many-arguments
+    def map(
+        self,
+        service: str,
+        params: Iterable[Any],
+        max_in_flight: int = 100,
+        return_failed: bool = False,
+        mode: str = "track",
+        timeout: Optional[float] = None,
+        job_timeout: Optional[float] = None,
+        fail_fast: bool = False,
+        **kwargs,
+    ) -> Iterator[Dict]:
+        """Run a service once per item of `params`, yielding results in input order
+
+        Items are consumed lazily, so `params` may be a generator of any length.
+        Jobs are submitted in batches and waited on together, with at most
+        `max_in_flight` jobs submitted but not yet yielded.
+
+        Args:
+            service (str): Service to run
+            params (iterable<dict|list>): Keyword arguments for `JobRequest`
+                (e.g., `parameters`, `inputs`, `outputs`), or a list of
+                parameters, for each job
+            max_in_flight (int, optional): Maximum number of outstanding jobs,
+                default 100
+            return_failed (bool, optional): Return failed job results instead of
+                raising an exception. Default False
+            mode (str, optional): How to wait for jobs, `track` or `subscribe`.
+                Default `track`
+            timeout (float, optional): Time, in seconds, to run every job before
+                cancelling the outstanding jobs, unlimited by default
+            job_timeout (float, optional): Time, in seconds, after submitting a
+                job before it is cancelled, unlimited by default
+            fail_fast (bool, optional): Cancel outstanding jobs and stop
+                submitting new ones once a job fails. Default False
+            kwargs: Keyword arguments for `JobRequest` shared by every job
+
+        Yields:
+            dict: Result of each job
+
+        Raises:
+            RuntimeError: If a job fails, unless `return_failed` is True
+            TimeoutError: If `timeout` expires before every job finished
+        """
+        results = self._run_many(
+            service,
+            params,
+            kwargs,
+            True,
+            max_in_flight=max_in_flight,
+            return_failed=return_failed,
+            mode=mode,
+            timeout=timeout,
+            job_timeout=job_timeout,
+            fail_fast=fail_fast,
+        )
+        return (result for _, result in results)
+
+    # pylint: disable=too-many-arguments
+    def as_completed(
+        self,
+        service: str,
+        params: Iterable[Any],
+        max_in_flight: int = 100,
+        return_failed: bool = False,
+        mode: str = "track",
+        timeout: Optional[float] = None,
+        job_timeout: Optional[float] = None,
+        fail_fast: bool = False,
+        **kwargs,
+    ) -> Iterator[Tuple[int, Dict]]:
+        """Run a service once per item of `params`, yielding results as jobs finish
+
+        Takes the same arguments as `map`.
+
+        Yields:
+            tuple<int, dict>: Index of the item in `params` and the job result
+
+        Raises:
+            RuntimeError: If a job fails, unless `return_failed` is True
+            TimeoutError: If `timeout` expires before every job finished
+        """
+        return self._run_many(
+            service,
+            params,
+            kwargs,
+            False,
+            max_in_flight=max_in_flight,
+            return_failed=return_failed,
+            mode=mode,
+            timeout=timeout,
+            job_timeout=job_timeout,
+            fail_fast=fail_fast,
+        )
+
+    def _run_many(self, service, params, kwargs, ordered, **options):
+        # Imported here, request.py depends on this module
+        from .request import JobRequest  # pylint: disable=import-outside-toplevel
+
+        requests = (
+            JobRequest(client=self, service=service, **request_kwargs(p, **kwargs))
+            for p in params
+        )
+        return JobPool(self, **options).run(requests, ordered=ordered)
 
     def service(
         self,
@@ -154,11 +944,12 @@ class MothrClient:
         Returns:
             list<dict>: Service records matching the query
         """
-        fields = fields if fields is not None else ["name", "version"]
-        fields = [self.resolve_field(self.ds.Service, field) for field in fields]
-        q = self.ds.Query.service.args(name=name, version=version).select(*fields)
-        resp = self.ds.query(q)
-        return resp["service"]
+        key = self._service_key(name, version, fields)
+        cached = self._cached_services(key)
+        if cached is None:
+            resp = self.ds.query(self._service_query(name, version, fields))
+            cached = self._cache_services(key, resp["service"])
+        return cached
 
     def services(self, fields: Optional[List[str]] = None) -> List[Dict]:
         """Retrieve all services registered with MOTHR
@@ -170,52 +961,31 @@ class MothrClient:
         Returns:
             list<dict>: All services registered with MOTHR
         """
-        fields = fields if fields is not None else ["name", "version"]
-        fields = [self.resolve_field(self.ds.Service, field) for field in fields]
-        q = self.ds.Query.services.select(*fields)
-        resp = self.ds.query(q)
-        return resp["services"]
+        key = self._services_key(fields)
+        cached = self._cached_services(key)
+        if cached is None:
+            resp = self.ds.query(self._services_query(fields))
+            cached = self._cache_services(key, resp["services"])
+        return cached
 
-    def resolve_field(self, obj: DSLType, field: str) -> DSLField:
-        """Resolve paths to nested fields
+    def watch_services(self, event: str) -> Future:
+        """Keep cached service results up to date from MOTHR events
 
-        Args:
-            obj (`gql.dsl.DSLType`): Root type belonging to the field
-            field (str): Field to resolve, nested fields are specified using
-                dot notation
-
-        Returns: `gql.dsl.DSLField`
-        """
-        if "." in field:
-            nested_fields = self.field_map[str(obj._type)]
-            f_split = field.split(".")
-            return self.select_field(
-                nested_fields, getattr(obj, f_split[0]), f_split[1:]
-            )
-        return getattr(obj, field)
-
-    def select_field(
-        self, field_map: Dict, field_obj: DSLField, field: List[str]
-    ) -> DSLField:
-        """Select nested fields
+        Subscribes to ``subscribeEvent`` on the given channel. Each message
+        invalidates the cached results for the service it names, or every cached
+        result when the message is empty.
 
         Args:
-            field_map (dict<str, `gql.dsl.DSLType`>): Dictionary mapping field names
-                to their associated DSLType. See `self.field_map`
-            field_obj (`gql.dsl.DSLField`): Field object to select subfields from
-            field (list<str>): Field name split into individual components
+            event (str): Event channel announcing service changes
 
-        Returns: `gql.dsl.DSLField`
+        Returns:
+            `concurrent.futures.Future`: Cancel to stop watching
+
+        Raises:
+            ValueError: If the service cache is not enabled
         """
-        field_key = str(field_obj)
-        for char in ["{", "}", "\n"]:
-            field_key = field_key.replace(char, "")
-        field_key = field_key.split(" ")[-1]
-        field_name = field.pop(0)
-        if len(field) > 0:
-            return field_obj.select(
-                self.select_field(
-                    field_map, getattr(field_map[field_key], field_name), field
-                )
-            )
-        return field_obj.select(getattr(field_map[field_key], field_name))
+        if self.service_cache is None:
+            raise ValueError("Service cache is not enabled, set service_cache_ttl")
+        return self.subscriptions.listen(
+            event, lambda e: self.invalidate_services(e.get("message") or None)
+        )
@@ -0,0 +1,218 @@
+# Copyright 2020 Resilient Solutions Inc. All rights reserved.
+# Use of this source code is governed by a BSD-style
+# license that can be found in the LICENSE file.
+
+from __future__ import annotations
+import asyncio
+import threading
+from collections import Counter
+from concurrent.futures import Future
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Sequence
+
+from gql.client import AsyncClientSession
+
+from .batch import MAX_BATCH_SIZE
+from .subscriptions import subscribe, subscription_task
+from .tracker import TERMINAL_STATUSES
+
+if TYPE_CHECKING:
+    from .client import MothrClient
+
+
+# Every job status, a job's status is stored as its index in this tuple
+STATUSES = ("submitted", "running", "cancelled", "failed", "complete")
+
+# Statuses of jobs that have not finished
+ACTIVE_STATUSES = ("submitted", "running")
+
+# Order in which statuses are reached, a job never moves to a lower rank
+_RANKS = (0, 1, 2, 2, 2)
+_CODES = {status: code for code, status in enumerate(STATUSES)}
+
+
+class JobStateIndex:  # pylint: disable=too-many-instance-attributes
+    """Status of every job, kept current by the ``subscribeJobs`` event stream
+
+    The index subscribes once over the client's shared websocket and records
+    the status carried by each job event, so looking up a status or listing
+    the jobs in a status never queries MOTHR. Each time the subscription is
+    established, including after the websocket reconnects, every job in
+    `statuses` is fetched with a single ``jobs`` query per status, and indexed
+    jobs that are no longer in those statuses are looked up to learn how they
+    finished.
+
+    Statuses only move forward (``submitted``, ``running``, then a terminal
+    status), so events and query results received out of order never undo a
+    newer status.
+
+    Args:
+        client (MothrClient): Client connection to MOTHR
+        statuses (list<str>, optional): Statuses whose jobs are fetched in full
+            when connecting, default `submitted` and `running`. Include terminal
+            statuses to also index jobs that finished before the index started,
+            at the cost of fetching them on every reconnect
+        chunk_size (int, optional): Maximum number of jobs looked up in a single
+            request when reconnecting, default 100
+    """
+
+    def __init__(
+        self,
+        client: MothrClient,
+        statuses: Sequence[str] = ACTIVE_STATUSES,
+        chunk_size: int = MAX_BATCH_SIZE,
+    ):
+        unknown = set(statuses) - set(STATUSES)
+        if unknown:
+            raise ValueError(f"Unknown job statuses: {', '.join(sorted(unknown))}")
+        self.client = client
+        self.statuses = tuple(statuses)
+        self.chunk_size = chunk_size
+        self.reconciliations = 0
+        self._codes: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._future: Optional[Future] = None
+
+    def __len__(self) -> int:
+        return len(self._codes)
+
+    def __contains__(self, job_id: str) -> bool:
+        return job_id in self._codes
+
+    def start(self) -> JobStateIndex:
+        """Subscribe to job events, if not already subscribed
+
+        Returns:
+            JobStateIndex: self
+        """
+        if self._future is None or self._future.done():
+            self._ready.clear()
+            self._future = self.client.subscriptions._spawn("Job events", self._follow)
+        return self
+
+    def wait_ready(self, timeout: Optional[float] = None) -> bool:
+        """Block until the jobs in `statuses` have been fetched
+
+        Args:
+            timeout (float, optional): Maximum time, in seconds, to wait
+
+        Returns:
+            bool: False if the timeout expired
+        """
+        return self._ready.wait(timeout)
+
+    def status(self, job_id: str) -> Optional[str]:
+        """Last known status of a job
+
+        Returns:
+            str: Job status, or None if the job has not been seen
+        """
+        code = self._codes.get(job_id)
+        return None if code is None else STATUSES[code]
+
+    def jobs(self, status: str) -> List[str]:
+        """IDs of every job last seen in a status"""
+        code = _CODES[status]
+        with self._lock:
+            return [job_id for job_id, c in self._codes.items() if c == code]
+
+    def counts(self) -> Dict[str, int]:
+        """Number of jobs in each status"""
+        with self._lock:
+            counts = Counter(self._codes.values())
+        return {status: counts[code] for code, status in enumerate(STATUSES)}
+
+    def update(self, job_id: str, status: str) -> bool:
+        """Record a job's status, unless a later status is already known
+
+        Args:
+            job_id (str): Job ID
+            status (str): Job status
+
+        Returns:
+            bool: Whether the recorded status changed
+        """
+        code = _CODES.get(status)
+        if code is None:
+            return False
+        with self._lock:
+            previous = self._codes.get(job_id)
+            if previous is not None and _RANKS[code] <= _RANKS[previous]:
+                return False
+            self._codes[job_id] = code
+        return True
+
+    def prune(self, statuses: Iterable[str] = TERMINAL_STATUSES) -> int:
+        """Forget jobs in the given statuses, default every finished job
+
+        Returns:
+            int: Number of jobs removed
+        """
+        codes = {_CODES[status] for status in statuses}
+        with self._lock:
+            job_ids = [job_id for job_id, c in self._codes.items() if c in codes]
+            for job_id in job_ids:
+                del self._codes[job_id]
+        return len(job_ids)
+
+    def close(self):
+        """Stop following job events, the index keeps its last known statuses"""
+        if self._future is not None:
+            self._future.cancel()
+            self._future = None
+
+    async def _follow(self, session: AsyncClientSession) -> Dict:
+        # Start the subscription before fetching the current state, so changes
+        # made while fetching are not missed
+        task = await subscription_task(self._receive(session))
+        try:
+            loop = asyncio.get_event_loop()
+            await loop.run_in_executor(None, self._reconcile)
+            self._ready.set()
+            return await task
+        finally:
+            task.cancel()
+
+    async def _receive(self, session: AsyncClientSession) -> Dict:
+        q = self.client.select(
+            self.client.ds.Subscription.subscribe_jobs, "JobEvent", ["jobId", "type"]
+        )
+        generator = subscribe(session, q)
+        try:
+            async for result in generator:
+                event = result["subscribeJobs"]
+                if event is not None and event["jobId"] is not None:
+                    self.update(event["jobId"], event["type"])
+        finally:
+            await generator.aclose()
+        raise ConnectionError("Subscription to job events closed")
+
+    def _reconcile(self):
+        """Fetch the jobs in `statuses` and look up jobs that left them"""
+        queries = [
+            self.client.select(
+                self.client.ds.Query.jobs.args(status=status), "Job", ["jobId"]
+            ).alias(status)
+            for status in self.statuses
+        ]
+        resp = self.client.ds.query(*queries)
+        listed = set()
+        for status in self.statuses:
+            for job in resp.get(status) or []:
+                self.update(job["jobId"], status)
+                listed.add(job["jobId"])
+        with self._lock:
+            missing = [
+                job_id
+                for job_id, code in self._codes.items()
+                if STATUSES[code] in self.statuses and job_id not in listed
+            ]
+        jobs = self.client.query_jobs(missing, ["status"], self.chunk_size)
+        for job_id, job in zip(missing, jobs):
+            if isinstance(job, ValueError):
+                # The job no longer exists
+                with self._lock:
+                    self._codes.pop(job_id, None)
+            else:
+                self.update(job_id, job["status"])
+        self.reconciliations += 1
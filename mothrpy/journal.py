@@ -0,0 +1,219 @@
+# Copyright 2020 Resilient Solutions Inc. All rights reserved.
+# Use of this source code is governed by a BSD-style
+# license that can be found in the LICENSE file.
+
+from __future__ import annotations
+import sqlite3
+import threading
+import time
+from collections import Counter, deque
+from typing import TYPE_CHECKING, Deque, Dict, List, Optional, Tuple
+
+from .batch import MAX_BATCH_SIZE
+from .cache import ResultCache
+
+if TYPE_CHECKING:
+    from .client import MothrClient
+
+
+# Values of SQLite's `synchronous` setting, from fastest to most durable
+SYNC_MODES = ("off", "normal", "full")
+
+
+class SubmissionJournal:  # pylint: disable=too-many-instance-attributes
+    """Job IDs of submitted requests recorded on disk, to resume after a restart
+
+    Every job submitted by a client with a journal is recorded with a hash of
+    its request arguments (see `ResultCache.key`). When the process is
+    restarted with the same journal, `resume` looks up the status of every
+    recorded job in bulk, and submitting a request identical to a recorded one
+    reattaches to its job instead of submitting it again. Identical requests
+    submitted several times are matched to their jobs in the order they were
+    first submitted.
+
+    Records are buffered and written in a single transaction once `batch_size`
+    records are waiting or `flush_interval` seconds after the first, so
+    journaling does not slow down submission. Jobs submitted in the interval
+    before a crash are not recorded and will be submitted again. `sync` sets how
+    often SQLite waits for writes to reach the disk: `off` leaves it to the
+    operating system, `normal` syncs at checkpoints and `full` on every
+    transaction.
+
+    Args:
+        path (str): SQLite database file, created if it does not exist
+        sync (str, optional): One of (`off`, `normal`, `full`), default `normal`
+        flush_interval (float, optional): Maximum time, in seconds, a record is
+            buffered, default 1. With 0 every record is written immediately
+        batch_size (int, optional): Number of buffered records that triggers a
+            write, default 1000
+    """
+
+    def __init__(
+        self,
+        path: str,
+        sync: str = "normal",
+        flush_interval: float = 1.0,
+        batch_size: int = 1000,
+    ):
+        if sync not in SYNC_MODES:
+            raise ValueError(f"Unknown sync mode: {sync}")
+        if batch_size < 1:
+            raise ValueError("batch_size must be at least 1")
+        self.path = path
+        self.sync = sync
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._jobs: Dict[str, Deque[str]] = {}
+        self._statuses: Dict[str, str] = {}
+        self._buffer: List[Tuple[str, str, Optional[str], float]] = []
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self._timer: Optional[threading.Timer] = None
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(f"PRAGMA synchronous={sync.upper()}")
+        with self._db:
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS submissions (id INTEGER PRIMARY KEY, "
+                "key TEXT NOT NULL, job_id TEXT NOT NULL, service TEXT, "
+                "submitted REAL NOT NULL)"
+            )
+        for key, job_id in self._db.execute(
+            "SELECT key, job_id FROM submissions ORDER BY id"
+        ):
+            self._jobs.setdefault(key, deque()).append(job_id)
+
+    def __len__(self) -> int:
+        """Number of recorded jobs not yet reattached to"""
+        with self._lock:
+            return sum(len(job_ids) for job_ids in self._jobs.values())
+
+    @staticmethod
+    def key(req_args: Dict) -> Optional[str]:
+        """Hash identifying a job request's arguments, see `ResultCache.key`"""
+        return ResultCache.key(req_args)
+
+    def claim(self, key: str) -> Optional[Tuple[str, Optional[str]]]:
+        """Take the earliest recorded job of a request that is not yet reattached
+
+        Args:
+            key (str): Hash of the request arguments
+
+        Returns:
+            tuple<str, str>: The job ID and its status when `resume` ran, or
+                None if no job is recorded for the request
+        """
+        with self._lock:
+            job_ids = self._jobs.get(key)
+            if not job_ids:
+                return None
+            job_id = job_ids.popleft()
+            if not job_ids:
+                del self._jobs[key]
+            return job_id, self._statuses.pop(job_id, None)
+
+    def record(self, key: str, job_id: str, service: Optional[str] = None):
+        """Record a submitted job
+
+        Args:
+            key (str): Hash of the request arguments
+            job_id (str): ID of the submitted job
+            service (str, optional): Service the job runs
+        """
+        with self._lock:
+            self._buffer.append((key, job_id, service, time.time()))
+            full = self.flush_interval <= 0 or len(self._buffer) >= self.batch_size
+            if not full and self._timer is None:
+                self._timer = threading.Timer(self.flush_interval, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+        if full:
+            self.flush()
+
+    def flush(self):
+        """Write buffered records to the journal"""
+        with self._lock:
+            rows, self._buffer = self._buffer, []
+            timer, self._timer = self._timer, None
+        if timer is not None:
+            timer.cancel()
+        if not rows:
+            return
+        with self._db_lock, self._db:
+            self._db.executemany(
+                "INSERT INTO submissions (key, job_id, service, submitted) "
+                "VALUES (?, ?, ?, ?)",
+                rows,
+            )
+
+    def resume(
+        self,
+        client: MothrClient,
+        resubmit_failed: bool = False,
+        chunk_size: int = MAX_BATCH_SIZE,
+    ) -> Dict[str, int]:
+        """Look up the status of every recorded job not yet reattached to
+
+        Jobs that no longer exist are removed from the journal, so their
+        requests are submitted again. Jobs that have finished are still
+        reattached to, their results are fetched without running them again.
+
+        Args:
+            client (MothrClient): Client connection to MOTHR
+            resubmit_failed (bool, optional): Also remove `failed` and
+                `cancelled` jobs, so their requests are submitted again.
+                Default False
+            chunk_size (int, optional): Maximum number of jobs queried in a
+                single request, default 100
+
+        Returns:
+            dict: Number of recorded jobs in each status, jobs that no longer
+                exist are counted as `missing`
+        """
+        with self._lock:
+            job_ids = [job_id for queue in self._jobs.values() for job_id in queue]
+        counts: Counter = Counter()
+        removed = set()
+        for job_id, job in zip(
+            job_ids, client.query_jobs(job_ids, ["status"], chunk_size)
+        ):
+            if isinstance(job, ValueError):
+                counts["missing"] += 1
+                removed.add(job_id)
+                continue
+            counts[job["status"]] += 1
+            if resubmit_failed and job["status"] in ("failed", "cancelled"):
+                removed.add(job_id)
+            else:
+                self._statuses[job_id] = job["status"]
+        if removed:
+            self._remove(removed)
+        return dict(counts)
+
+    def clear(self):
+        """Remove every record, e.g. once a run has finished"""
+        with self._lock:
+            self._jobs.clear()
+            self._statuses.clear()
+            self._buffer = []
+        with self._db_lock, self._db:
+            self._db.execute("DELETE FROM submissions")
+
+    def close(self):
+        """Write buffered records and close the journal"""
+        self.flush()
+        with self._db_lock:
+            self._db.close()
+
+    def _remove(self, job_ids: set):
+        with self._lock:
+            for key in list(self._jobs):
+                queue = deque(j for j in self._jobs[key] if j not in job_ids)
+                if queue:
+                    self._jobs[key] = queue
+                else:
+                    del self._jobs[key]
+        with self._db_lock, self._db:
+            self._db.executemany(
+                "DELETE FROM submissions WHERE job_id = ?", [(j,) for j in job_ids]
+            )
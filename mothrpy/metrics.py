@@ -0,0 +1,253 @@
+# Copyright 2020 Resilient Solutions Inc. All rights reserved.
+# Use of this source code is governed by a BSD-style
+# license that can be found in the LICENSE file.
+
+import bisect
+import math
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Sequence, Set, Tuple
+
+from graphql import DocumentNode, OperationDefinitionNode
+
+
+# Upper bounds, in seconds, of the latency histogram buckets
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Upper bounds of the buckets for histograms of counts
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+# Histograms recording counts rather than durations
+COUNT_HISTOGRAMS = ("job_polls",)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    """Cumulative histogram of observed values"""
+
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        """Add a value to the histogram"""
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.counts):
+            self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> List[Tuple[float, int]]:
+        """Number of values less than or equal to each bucket's upper bound"""
+        total, result = 0, []
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+
+class Metrics:
+    """Latency histograms and counters recorded by a client
+
+    Pass an instance to a client with the `metrics` keyword argument, clients
+    created without one record nothing. The following metrics are recorded:
+
+    - ``request_seconds`` (histogram): Latency of each GraphQL request, labelled
+      by the top level fields of the operation (e.g., ``submitJob``)
+    - ``requests_total`` and ``request_errors_total`` (counters): Requests sent
+      and requests that raised or returned errors, labelled by operation
+    - ``bytes_sent_total`` and ``bytes_received_total`` (counters): HTTP request
+      and response body sizes
+    - ``job_polls`` (histogram): Status queries sent for each job before it
+      finished
+    - ``subscription_seconds`` (histogram) and ``subscription_reconnects_total``
+      (counter): Time waiting on websocket subscriptions and reconnections
+    - ``resolve_field_seconds`` (histogram): Time spent resolving field paths
+    - ``admission_wait_seconds`` (histogram): Time submit requests waited on the
+      client's `AdmissionController`
+
+    Args:
+        callback (callable, optional): Called with the metric name, value and
+            labels of every recorded value, see `add_callback`
+    """
+
+    def __init__(self, callback: Optional[Callable[[str, float, Dict], None]] = None):
+        self._histograms: Dict[Tuple[str, Labels], Histogram] = {}
+        self._counters: Dict[Tuple[str, Labels], float] = {}
+        self._callbacks: List[Callable[[str, float, Dict], None]] = []
+        self._lock = threading.Lock()
+        if callback is not None:
+            self.add_callback(callback)
+
+    def add_callback(self, callback: Callable[[str, float, Dict], None]):
+        """Register a function called with every recorded value
+
+        Args:
+            callback (callable): Called with the metric name, the value and a
+                dict of labels, exceptions raised by the callback are not caught
+        """
+        self._callbacks.append(callback)
+
+    def observe(self, name: str, value: float, **labels: str):
+        """Add a value to a histogram"""
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                buckets = COUNT_BUCKETS if name in COUNT_HISTOGRAMS else LATENCY_BUCKETS
+                histogram = self._histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+        for callback in self._callbacks:
+            callback(name, value, labels)
+
+    def increment(self, name: str, value: float = 1, **labels: str):
+        """Add to a counter"""
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+        for callback in self._callbacks:
+            callback(name, value, labels)
+
+    def request(self, operation: str, seconds: float, error: bool = False):
+        """Record a GraphQL request"""
+        self.observe("request_seconds", seconds, operation=operation)
+        self.increment("requests_total", operation=operation)
+        if error:
+            self.increment("request_errors_total", operation=operation)
+
+    def counter(self, name: str, **labels: str) -> float:
+        """Current value of a counter"""
+        with self._lock:
+            return self._counters.get((name, tuple(sorted(labels.items()))), 0)
+
+    def histogram(self, name: str, **labels: str) -> Optional[Histogram]:
+        """Histogram of a metric, or None if nothing has been observed"""
+        with self._lock:
+            return self._histograms.get((name, tuple(sorted(labels.items()))))
+
+    def reset(self):
+        """Discard every recorded value"""
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+    def prometheus(self, prefix: str = "mothrpy") -> str:
+        """Render every metric in the Prometheus text exposition format"""
+        with self._lock:
+            histograms = {
+                key: (h.cumulative(), h.sum, h.count)
+                for key, h in self._histograms.items()
+            }
+            counters = dict(self._counters)
+
+        lines: List[str] = []
+        declared: Set[str] = set()
+        for (name, labels), (buckets, total, count) in sorted(histograms.items()):
+            metric = f"{prefix}_{name}"
+            _declare(lines, declared, metric, "histogram")
+            lines.extend(_histogram_lines(metric, labels, buckets, total, count))
+        for (name, labels), value in sorted(counters.items()):
+            metric = f"{prefix}_{name}"
+            _declare(lines, declared, metric, "counter")
+            lines.append(f"{metric}{_labels(labels)} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port: int, addr: str = "") -> ThreadingHTTPServer:
+        """Expose the metrics over HTTP for Prometheus to scrape
+
+        The server runs in a daemon thread, call ``shutdown`` on the returned
+        server to stop it.
+
+        Args:
+            port (int): Port to listen on
+            addr (str, optional): Address to bind to, default every interface
+
+        Returns:
+            `http.server.ThreadingHTTPServer`
+        """
+        server = ThreadingHTTPServer((addr, port), _MetricsHandler)
+        setattr(server, "metrics", self)
+        thread = threading.Thread(
+            target=server.serve_forever, name="mothrpy-metrics", daemon=True
+        )
+        thread.start()
+        return server
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    """Serve the metrics attached to the server in the Prometheus text format"""
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """Respond with the current metrics"""
+        body = getattr(self.server, "metrics").prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        pass
+
+
+def operation_name(document: DocumentNode) -> str:
+    """Label for a document, the names of its top level fields"""
+    names: List[str] = []
+    for definition in document.definitions:
+        if isinstance(definition, OperationDefinitionNode):
+            for selection in definition.selection_set.selections:
+                name = getattr(selection, "name", None)
+                if name is not None and name.value not in names:
+                    names.append(name.value)
+    return ",".join(names)
+
+
+def _histogram_lines(
+    metric: str,
+    labels: Labels,
+    buckets: List[Tuple[float, int]],
+    total: float,
+    count: int,
+) -> List[str]:
+    lines = []
+    for bound, cumulative in buckets:
+        bucket = labels + (("le", _number(bound)),)
+        lines.append(f"{metric}_bucket{_labels(bucket)} {cumulative}")
+    lines.append(f"{metric}_bucket{_labels(labels + (('le', '+Inf'),))} {count}")
+    lines.append(f"{metric}_sum{_labels(labels)} {_number(total)}")
+    lines.append(f"{metric}_count{_labels(labels)} {count}")
+    return lines
+
+
+def _declare(lines: List[str], declared: Set[str], metric: str, metric_type: str):
+    """Add the metric's TYPE line, once, before its first sample"""
+    if metric not in declared:
+        declared.add(metric)
+        lines.append(f"# TYPE {metric} {metric_type}")
+
+
+def _number(value: float) -> str:
+    """Sample value or bucket bound, without losing precision"""
+    if math.isnan(value):
+        return "NaN"
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    values = ",".join(f'{k}="{_escape(v)}"' for k, v in labels)
+    return f"{{{values}}}"
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
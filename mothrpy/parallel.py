@@ -0,0 +1,291 @@
+# Copyright 2020 Resilient Solutions Inc. All rights reserved.
+# Use of this source code is governed by a BSD-style
+# license that can be found in the LICENSE file.
+
+from __future__ import annotations
+import logging
+import math
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from functools import partial
+from itertools import islice
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    Optional,
+    Tuple,
+)
+
+if TYPE_CHECKING:
+    from .client import MothrClient
+    from .request import JobRequest
+
+
+log = logging.getLogger(__name__)
+
+
+def request_kwargs(params: Any, **kwargs: Any) -> Dict[str, Any]:
+    """Keyword arguments for the `JobRequest` of one item of a parameter iterable
+
+    Args:
+        params (dict|list): Either keyword arguments for `JobRequest`
+            (e.g., `parameters`, `inputs`, `outputs`) or a list of parameters
+        kwargs: Keyword arguments for `JobRequest` shared by every request
+
+    Returns:
+        dict
+    """
+    args = dict(kwargs)
+    if isinstance(params, Mapping):
+        args.update(params)
+    else:
+        args["parameters"] = params
+    # Requests append to their parameter list, never share it between jobs
+    args["parameters"] = [dict(p) for p in args.get("parameters", [])]
+    return args
+
+
+def watch_job(
+    client: MothrClient, request: JobRequest, job_id: str, mode: str
+) -> Future:
+    """Wait on a submitted job with the client's tracker or subscription manager
+
+    Args:
+        client (MothrClient): Client connection to MOTHR
+        request (JobRequest): Request the job was submitted for
+        job_id (str): Job to wait on
+        mode (str): `track` or `subscribe`
+
+    Returns:
+        `concurrent.futures.Future`: Resolved with the job result, which is
+            added to the client's `ResultCache`
+    """
+    future: Future
+    if request._cached is not None:
+        future = Future()
+        future.set_result(dict(request._cached))
+        return future
+    if mode == "subscribe":
+        future = client.subscriptions.watch(job_id)
+    else:
+        future = client.tracker.track(
+            job_id,
+            service=request.req_args.get("service"),
+            version=request.req_args.get("version", "latest"),
+        )
+    future.add_done_callback(partial(_store_result, request))
+    return future
+
+
+def _store_result(request: JobRequest, future: Future):
+    if not future.cancelled() and future.exception() is None:
+        request._store(future.result())
+
+
+class _Pending:  # pylint: disable=too-few-public-methods
+    __slots__ = ("index", "job_id", "expires")
+
+    def __init__(self, index: int, job_id: Optional[str], expires: float):
+        self.index = index
+        self.job_id = job_id
+        self.expires = expires
+
+
+class JobPool:  # pylint: disable=too-few-public-methods
+    """Run many job requests with a bounded number of jobs in flight
+
+    Requests are pulled lazily and submitted in batches with
+    `MothrClient.submit_many`, then waited on together by the client's job
+    tracker or subscription manager. At most `max_in_flight` jobs are submitted
+    but not yet returned at any time, so memory use stays flat for inputs of any
+    length.
+
+    Jobs running longer than `job_timeout` are cancelled and returned as
+    `cancelled`. Once `timeout` expires, or with `fail_fast` once a job fails,
+    every outstanding job is cancelled with a single ``cancelJob`` mutation per
+    chunk and no further requests are submitted.
+
+    Args:
+        client (MothrClient): Client connection to MOTHR
+        max_in_flight (int, optional): Maximum number of outstanding jobs,
+            default 100
+        return_failed (bool, optional): Return failed job results instead of
+            raising an exception. Default False
+        mode (str, optional): How to wait for jobs, `track` or `subscribe`.
+            See `JobRequest.run_job`. Default `track`
+        timeout (float, optional): Time, in seconds, to run every request
+            before cancelling outstanding jobs, unlimited by default
+        job_timeout (float, optional): Time, in seconds, after submitting a job
+            before it is cancelled, unlimited by default
+        fail_fast (bool, optional): Cancel outstanding jobs once a job fails.
+            Default False
+
+    Raises:
+        ValueError: If `max_in_flight` is less than 1 or mode is not recognized
+    """
+
+    # pylint: disable=too-many-arguments
+    def __init__(
+        self,
+        client: MothrClient,
+        max_in_flight: int = 100,
+        return_failed: bool = False,
+        mode: str = "track",
+        timeout: Optional[float] = None,
+        job_timeout: Optional[float] = None,
+        fail_fast: bool = False,
+    ):
+        if max_in_flight < 1:
+            raise ValueError("max_in_flight must be at least 1")
+        if mode not in ("track", "subscribe"):
+            raise ValueError(f"Unknown run mode: {mode}")
+        self.client = client
+        self.max_in_flight = max_in_flight
+        self.return_failed = return_failed
+        self.mode = mode
+        self.timeout = timeout
+        self.job_timeout = job_timeout
+        self.fail_fast = fail_fast
+
+    def run(
+        self, requests: Iterable[JobRequest], ordered: bool = False
+    ) -> Iterator[Tuple[int, Dict]]:
+        """Run job requests, yielding results as they become available
+
+        Outstanding jobs stop being waited on if the iterator is closed early,
+        and are cancelled if the pool fails fast or times out.
+
+        Args:
+            requests (iterable<JobRequest>): Job requests to run
+            ordered (bool, optional): Yield results in the order of `requests`
+                instead of the order the jobs finish. When ordered, finished jobs
+                waiting on an earlier job count towards `max_in_flight`.
+                Default False
+
+        Yields:
+            tuple<int, dict>: Index of the request in `requests` and the job result
+
+        Raises:
+            RuntimeError: If a job fails, unless `return_failed` is True
+            TimeoutError: If `timeout` expires before every job finished
+            Exception: Errors submitting or waiting on jobs, e.g. network
+                errors, after outstanding jobs are cancelled
+        """
+        iterator = enumerate(requests)
+        deadline = math.inf if self.timeout is None else time.monotonic() + self.timeout
+        pending: Dict[Future, _Pending] = {}
+        finished: Dict[int, Dict] = {}
+        next_index = 0
+        stopped = cancel = False
+        try:
+            while True:
+                free = self.max_in_flight - len(pending) - len(finished)
+                if not stopped:
+                    pending.update(self._submit(list(islice(iterator, max(free, 0)))))
+                if not pending and not finished:
+                    return
+                if time.monotonic() >= deadline:
+                    cancel = True
+                    raise TimeoutError(f"Jobs did not finish within {self.timeout}s")
+                results = self._wait_any(pending, deadline)
+                if self.fail_fast and not stopped and _any_failed(results.values()):
+                    stopped = cancel = True
+                    self._cancel(pending)
+                finished.update(results)
+                if not ordered:
+                    for index in sorted(finished):
+                        yield index, finished.pop(index)
+                while next_index in finished:
+                    yield next_index, finished.pop(next_index)
+                    next_index += 1
+        except Exception as e:
+            # A failed job only cancels the others when failing fast, but jobs
+            # of a run stopped by an error submitting or waiting on jobs would
+            # keep running with no one waiting on them
+            cancel = cancel or self.fail_fast or not isinstance(e, RuntimeError)
+            raise
+        finally:
+            if cancel:
+                self._cancel(pending)
+            for future in pending:
+                future.cancel()
+
+    def _submit(self, batch: List[Tuple[int, JobRequest]]) -> Dict[Future, _Pending]:
+        """Submit a batch of requests and start waiting on their jobs"""
+        futures = {}
+        job_ids = self.client.submit_many([request for _, request in batch])
+        expires = math.inf
+        if self.job_timeout is not None:
+            expires = time.monotonic() + self.job_timeout
+        for (index, request), job_id in zip(batch, job_ids):
+            if isinstance(job_id, ValueError):
+                future: Future = Future()
+                future.set_result(
+                    {"jobId": None, "status": "failed", "error": str(job_id)}
+                )
+                futures[future] = _Pending(index, None, expires)
+            else:
+                future = watch_job(self.client, request, job_id, self.mode)
+                futures[future] = _Pending(index, job_id, expires)
+        return futures
+
+    def _wait_any(
+        self, pending: Dict[Future, _Pending], deadline: float
+    ) -> Dict[int, Dict]:
+        """Wait for at least one pending job and remove every finished job
+
+        Jobs past their timeout are cancelled and count as finished.
+        """
+        if not pending:
+            return {}
+        until = min(deadline, *(job.expires for job in pending.values()))
+        timeout = None if until == math.inf else max(0.0, until - time.monotonic())
+        done, _ = wait(list(pending), timeout=timeout, return_when=FIRST_COMPLETED)
+        now = time.monotonic()
+        expired = {
+            future: job
+            for future, job in pending.items()
+            if future not in done and job.expires <= now
+        }
+        results = {pending.pop(future).index: future.result() for future in done}
+        if expired:
+            self._cancel(expired)
+        for future, job in expired.items():
+            del pending[future]
+            future.cancel()
+            results[job.index] = {
+                "jobId": job.job_id,
+                "status": "cancelled",
+                "error": f"Timed out after {self.job_timeout}s",
+            }
+        for result in results.values():
+            if result["status"] != "complete" and not self.return_failed:
+                raise RuntimeError(f"Job {result['jobId']} failed: {result['error']}")
+        return results
+
+    def _cancel(self, pending: Dict[Future, _Pending]):
+        """Cancel the jobs of unfinished futures"""
+        job_ids = [
+            job.job_id
+            for future, job in pending.items()
+            if job.job_id is not None and not future.done()
+        ]
+        if not job_ids:
+            return
+        try:
+            results = self.client.cancel_many(job_ids)
+        except Exception as e:  # pylint: disable=broad-except
+            log.warning("Cancelling %d jobs failed: %r", len(job_ids), e)
+            return
+        for job_id, result in zip(job_ids, results):
+            if isinstance(result, ValueError):
+                log.warning("Cancelling job %s failed: %s", job_id, result)
+
+
+def _any_failed(results: Iterable[Dict]) -> bool:
+    return any(result["status"] != "complete" for result in results)
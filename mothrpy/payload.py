@@ -0,0 +1,447 @@
+# Copyright 2020 Resilient Solutions Inc. All rights reserved.
+# Use of this source code is governed by a BSD-style
+# license that can be found in the LICENSE file.
+
+import codecs
+import hashlib
+import json
+import mmap
+import os
+import re
+import uuid
+import zlib
+from functools import partial
+from json.decoder import scanstring  # type: ignore
+from typing import IO, Any, Dict, Iterable, Iterator, List, Optional, Union
+
+from gql.dsl import DSLField
+from graphql import (
+    DocumentNode,
+    NamedTypeNode,
+    NameNode,
+    ObjectFieldNode,
+    VariableDefinitionNode,
+    VariableNode,
+)
+from graphql.pyutils import FrozenList
+
+# Size, in bytes, of the chunks sources are read in
+CHUNK_SIZE = 1 << 20
+
+# Responses up to this size, in bytes, are decoded in one piece
+INCREMENTAL_THRESHOLD = 1 << 20
+
+# JSON encoding of the placeholder left for a stream in a request body
+_PLACEHOLDER = re.compile(r'"\\u0000(\d+)\\u0000"')
+
+# Strings longer than this, in characters, are decoded apart from the rest of
+# a response
+LARGE_STRING = 1 << 16
+
+# Escaped backslash or quote, the escapes that hide the end of a string
+_ESCAPED_QUOTE = re.compile(r'\\[\\"]')
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+Source = Union[str, "os.PathLike[str]", IO, bytes, bytearray, memoryview, mmap.mmap]
+
+
+class StreamSource:
+    """Value of a job's ``inputStream`` read from a file or buffer as it is sent
+
+    Instead of being embedded in the ``submitJob`` mutation, the source is
+    sent as a GraphQL variable whose JSON encoding is written to the request
+    body a chunk at a time, so only one chunk of it is held in memory.
+
+    Args:
+        source (str|path|file|bytes|mmap): Path of a file, a file object opened
+            in binary or text mode, or a buffer such as `bytes`, `memoryview`
+            or `mmap.mmap`
+        encoding (str, optional): Encoding of binary sources, default `utf-8`
+        chunk_size (int, optional): Bytes read at a time, default 1 MiB
+    """
+
+    def __init__(
+        self, source: Source, encoding: str = "utf-8", chunk_size: int = CHUNK_SIZE
+    ):
+        if chunk_size < 1:
+            raise ValueError("chunk_size must be at least 1")
+        self.source = source
+        self.encoding = encoding
+        self.chunk_size = chunk_size
+        self._start: Optional[int] = None
+        self._consumed = False
+        self._digest: Optional[str] = None
+        if hasattr(source, "read") and _seekable(source):
+            self._start = source.tell()  # type: ignore
+
+    def __str__(self) -> str:
+        if isinstance(self.source, (str, os.PathLike)):
+            return f"StreamSource({os.fspath(self.source)})"
+        return f"StreamSource({getattr(self.source, 'name', id(self.source))})"
+
+    def chunks(self) -> Iterator[str]:
+        """Read the source as text, a chunk at a time
+
+        Paths, buffers and seekable files are read from the start each time.
+
+        Raises:
+            ValueError: If the source is a file that cannot be rewound and has
+                already been read
+        """
+        if isinstance(self.source, (str, os.PathLike)):
+            with open(self.source, "rb") as f:
+                chunks = iter(partial(f.read, self.chunk_size), b"")
+                yield from iter_text(chunks, self.encoding)
+        elif hasattr(self.source, "read"):
+            source: Any = self.source
+            if self._start is not None:
+                source.seek(self._start)
+            elif self._consumed:
+                raise ValueError("Input stream has already been read")
+            self._consumed = True
+            first = source.read(self.chunk_size)
+            rest = iter(partial(source.read, self.chunk_size), first[:0])
+            if isinstance(first, str):
+                if first:
+                    yield first
+                yield from rest
+            else:
+                yield from iter_text(_prepend(first, rest), self.encoding)
+        else:
+            view = memoryview(self.source).cast("B")  # type: ignore
+            yield from iter_text(
+                (
+                    view[i : i + self.chunk_size]
+                    for i in range(0, len(view), self.chunk_size)
+                ),
+                self.encoding,
+            )
+
+    def read(self) -> str:
+        """The whole source as text"""
+        return "".join(self.chunks())
+
+    def digest(self) -> Optional[str]:
+        """SHA-256 hex digest of the source's text, encoded as UTF-8
+
+        The source is read once to compute the digest, which is kept.
+
+        Returns:
+            str: The digest, or None for a file that cannot be rewound, as
+                reading it would leave nothing to send
+        """
+        if self._digest is None:
+            if hasattr(self.source, "read") and self._start is None:
+                return None
+            sha = hashlib.sha256()
+            for chunk in self.chunks():
+                sha.update(chunk.encode("utf-8"))
+            self._digest = sha.hexdigest()
+        return self._digest
+
+
+def as_input_stream(value: Any) -> Any:
+    """Wrap files and buffers given as an ``inputStream`` in a `StreamSource`
+
+    Strings are kept as they are, they are the stream's value rather than a
+    path. Use a `pathlib.Path` or a `StreamSource` to read a file.
+    """
+    if value is None or isinstance(value, (str, StreamSource)):
+        return value
+    if isinstance(value, (os.PathLike, bytes, bytearray, memoryview, mmap.mmap)):
+        return StreamSource(value)
+    if hasattr(value, "read"):
+        return StreamSource(value)
+    raise TypeError(f"Unsupported input stream: {type(value).__name__}")
+
+
+def stream_variables(req_args: Dict, variable: str) -> Dict[str, StreamSource]:
+    """The `StreamSource` input stream of a request by variable name, if any"""
+    stream = req_args.get("inputStream")
+    return {variable: stream} if isinstance(stream, StreamSource) else {}
+
+
+def bind_variable(field: DSLField, name: str, variable: str):
+    """Set a field of a ``submitJob`` request argument to a variable"""
+    value = field.ast_field.arguments[0].value
+    value.fields = FrozenList(
+        [
+            *value.fields,
+            ObjectFieldNode(
+                name=NameNode(value=name),
+                value=VariableNode(name=NameNode(value=variable)),
+            ),
+        ]
+    )
+
+
+def declare_variables(document: DocumentNode, names: Iterable[str]):
+    """Declare `String` variables on the operation of a document"""
+    document.definitions[0].variable_definitions = FrozenList(  # type: ignore
+        VariableDefinitionNode(
+            variable=VariableNode(name=NameNode(value=name)),
+            type=NamedTypeNode(name=NameNode(value="String")),
+        )
+        for name in names
+    )
+
+
+class JSONBody:  # pylint: disable=too-few-public-methods
+    """Request body encoding a GraphQL payload, streaming `StreamSource` values
+
+    The body is produced a chunk at a time each time it is iterated, so it can
+    be sent again on retries.
+
+    Attributes:
+        sent (int): Bytes produced by the last iteration
+
+    Args:
+        payload (dict): Payload to encode, e.g. the query and its variables
+        compress (bool, optional): gzip the body, default False
+    """
+
+    def __init__(self, payload: Dict, compress: bool = False):
+        self.payload = payload
+        self.compress = compress
+        self.sent = 0
+
+    def __iter__(self) -> Iterator[bytes]:
+        self.sent = 0
+        chunks = self._chunks()
+        if self.compress:
+            chunks = _gzip(chunks)
+        for chunk in chunks:
+            self.sent += len(chunk)
+            yield chunk
+
+    def _chunks(self) -> Iterator[bytes]:
+        streams: List[StreamSource] = []
+
+        def placeholder(value: Any) -> str:
+            if not isinstance(value, StreamSource):
+                raise TypeError(f"{type(value).__name__} is not JSON serializable")
+            streams.append(value)
+            return f"\0{len(streams) - 1}\0"
+
+        text = json.dumps(self.payload, default=placeholder)
+        parts = _PLACEHOLDER.split(text)
+        # Text and the index of a stream alternate
+        for i, part in enumerate(parts):
+            if i % 2 == 0:
+                yield part.encode("utf-8")
+                continue
+            yield b'"'
+            for chunk in streams[int(part)].chunks():
+                yield json.dumps(chunk)[1:-1].encode("utf-8")
+            yield b'"'
+
+
+def decode_json(chunks: Iterable[str]) -> Any:
+    """Decode a JSON document given as chunks of text
+
+    Strings longer than `LARGE_STRING` characters are decoded a chunk at a
+    time, apart from the rest of the document, so a large value is never held
+    as JSON text next to its decoded copy. Everything else is decoded by
+    `json.loads`.
+
+    Raises:
+        ValueError: If the text is not valid JSON
+    """
+    splitter = _Splitter()
+    for chunk in chunks:
+        splitter.feed(chunk)
+    return splitter.decode()
+
+
+def iter_text(chunks: Iterable[Any], encoding: str = "utf-8") -> Iterator[str]:
+    """Decode chunks of bytes into chunks of text"""
+    decoder = codecs.getincrementaldecoder(encoding)()
+    for chunk in chunks:
+        text = decoder.decode(chunk)
+        if text:
+            yield text
+    text = decoder.decode(b"", final=True)
+    if text:
+        yield text
+
+
+class _Splitter:
+    """Separates the large strings of a JSON document from the rest of it
+
+    Each large string is replaced by a number literal no serializer writes, so
+    the remaining text can be decoded by `json.loads`, which calls
+    `parse_float` with the literal to put the string back.
+    """
+
+    def __init__(self):
+        self.skeleton: List[str] = []
+        self.strings: Dict[str, str] = {}
+        # Text after the last offset known to be outside a string
+        self.tail = ""
+        # Large string being read, and one read before knowing if it is a key
+        self.string: Optional[_LargeString] = None
+        self.closed: Optional[str] = None
+        self._token = uuid.uuid4().int
+
+    def feed(self, chunk: str):
+        """Add the next chunk of the document"""
+        if self.string is not None:
+            chunk = self._read_string(chunk)
+            if self.string is not None:
+                return
+        self._scan(self.tail + chunk if self.tail else chunk)
+
+    def decode(self) -> Any:
+        """Decode the document once every chunk has been added"""
+        if self.string is not None:
+            raise ValueError("Unterminated string")
+        if self.closed is not None:
+            self._place(self.closed, key=False)
+        self.skeleton.append(self.tail)
+        text = "".join(self.skeleton)
+        self.skeleton.clear()
+        if not self.strings:
+            return json.loads(text)
+        strings = self.strings
+        return json.loads(
+            text, parse_float=lambda s: strings.pop(s) if s in strings else float(s)
+        )
+
+    def _scan(self, text: str):
+        """Find the strings in text that starts outside a string"""
+        if self.closed is not None:
+            space = _WHITESPACE.match(text).end()  # type: ignore
+            if space == len(text):
+                self.tail = text
+                return
+            self._place(self.closed, key=text[space] == ":")
+            self.closed = None
+        # Quotes that are not escaped alternately open and close strings
+        stripped = _mask_escapes(text)
+        if stripped.count('"') % 2 == 0:
+            self.skeleton.append(text)
+            self.tail = ""
+            return
+        start = stripped.rfind('"')
+        self.skeleton.append(text[:start])
+        if len(text) - start <= LARGE_STRING:
+            self.tail = text[start:]
+            return
+        self.tail = ""
+        self.string = _LargeString()
+        self.string.feed(text[start + 1 :])
+
+    def _read_string(self, chunk: str) -> str:
+        """Add a chunk to the large string, returns the text after it ends"""
+        assert self.string is not None
+        rest = self.string.feed(chunk)
+        if rest is None:
+            return ""
+        self.closed = self.string.value()
+        self.string = None
+        return rest
+
+    def _place(self, value: str, key: bool):
+        """Add a large string to the skeleton"""
+        if key:
+            self.skeleton.append(json.dumps(value, ensure_ascii=False))
+            return
+        placeholder = f"-0.0e-{self._token}{len(self.strings)}"
+        self.strings[placeholder] = value
+        self.skeleton.append(placeholder)
+
+
+class _LargeString:
+    """String value decoded from the chunks of JSON text it spans"""
+
+    def __init__(self):
+        self.parts: List[str] = []
+        # Incomplete escape sequence at the end of the text read so far
+        self.carry = ""
+        # High surrogate whose low surrogate may start the next chunk
+        self.high = ""
+
+    def feed(self, raw: str) -> Optional[str]:
+        """Add the JSON text following the string's opening quote
+
+        Returns:
+            str: Text after the closing quote, None if the string continues
+        """
+        raw = self.carry + raw if self.carry else raw
+        end = _escapes_end(raw)
+        self.carry = raw[end:]
+        # Finds the closing quote and decodes every escape before it in one
+        # call, the quote added ends the text if the string continues
+        text, stop = scanstring(raw[:end] + '"', 0)
+        # Escaped surrogate pairs split between chunks are joined
+        if self.high:
+            text = self.high + text
+            self.high = ""
+            if raw.startswith("\\u") and "\udc00" <= text[1:2] <= "\udfff":
+                pair = text[:2].encode("utf-16-le", "surrogatepass")
+                text = pair.decode("utf-16-le") + text[2:]
+        if "\ud800" <= text[-1:] <= "\udbff" and raw[end - 1 : end] != text[-1]:
+            self.high = text[-1]
+            text = text[:-1]
+        self.parts.append(text)
+        if stop > end:
+            return None
+        self.carry = ""
+        return raw[stop:]
+
+    def value(self) -> str:
+        """The whole string, once it has ended"""
+        self.parts.append(self.high)
+        return "".join(self.parts)
+
+
+def _mask_escapes(text: str) -> str:
+    """Text with escaped backslashes and quotes masked, at the same offsets
+
+    Text must not start inside an escape sequence. Pairs of backslashes are
+    replaced from the left, as a JSON decoder reads them, so every quote left
+    delimits a string.
+    """
+    if _ESCAPED_QUOTE.search(text) is None:
+        return text
+    return text.replace("\\\\", "__").replace('\\"', "__")
+
+
+def _escapes_end(raw: str) -> int:
+    """Offset in JSON string content of an incomplete escape at its end, if any"""
+    end = len(raw)
+    last = raw.rfind("\\", max(end - 6, 0))
+    if last < 0:
+        return end
+    start = last
+    while start and raw[start - 1] == "\\":
+        start -= 1
+    # The backslash closes an escaped backslash
+    if (last - start) % 2 == 1:
+        return end
+    if last + 1 < end and (raw[last + 1] != "u" or last + 6 <= end):
+        return end
+    return last
+
+
+def _seekable(f: Any) -> bool:
+    try:
+        return bool(f.seekable())
+    except (AttributeError, ValueError):
+        return False
+
+
+def _prepend(first: Any, rest: Iterator[Any]) -> Iterator[Any]:
+    if first:
+        yield first
+    yield from rest
+
+
+def _gzip(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    compressor = zlib.compressobj(wbits=31)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
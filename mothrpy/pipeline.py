@@ -0,0 +1,267 @@
+# Copyright 2020 Resilient Solutions Inc. All rights reserved.
+# Use of this source code is governed by a BSD-style
+# license that can be found in the LICENSE file.
+
+from __future__ import annotations
+import logging
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from typing import (
+    TYPE_CHECKING,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Tuple,
+    Union,
+)
+
+from .parallel import watch_job
+
+if TYPE_CHECKING:
+    from .client import MothrClient
+    from .request import JobRequest
+
+
+log = logging.getLogger(__name__)
+
+# A stage's request, or a function building it from the results of its upstream
+# stages
+StageRequest = Union["JobRequest", Callable[[Dict[str, Dict]], "JobRequest"]]
+
+
+def output_uris(request: JobRequest) -> List[str]:
+    """S3 URIs a job request's service uploads, from `outputs` and parameters
+
+    Args:
+        request (JobRequest)
+
+    Returns:
+        list<str>
+    """
+    uris = list(request.req_args.get("outputs") or [])
+    uris.extend(
+        p["value"] for p in request.req_args["parameters"] if p["type"] == "output"
+    )
+    return uris
+
+
+class _Stage:  # pylint: disable=too-few-public-methods
+    __slots__ = ("name", "request", "depends", "dependents")
+
+    def __init__(self, name: str, request: StageRequest, depends: Tuple[str, ...]):
+        self.name = name
+        self.request = request
+        self.depends = depends
+        self.dependents: List[str] = []
+
+
+class Pipeline:
+    """Run job requests whose inputs are the outputs of other jobs
+
+    Stages form a directed acyclic graph. A stage's job is submitted as soon as
+    the jobs of every stage it depends on have completed, so independent
+    branches run in parallel and never wait on each other. Stages that become
+    ready together are submitted in a single mutation with
+    `MothrClient.submit_many`.
+
+    When a stage's job fails, every stage downstream of it is skipped and given
+    a `cancelled` result without being submitted, while the rest of the graph
+    keeps running. Jobs still in flight when the pipeline stops early are
+    cancelled with ``cancelJob``.
+
+    Args:
+        client (MothrClient): Client connection to MOTHR
+        return_failed (bool, optional): Return failed and skipped stage results
+            from `run` instead of raising an exception. Default False
+        mode (str, optional): How to wait for jobs, `track` or `subscribe`.
+            See `JobRequest.run_job`. Default `track`
+
+    Raises:
+        ValueError: If mode is not recognized
+    """
+
+    def __init__(
+        self, client: MothrClient, return_failed: bool = False, mode: str = "track"
+    ):
+        if mode not in ("track", "subscribe"):
+            raise ValueError(f"Unknown run mode: {mode}")
+        self.client = client
+        self.return_failed = return_failed
+        self.mode = mode
+        self.results: Dict[str, Dict] = {}
+        self.requests: Dict[str, JobRequest] = {}
+        self._stages: Dict[str, _Stage] = {}
+        self._started = False
+
+    def __len__(self) -> int:
+        return len(self._stages)
+
+    def add(
+        self, name: str, request: StageRequest, depends: Iterable[str] = ()
+    ) -> Pipeline:
+        """Add a stage to the pipeline
+
+        The output URIs of each upstream stage's request are added to a
+        `JobRequest` stage as inputs, in the order of `depends`. To pass
+        anything else downstream, give a function instead, which is called with
+        the results of the upstream stages, keyed by stage name, once they
+        complete and returns the stage's `JobRequest`.
+
+        Args:
+            name (str): Unique name of the stage
+            request (JobRequest|callable): Request to run, or a function
+                building it from the upstream results
+            depends (list<str>, optional): Stages whose jobs must complete before
+                this stage's job is submitted, they must already be added
+
+        Returns:
+            Pipeline: self
+
+        Raises:
+            ValueError: If the name is already used or a dependency is unknown
+        """
+        if name in self._stages:
+            raise ValueError(f"Stage {name} already exists")
+        depends = tuple(depends)
+        for upstream in depends:
+            if upstream not in self._stages:
+                raise ValueError(f"Stage {name} depends on unknown stage {upstream}")
+        for upstream in depends:
+            self._stages[upstream].dependents.append(name)
+        self._stages[name] = _Stage(name, request, depends)
+        return self
+
+    def downstream(self, name: str) -> List[str]:
+        """Every stage that directly or indirectly depends on a stage"""
+        found: List[str] = []
+        stack = list(reversed(self._stages[name].dependents))
+        while stack:
+            stage = stack.pop()
+            if stage not in found:
+                found.append(stage)
+                stack.extend(reversed(self._stages[stage].dependents))
+        return found
+
+    def run(self) -> Dict[str, Dict]:
+        """Run every stage and wait for the pipeline to finish
+
+        Returns:
+            dict: Result of each stage's job keyed by stage name
+
+        Raises:
+            RuntimeError: If a stage failed or was skipped, unless
+                `return_failed` is True
+        """
+        results = dict(self.as_completed())
+        failed = [name for name, r in results.items() if r["status"] != "complete"]
+        if failed and not self.return_failed:
+            raise RuntimeError(f"Pipeline stages failed: {', '.join(failed)}")
+        return results
+
+    def as_completed(self) -> Iterator[Tuple[str, Dict]]:
+        """Run every stage, yielding results as stages finish
+
+        Jobs still in flight are cancelled if the iterator is closed early.
+
+        Yields:
+            tuple<str, dict>: Stage name and the result of its job
+
+        Raises:
+            RuntimeError: If the pipeline has already been run
+        """
+        if self._started:
+            raise RuntimeError("Pipeline has already been run")
+        self._started = True
+        waiting = {name: len(stage.depends) for name, stage in self._stages.items()}
+        ready = [name for name, count in waiting.items() if count == 0]
+        pending: Dict[Future, str] = {}
+        try:
+            while ready or pending:
+                pending.update(self._submit(ready))
+                ready = []
+                done, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = pending.pop(future)
+                    self.results[name] = future.result()
+                    yield name, self.results[name]
+                    if self.results[name]["status"] == "complete":
+                        ready.extend(self._release(name, waiting))
+                    else:
+                        yield from self._skip(name)
+        finally:
+            self._cancel(pending)
+
+    def _release(self, name: str, waiting: Dict[str, int]) -> List[str]:
+        """Stages left with no unfinished dependencies once a stage completes"""
+        ready = []
+        for stage in self._stages[name].dependents:
+            waiting[stage] -= 1
+            if waiting[stage] == 0:
+                ready.append(stage)
+        return ready
+
+    def _skip(self, name: str) -> Iterator[Tuple[str, Dict]]:
+        """Give every stage downstream of a failed stage a skipped result"""
+        for stage in self.downstream(name):
+            if stage not in self.results:
+                self.results[stage] = _skipped(name)
+                yield stage, self.results[stage]
+
+    def _build(self, stage: _Stage) -> JobRequest:
+        """Create a stage's request, or chain its upstream outputs into it"""
+        if callable(stage.request):
+            upstream = {name: self.results[name] for name in stage.depends}
+            return stage.request(upstream)
+        for name in stage.depends:
+            for uri in output_uris(self.requests[name]):
+                stage.request.add_input(uri)
+        return stage.request
+
+    def _submit(self, names: List[str]) -> Dict[Future, str]:
+        """Submit the jobs of ready stages and start waiting on them"""
+        futures: Dict[Future, str] = {}
+        for name in names:
+            try:
+                self.requests[name] = self._build(self._stages[name])
+            except Exception as e:
+                futures[_failed(f"Error building request: {e!r}")] = name
+        batch = [name for name in names if name in self.requests]
+        job_ids = self.client.submit_many([self.requests[name] for name in batch])
+        for name, job_id in zip(batch, job_ids):
+            request = self.requests[name]
+            if isinstance(job_id, ValueError):
+                futures[_failed(str(job_id))] = name
+            else:
+                futures[watch_job(self.client, request, job_id, self.mode)] = name
+        return futures
+
+    def _cancel(self, pending: Dict[Future, str]):
+        """Stop waiting on unfinished stages and cancel their jobs"""
+        job_ids = []
+        for future, name in pending.items():
+            if future.done():
+                continue
+            future.cancel()
+            if self.requests[name].job_id is not None:
+                job_ids.append(self.requests[name].job_id)
+        if not job_ids:
+            return
+        try:
+            self.client.cancel_many(job_ids)
+        except Exception as e:
+            log.warning("Cancelling %d pipeline jobs failed: %r", len(job_ids), e)
+
+
+def _failed(error: str) -> Future:
+    future: Future = Future()
+    future.set_result({"jobId": None, "status": "failed", "error": error})
+    return future
+
+
+def _skipped(upstream: str) -> Dict:
+    return {
+        "jobId": None,
+        "status": "cancelled",
+        "error": f"Upstream stage {upstream} did not complete",
+    }
@@ -0,0 +1,169 @@
+# Copyright 2020 Resilient Solutions Inc. All rights reserved.
+# Use of this source code is governed by a BSD-style
+# license that can be found in the LICENSE file.
+
+import random
+import threading
+from typing import Dict, Optional, Tuple
+
+
+class PollPolicy:
+    """Decides how long to wait between status queries of a job
+
+    Subclasses implement `delay`, and may implement `observe` to learn from
+    finished jobs. Any fields named in `fields` are queried along with the job
+    status and passed to `observe`.
+    """
+
+    # Job fields read by `observe`
+    fields: Tuple[str, ...] = ()
+
+    def delay(
+        self,
+        elapsed: float,
+        service: Optional[str] = None,
+        version: Optional[str] = None,
+    ) -> float:
+        """Time to wait before the next status query
+
+        Args:
+            elapsed (float): Time, in seconds, since the job was submitted
+            service (str, optional): Service executing the job
+            version (str, optional): Version of the service requested
+
+        Returns:
+            float: Delay, in seconds
+        """
+        raise NotImplementedError
+
+    def observe(self, service: Optional[str], version: Optional[str], job: Dict):
+        """Record a job that reached a terminal status
+
+        Args:
+            service (str): Service that executed the job
+            version (str): Version of the service requested
+            job (dict): The job's status and `fields`
+        """
+
+
+class FixedPolicy(PollPolicy):
+    """Poll at a fixed interval
+
+    Args:
+        interval (float, optional): Time, in seconds, between polls, default 0.25
+    """
+
+    def __init__(self, interval: float = 0.25):
+        self.interval = interval
+
+    def delay(self, elapsed, service=None, version=None) -> float:
+        return self.interval
+
+
+class BackoffPolicy(PollPolicy):
+    """Poll with exponential backoff
+
+    Polls are spaced so each wait is `factor - 1` times the time elapsed since
+    the job was submitted, never less than `initial` nor more than `maximum`.
+    Each delay is scaled by a random factor within ``1 ± jitter`` so many jobs
+    submitted together do not poll in lockstep.
+
+    Args:
+        initial (float, optional): Shortest delay, in seconds, default 0.05
+        factor (float, optional): Growth of the time elapsed between polls,
+            default 1.5
+        maximum (float, optional): Longest delay, in seconds, default 30
+        jitter (float, optional): Fraction of each delay to randomize, default 0.1
+    """
+
+    def __init__(
+        self,
+        initial: float = 0.05,
+        factor: float = 1.5,
+        maximum: float = 30.0,
+        jitter: float = 0.1,
+    ):
+        if initial <= 0 or maximum < initial:
+            raise ValueError("initial must be positive and no more than maximum")
+        if factor <= 1:
+            raise ValueError("factor must be greater than 1")
+        if not 0 <= jitter < 1:
+            raise ValueError("jitter must be at least 0 and less than 1")
+        self.initial = initial
+        self.factor = factor
+        self.maximum = maximum
+        self.jitter = jitter
+
+    def delay(self, elapsed, service=None, version=None) -> float:
+        return self._backoff(elapsed)
+
+    def _backoff(self, elapsed: float) -> float:
+        delay = min(self.maximum, max(self.initial, elapsed * (self.factor - 1)))
+        if self.jitter:
+            delay *= random.uniform(1 - self.jitter, 1 + self.jitter)
+        return delay
+
+
+class AdaptivePolicy(BackoffPolicy):
+    """Poll around the time jobs of a service are expected to finish
+
+    The `waitTime` and `runTime` of finished jobs are averaged per service and
+    version. A job of a service with an estimate is first polled at its
+    expected completion time, then with exponential backoff measured from that
+    time, jobs of other services back off from submission. A single policy may
+    be shared by many clients and threads.
+
+    Args:
+        initial (float, optional): Shortest delay, in seconds, default 0.05
+        factor (float, optional): Growth of the time elapsed between polls,
+            default 1.5
+        maximum (float, optional): Longest delay, in seconds, default 30
+        jitter (float, optional): Fraction of each delay to randomize, default 0.1
+        smoothing (float, optional): Weight of the latest job in the moving
+            average of wait and run times, default 0.2
+    """
+
+    fields = ("waitTime", "runTime")
+
+    def __init__(self, smoothing: float = 0.2, **kwargs):
+        super().__init__(**kwargs)
+        if not 0 < smoothing <= 1:
+            raise ValueError("smoothing must be greater than 0 and at most 1")
+        self.smoothing = smoothing
+        self._estimates: Dict[Tuple, Tuple[float, float]] = {}
+        self._lock = threading.Lock()
+
+    def estimate(
+        self, service: Optional[str], version: Optional[str] = None
+    ) -> Optional[Tuple[float, float]]:
+        """Expected wait and run time, in seconds, of a service's jobs
+
+        Returns:
+            tuple<float>: Wait and run time, or None if no job has finished
+        """
+        with self._lock:
+            return self._estimates.get((service, version))
+
+    def delay(self, elapsed, service=None, version=None) -> float:
+        estimate = self.estimate(service, version)
+        if estimate is None:
+            return self._backoff(elapsed)
+        remaining = sum(estimate) - elapsed
+        if remaining > 0:
+            return min(self.maximum, max(self.initial, remaining))
+        return self._backoff(-remaining)
+
+    def observe(self, service, version, job):
+        if job.get("status") != "complete":
+            return
+        wait_time, run_time = job.get("waitTime"), job.get("runTime")
+        if wait_time is None or run_time is None:
+            return
+        key = (service, version)
+        with self._lock:
+            previous = self._estimates.get(key)
+            if previous is not None:
+                alpha = self.smoothing
+                wait_time = alpha * wait_time + (1 - alpha) * previous[0]
+                run_time = alpha * run_time + (1 - alpha) * previous[1]
+            self._estimates[key] = (wait_time, run_time)
@@ -3,13 +3,18 @@
 # license that can be found in the LICENSE file.
 
 from __future__ import annotations
-import re
 import time
+from concurrent.futures import TimeoutError as FutureTimeoutError
 from typing import Dict, Iterator, List, Optional
 from warnings import warn
 
 from gql import gql
 from .client import MothrClient
+from .payload import as_input_stream, stream_variables
+from .polling import FixedPolicy, PollPolicy
+from .result import LIGHT_FIELDS, JobResult
+from .tracker import RESULT_FIELDS, TERMINAL_STATUSES
+from .validation import S3_URI
 
 
 class JobRequest:
@@ -27,23 +32,32 @@ class JobRequest:
         inputs (list<str>, optional): A list of S3 URIs to be used as
             inputs by the service
         outputs (list<str>, optional): A list of S3 URIs to be uploaded by the service
-        input_stream (str, optional): Value to pass to service through stdin
+        input_stream (str|path|file|bytes|mmap, optional): Value to pass to
+            service through stdin. Strings are passed as they are. Paths, file
+            objects and buffers, such as `mmap.mmap`, are read as the request is
+            sent, see `StreamSource`
         output_metadata (dict): Metadata attached to job outputs
         version (str, optional): Version of the service, default `latest`
     """
 
     def __init__(self, **kwargs):
-        self.client = kwargs.pop("client", MothrClient())
+        client = kwargs.pop("client", None)
+        self.client = client if client is not None else MothrClient()
         kwargs["parameters"] = kwargs.get("parameters", [])
-        kwargs["outputMetadata"] = kwargs.get("output_metadata", {})
+        kwargs["outputMetadata"] = kwargs.pop("output_metadata", {})
+        if "input_stream" in kwargs:
+            kwargs["inputStream"] = as_input_stream(kwargs.pop("input_stream"))
         self.req_args = kwargs
         self.job_id = None
         self.status = None
+        self._cache_key: Optional[str] = None
+        self._cached: Optional[Dict] = None
+        self._submitted = False
 
     @staticmethod
     def is_s3_uri(uri: str) -> bool:
         """Checks if string matches the pattern s3://<bucket>/<key>"""
-        return bool(re.match(r"^s3\:\/\/[a-zA-Z0-9\-\.]+[a-zA-Z]\/\S*?$", uri))
+        return S3_URI.match(uri) is not None
 
     def add_parameter(
         self, value: str, param_type: str = "parameter", name: Optional[str] = None
@@ -91,28 +105,111 @@ class JobRequest:
         self.req_args["outputMetadata"].update(metadata)
         return self
 
+    def request_args(self) -> Dict:
+        """Build the ``JobRequest`` input sent with the ``submitJob`` mutation
+
+        Returns:
+            dict: Request arguments with output metadata as key/value pairs
+        """
+        args = dict(self.req_args)
+        args["outputMetadata"] = [
+            {"key": k, "value": v} for k, v in self.req_args["outputMetadata"].items()
+        ]
+        return args
+
     def submit(self) -> str:
         """Submit the job request
 
+        If the client has a `ResultCache` for the service, the stored result of
+        an identical request is used instead of submitting the request again,
+        and a request identical to one still running shares its job.
+
+        If the client has a `SubmissionJournal` with a job recorded for an
+        identical request, the request is reattached to that job.
+
         Returns:
             str: The unique job identifier
+
+        Raises:
+            ValueError: If the client's `RequestValidator` rejects the request
         """
-        metadata = [{"key": k, "value": v} for k, v in self.req_args["outputMetadata"]]
-        self.req_args["outputMetadata"] = metadata
-        q = self.client.ds.Mutation.submit_job.args(request=self.req_args).select(
-            self.client.ds.JobRequestResponse.job.select(
-                self.client.ds.Job.job_id, self.client.ds.Job.status
-            )
-        )
-        resp = self.client.ds.mutate(q)
+        cache = self.client.result_cache
+        if self._lookup() is not None:
+            return self.job_id
+        if cache is None or self._cache_key is None:
+            return self._submit()
+        self.job_id = cache.coalesce(self._cache_key, self._submit, self._running)
+        return self.job_id
+
+    def _lookup(self) -> Optional[Dict]:
+        """Stored result of an identical request in the client's `ResultCache`"""
+        cache = self.client.result_cache
+        if cache is None or not cache.enabled(self.req_args.get("service")):
+            return None
+        self._cache_key = cache.key(self.req_args)
+        if self._cache_key is None:
+            return None
+        self._cached = cache.get(self._cache_key)
+        if self._cached is not None:
+            self.job_id = self._cached["jobId"]
+            self.status = self._cached["status"]
+        return self._cached
+
+    def _running(self, job_id: str) -> bool:
+        """Whether a job submitted for an identical request is still running"""
+        q = self.client._job_query(job_id, ["status"])
+        return self.client.ds.query(q)["job"]["status"] not in TERMINAL_STATUSES
+
+    def _submit(self) -> str:
+        self._submitted = True
+        resumed = self.client._claim(self)
+        if resumed is not None:
+            return resumed
+        error = self.client.validate([self])[0]
+        if error is not None:
+            raise ValueError(f"Invalid job request: {error}")
+        q = self.client._submit_query(self, "inputStream")
+        streams = stream_variables(self.req_args, "inputStream")
+        with self.client.admit([self]):
+            resp = self.client._mutate([q], streams)
         if "errors" in resp:
             raise ValueError("Error submitting job request: " + resp["errors"])
         job_id = resp["submitJob"]["job"]["jobId"]
         status = resp["submitJob"]["job"]["status"]
         self.job_id = job_id
         self.status = status
+        self.client._record(self)
         return job_id
 
+    def cancel(self) -> str:
+        """Cancel the job
+
+        Returns:
+            str: Job status after cancelling
+
+        Raises:
+            ValueError: If job ID does not exist
+        """
+        if self.job_id is None:
+            raise ValueError("Job ID is None, have you submitted the job?")
+        self.status = self.client.cancel_job(self.job_id)["status"]
+        cache = self.client.result_cache
+        if cache is not None and self._cache_key is not None:
+            cache.release(self._cache_key, self.job_id)
+        return self.status
+
+    def _give_up(self) -> bool:
+        """Stop waiting on the job, returns whether it should be cancelled
+
+        A job shared through the `ResultCache` is only cancelled by the request
+        that submitted it or by the last request waiting on it.
+        """
+        cache = self.client.result_cache
+        if cache is None or self._cache_key is None or self.job_id is None:
+            return True
+        last = cache.leave(self._cache_key, self.job_id)
+        return last or self._submitted
+
     def query_job(self, fields: List[str]) -> Dict[str, str]:
         """Query information about the job request
 
@@ -127,10 +224,7 @@ class JobRequest:
         """
         if self.job_id is None:
             raise ValueError("Job ID is None, have you submitted the job?")
-        fields = [
-            self.client.resolve_field(self.client.ds.Job, field) for field in fields
-        ]
-        q = self.client.ds.Query.job.args(jobId=self.job_id).select(*fields)
+        q = self.client._job_query(self.job_id, fields)
         resp = self.client.ds.query(q)
         return resp["job"]
 
@@ -140,6 +234,8 @@ class JobRequest:
         Returns:
             str: Job status
         """
+        if self._cached is not None:
+            return self._cached["status"]
         job = self.query_job(fields=["status"])
         return job["status"]
 
@@ -149,7 +245,37 @@ class JobRequest:
         Returns:
             dict: Complete response from the job query
         """
-        job = self.query_job(fields=["jobId", "service", "status", "result", "error"])
+        if self._cached is not None:
+            return dict(self._cached)
+        job = self.query_job(fields=RESULT_FIELDS)
+        self._store(job)
+        return job
+
+    def _store(self, result: Dict):
+        """Add a finished job's result to the client's `ResultCache`"""
+        cache = self.client.result_cache
+        if (
+            cache is not None
+            and self._cache_key is not None
+            and self._cached is None
+            and result["status"] in TERMINAL_STATUSES
+        ):
+            cache.set(self._cache_key, result)
+
+    def lazy_result(self) -> JobResult:
+        """Get the job result, fetching large fields only when they are accessed
+
+        Returns:
+            JobResult: Job record with the `jobId`, `service` and `status` fields
+                loaded
+
+        Raises:
+            ValueError: If job ID does not exist
+        """
+        if self.job_id is None:
+            raise ValueError("Job ID is None, have you submitted the job?")
+        job = JobResult(self.client, self.job_id).load(*LIGHT_FIELDS)
+        self.status = job["status"]
         return job
 
     def subscribe(self) -> Dict:
@@ -167,8 +293,9 @@ class JobRequest:
             }}
         """
         )
-        result = list(self.client.ws_client.subscribe(s))
-        return result[0]["subscribeJobComplete"]
+        for result in self.client.ws_client.subscribe(s):
+            return result["subscribeJobComplete"]
+        raise RuntimeError(f"Subscription to job {self.job_id} closed")
 
     def subscribe_messages(self) -> Iterator[str]:
         """Subscribe to intermediate messages published by the job"""
@@ -182,16 +309,72 @@ class JobRequest:
         for result in self.client.ws_client.subscribe(s):
             yield result["subscribeJobMessages"]
 
+    def _poll_result(
+        self, policy: PollPolicy, deadline: Optional[float] = None
+    ) -> Dict[str, str]:
+        """Poll the job status until it finishes and return the result
+
+        Args:
+            policy (PollPolicy): Decides the delay between polls
+            deadline (float, optional): `time.monotonic` time to stop polling
+
+        Returns:
+            dict: The job result
+
+        Raises:
+            TimeoutError: If the job has not finished by the deadline
+        """
+        service = self.req_args.get("service")
+        version = self.req_args.get("version", "latest")
+        fields = ["status", *policy.fields]
+        start = time.monotonic()
+        job = self.query_job(fields=fields)
+        polls = 1
+        while job["status"] not in TERMINAL_STATUSES:
+            delay = policy.delay(time.monotonic() - start, service, version)
+            if deadline is not None:
+                if time.monotonic() >= deadline:
+                    raise TimeoutError(f"Job {self.job_id} did not finish in time")
+                delay = min(delay, deadline - time.monotonic())
+            time.sleep(max(delay, 0.0))
+            job = self.query_job(fields=fields)
+            polls += 1
+        policy.observe(service, version, job)
+        if self.client.metrics is not None:
+            self.client.metrics.observe("job_polls", polls)
+        self.status = job["status"]
+        return self.query_job(fields=RESULT_FIELDS)
+
+    # pylint: disable=too-many-arguments
     def run_job(
-        self, poll_frequency: float = 0.25, return_failed: bool = False
+        self,
+        poll_frequency: float = 0.25,
+        return_failed: bool = False,
+        mode: str = "poll",
+        policy: Optional[PollPolicy] = None,
+        timeout: Optional[float] = None,
     ) -> Dict[str, str]:
         """Execute the job request
 
         Args:
             poll_frequency (float, optional): Frequency, in seconds, to poll for job
-                status. Default, poll 0.25 seconds.
+                status. Default, poll 0.25 seconds. Ignored when a poll policy
+                is given to the request or the client
             return_failed (bool, optional): Return failed job results instead of
                 raising an exception. Default False
+            mode (str, optional): How to wait for the job to finish, one of
+                (`poll`, `track`, `subscribe`). `poll` queries the status of this
+                job alone, `track` waits on the client's shared `JobTracker`, which
+                polls every outstanding job in a single query at its own
+                frequency, and `subscribe` waits for the job's complete event on
+                the client's shared websocket. Default `poll`
+            policy (PollPolicy, optional): Decides the delay between polls in
+                `poll` mode, defaults to the client's `poll_policy`
+            timeout (float, optional): Time, in seconds, to wait for the job
+                after submitting it. The job is cancelled if it has not finished
+                by then, unless it is shared through the client's `ResultCache`
+                with identical requests still waiting on it. Default, wait until
+                the job finishes
 
         Returns:
             dict: The job result
@@ -210,13 +393,48 @@ class JobRequest:
             RuntimeError: If job returns a status of failed, unless explicitly
                 specified to return failed jobs by setting `return_failed`
                 parameter to True
+            ValueError: If mode is not recognized
+            TimeoutError: If the job did not finish within `timeout`
         """
+        if mode not in ("poll", "track", "subscribe"):
+            raise ValueError(f"Unknown run mode: {mode}")
         job_id = self.submit()
-        status = self.check_status()
-        while status in ["submitted", "running"]:
-            status = self.check_status()
-            time.sleep(poll_frequency)
-        result = self.result()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        try:
+            if self._cached is not None:
+                result = dict(self._cached)
+            elif mode == "track":
+                result = self.client.tracker.wait(
+                    job_id,
+                    timeout=timeout,
+                    service=self.req_args.get("service"),
+                    version=self.req_args.get("version", "latest"),
+                )
+                self.status = result["status"]
+            elif mode == "subscribe":
+                future = self.client.subscriptions.watch(job_id)
+                try:
+                    result = future.result(timeout=timeout)
+                except FutureTimeoutError:
+                    # Stop the subscription before cancelling the job
+                    future.cancel()
+                    raise
+                self.status = result["status"]
+            else:
+                if policy is None:
+                    policy = self.client.poll_policy or FixedPolicy(poll_frequency)
+                result = self._poll_result(policy, deadline)
+        except (TimeoutError, FutureTimeoutError):
+            if not self._give_up():
+                raise TimeoutError(
+                    f"Job {job_id} did not finish within {timeout}s"
+                ) from None
+            self.cancel()
+            raise TimeoutError(
+                f"Job {job_id} did not finish within {timeout}s and was cancelled"
+            ) from None
+        self._store(result)
+        status = result["status"]
         if status != "complete" and return_failed is False:
             raise RuntimeError("Job {} failed: {}".format(job_id, result["error"]))
         return result
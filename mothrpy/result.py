@@ -0,0 +1,150 @@
+# Copyright 2020 Resilient Solutions Inc. All rights reserved.
+# Use of this source code is governed by a BSD-style
+# license that can be found in the LICENSE file.
+
+from __future__ import annotations
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Optional, Tuple
+
+from gql.utils import to_camel_case
+
+from .tracker import RESULT_FIELDS
+
+if TYPE_CHECKING:
+    from .client import MothrClient
+
+
+# Fields fetched up front by `JobRequest.lazy_result`
+LIGHT_FIELDS = ("jobId", "service", "status")
+
+# Fields that may be large, released by `JobResult.drop` by default
+HEAVY_FIELDS = (
+    "result",
+    "error",
+    "messages",
+    "parameters",
+    "inputStream",
+    "outputMetadata",
+)
+
+
+class JobResult:
+    """Job record whose fields are fetched on first access
+
+    Fields are read like a dict (``job["status"]``) or as attributes in snake
+    case (``job.run_time``). Missing fields are fetched from MOTHR and kept, use
+    `load` to fetch several fields in one query and `drop` to release large
+    payloads once they are no longer needed. Fields of an object type, like
+    ``parameters``, are fetched with every scalar subfield.
+
+    Args:
+        client (MothrClient): Client connection to MOTHR
+        job_id (str): Job the record belongs to
+        fields (dict, optional): Fields already known for the job
+    """
+
+    __slots__ = ("client", "job_id", "_fields")
+
+    def __init__(self, client: MothrClient, job_id: str, fields: Optional[Dict] = None):
+        self.client = client
+        self.job_id = job_id
+        self._fields: Dict[str, Any] = dict(fields) if fields is not None else {}
+
+    def __repr__(self) -> str:
+        return (
+            f"JobResult(job_id={self.job_id!r}, status={self._fields.get('status')!r})"
+        )
+
+    def __getitem__(self, field: str) -> Any:
+        name = to_camel_case(field)
+        if name not in self._fields:
+            self.load(name)
+        return self._fields[name]
+
+    def __getattr__(self, name: str) -> Any:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        try:
+            return self[name]
+        except KeyError as e:
+            raise AttributeError(name) from e
+
+    def __contains__(self, field: str) -> bool:
+        return to_camel_case(field) in self._fields
+
+    @property
+    def loaded(self) -> Tuple[str, ...]:
+        """Names of the fields currently held in memory"""
+        return tuple(self._fields)
+
+    def get(self, field: str, default: Any = None) -> Any:
+        """Get a field, or `default` if the field does not exist"""
+        try:
+            return self[field]
+        except KeyError:
+            return default
+
+    def load(self, *fields: str) -> JobResult:
+        """Fetch fields in a single query, replacing any values already held
+
+        Args:
+            fields (str): Fields to fetch, defaults to the fields already loaded
+
+        Returns:
+            JobResult: self
+
+        Raises:
+            KeyError: If a field does not exist
+            ValueError: If the job does not exist
+        """
+        names = [to_camel_case(f) for f in fields] if fields else list(self._fields)
+        q = self.client._job_query(self.job_id, self._paths(names))
+        job = self.client.ds.query(q)["job"]
+        if job is None:
+            raise ValueError(f"Job {self.job_id} not found")
+        self._fields.update(job)
+        return self
+
+    def refresh(self) -> str:
+        """Fetch the current job status
+
+        Returns:
+            str: Job status
+        """
+        return self.load("status")["status"]
+
+    def drop(self, *fields: str):
+        """Release fields held in memory, they are fetched again when accessed
+
+        Args:
+            fields (str): Fields to release, default `result`, `error`,
+                `messages`, `parameters`, `inputStream` and `outputMetadata`
+        """
+        for field in fields or HEAVY_FIELDS:
+            self._fields.pop(to_camel_case(field), None)
+
+    def to_dict(self, fields: Optional[Iterable[str]] = None) -> Dict[str, Any]:
+        """Get several fields as a dict, missing fields are fetched in one query
+
+        Args:
+            fields (list<str>, optional): Fields to include, default `jobId`,
+                `service`, `status`, `result` and `error`
+        """
+        names = [to_camel_case(f) for f in fields or RESULT_FIELDS]
+        missing = [name for name in names if name not in self._fields]
+        if missing:
+            self.load(*missing)
+        return {name: self._fields[name] for name in names}
+
+    def _paths(self, names: List[str]) -> List[str]:
+        """Field paths selecting every scalar subfield of object fields"""
+        selections = self.client.selections
+        paths = []
+        for name in names:
+            type_name = selections.field_type("Job", name)
+            try:
+                leaves = selections.leaf_fields(type_name)
+            except KeyError:
+                paths.append(name)
+                continue
+            paths.extend(f"{name}.{leaf}" for leaf in leaves)
+        return paths
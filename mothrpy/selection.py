@@ -0,0 +1,217 @@
+# Copyright 2020 Resilient Solutions Inc. All rights reserved.
+# Use of this source code is governed by a BSD-style
+# license that can be found in the LICENSE file.
+
+import threading
+from copy import copy
+from typing import Dict, Hashable, Iterable, List, Optional, Sequence, Set, Tuple
+
+from gql import Client
+from gql.utils import to_camel_case
+from graphql import (
+    DocumentNode,
+    FieldNode,
+    GraphQLObjectType,
+    GraphQLSchema,
+    ListValueNode,
+    NameNode,
+    Node,
+    ObjectValueNode,
+    OperationDefinitionNode,
+    SelectionSetNode,
+    ValueNode,
+    VariableNode,
+    get_named_type,
+    is_leaf_type,
+)
+from graphql.pyutils import FrozenList
+
+
+# Default number of entries kept by the selection and validation caches
+CACHE_SIZE = 1024
+
+
+class SelectionCache:
+    """Compiled selection sets for dotted field paths
+
+    Field paths are resolved against the schema, so any nested field can be
+    selected using dot notation (e.g., ``parameters.fileType.name``) and snake
+    case names are converted to camel case. Compiled selection sets are cached by
+    type name and field paths and shared between documents, they must not be
+    modified, use `copy_selection_set` before attaching one to a field.
+
+    Args:
+        schema (`graphql.GraphQLSchema`): Schema used to resolve field paths
+        maxsize (int, optional): Maximum number of cached selection sets,
+            default 1024
+    """
+
+    def __init__(self, schema: GraphQLSchema, maxsize: int = CACHE_SIZE):
+        self.schema = schema
+        self.maxsize = maxsize
+        self._cache: Dict[Tuple[str, Tuple[str, ...]], SelectionSetNode] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+    def selection_set(self, type_name: str, fields: Iterable[str]) -> SelectionSetNode:
+        """Get the selection set for fields of a type
+
+        Args:
+            type_name (str): Name of the type the fields belong to
+            fields (list<str>): Fields to select, nested fields are specified
+                using dot notation
+
+        Returns: `graphql.SelectionSetNode`
+
+        Raises:
+            KeyError: If a field does not exist
+        """
+        key = (type_name, tuple(fields))
+        selection_set = self._cache.get(key)
+        if selection_set is None:
+            selection_set = self._compile(self._object_type(type_name), key[1])
+            with self._lock:
+                if len(self._cache) >= self.maxsize:
+                    self._cache.clear()
+                self._cache[key] = selection_set
+        return selection_set
+
+    def field_type(self, type_name: str, field: str) -> str:
+        """Name of the type returned by a field, ignoring lists and non-null"""
+        object_type = self._object_type(type_name)
+        name = self._field_name(object_type, field)
+        return get_named_type(object_type.fields[name].type).name
+
+    def leaf_fields(self, type_name: str) -> List[str]:
+        """Names of the scalar and enum fields of a type"""
+        object_type = self._object_type(type_name)
+        return [
+            name
+            for name, field in object_type.fields.items()
+            if is_leaf_type(get_named_type(field.type))
+        ]
+
+    def _object_type(self, type_name: str) -> GraphQLObjectType:
+        object_type = self.schema.get_type(type_name)
+        if not isinstance(object_type, GraphQLObjectType):
+            raise KeyError(f"Type {type_name} does not exist or has no fields.")
+        return object_type
+
+    @staticmethod
+    def _field_name(object_type: GraphQLObjectType, field: str) -> str:
+        if field in object_type.fields:
+            return field
+        camel_cased = to_camel_case(field)
+        if camel_cased in object_type.fields:
+            return camel_cased
+        raise KeyError(f"Field {field} does not exist in type {object_type.name}.")
+
+    def _compile(
+        self, object_type: GraphQLObjectType, fields: Sequence[str]
+    ) -> SelectionSetNode:
+        # Group paths by their first component so shared prefixes are only
+        # selected once, e.g. `parameters { name fileType { name } }`
+        nested: Dict[str, list] = {}
+        for field in fields:
+            head, _, tail = field.partition(".")
+            name = self._field_name(object_type, head)
+            paths = nested.setdefault(name, [])
+            if tail:
+                paths.append(tail)
+
+        selections = []
+        for name, paths in nested.items():
+            node = FieldNode(name=NameNode(value=name), arguments=FrozenList())
+            if paths:
+                field_type = get_named_type(object_type.fields[name].type)
+                if not isinstance(field_type, GraphQLObjectType):
+                    raise KeyError(
+                        f"Field {name} of type {object_type.name} has no subfields."
+                    )
+                node.selection_set = self._compile(field_type, paths)
+            selections.append(node)
+        return SelectionSetNode(selections=FrozenList(selections))
+
+
+def copy_selection_set(node: SelectionSetNode) -> SelectionSetNode:
+    """Copy of a selection set that can be extended without changing the original
+
+    Nested selection sets are still shared, only the top level selections can be
+    modified, e.g. by `gql.dsl.DSLField.select`.
+    """
+    selection_set = copy(node)
+    selection_set.selections = FrozenList(node.selections)
+    return selection_set
+
+
+def document_shape(node: Node) -> Optional[Hashable]:
+    """Structure of a document ignoring scalar argument values
+
+    Documents with the same shape only differ by the literal values of their
+    arguments, which the DSL has already serialized according to the schema.
+
+    Returns:
+        hashable: Shape of the document or None if the document uses features,
+            such as variables, fragments or directives, that are not captured by
+            its shape
+    """
+    try:
+        return _shape(node)
+    except _UnsupportedNode:
+        return None
+
+
+class _UnsupportedNode(Exception):
+    pass
+
+
+def _shape(node: Node) -> Hashable:  # pylint: disable=too-many-return-statements
+    if isinstance(node, DocumentNode):
+        return tuple(_shape(d) for d in node.definitions)
+    if isinstance(node, OperationDefinitionNode):
+        if node.variable_definitions or node.directives:
+            raise _UnsupportedNode()
+        return (node.operation.value, _shape(node.selection_set))
+    if isinstance(node, SelectionSetNode):
+        return tuple(_shape(s) for s in node.selections)
+    if isinstance(node, FieldNode) and not node.directives:
+        return (
+            node.name.value,
+            node.alias.value if node.alias else None,
+            tuple((arg.name.value, _shape(arg.value)) for arg in node.arguments or ()),
+            _shape(node.selection_set) if node.selection_set else None,
+        )
+    if isinstance(node, ObjectValueNode):
+        return tuple((f.name.value, _shape(f.value)) for f in node.fields)
+    if isinstance(node, ListValueNode):
+        return frozenset(_shape(v) for v in node.values)
+    if isinstance(node, ValueNode) and not isinstance(node, VariableNode):
+        return node.kind
+    raise _UnsupportedNode()
+
+
+class CachedValidationClient(Client):
+    """gql client that validates each distinct document shape only once
+
+    Args:
+        validated (set, optional): Shapes that have already been validated
+            against the client's schema, pass the same set to share validation
+            results between clients using the same schema
+    """
+
+    def __init__(self, *args, validated: Optional[Set[Hashable]] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._validated: Set[Hashable] = validated if validated is not None else set()
+
+    def validate(self, document: DocumentNode):
+        shape = document_shape(document)
+        if shape is not None and shape in self._validated:
+            return
+        super().validate(document)
+        if shape is None:
+            return
+        if len(self._validated) >= CACHE_SIZE:
+            self._validated.clear()
+        self._validated.add(shape)
@@ -0,0 +1,251 @@
+# Copyright 2020 Resilient Solutions Inc. All rights reserved.
+# Use of this source code is governed by a BSD-style
+# license that can be found in the LICENSE file.
+
+from __future__ import annotations
+import asyncio
+import random
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import Future
+from typing import TYPE_CHECKING, Deque, Dict, Iterator, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    from .subscriptions import SubscriptionManager
+
+
+# What to do with a message that arrives while a job's buffer is full
+OVERFLOW_POLICIES = ("block", "drop_oldest", "sample")
+
+
+class MessageStream:  # pylint: disable=too-many-instance-attributes
+    """Intermediate messages of many jobs merged into one stream
+
+    Each job's ``subscribeJobMessages`` subscription shares the websocket of the
+    `SubscriptionManager`, and messages are held in a buffer of at most
+    `maxsize` messages per job until they are consumed with `get_batch` or by
+    iterating over the stream. A job's stream ends once the job completes and
+    the messages received before its complete event have been buffered.
+
+    When a job's buffer is full, the `overflow` policy decides what happens to
+    a new message:
+
+    - ``block``: Stop reading the job's subscription until the consumer makes
+      room, no messages are lost. Messages keep arriving in the meantime and
+      wait in the websocket transport's queue, which is unbounded
+    - ``drop_oldest``: Discard the oldest buffered message
+    - ``sample``: Keep a uniform random sample of the messages received since
+      the buffer was last drained, in the order they arrived
+
+    Memory is only bounded by `maxsize` with ``drop_oldest`` and ``sample``,
+    messages discarded by them are counted in `dropped`.
+
+    Args:
+        manager (SubscriptionManager): Manager owning the websocket
+        maxsize (int, optional): Maximum number of buffered messages per job,
+            default 1000
+        overflow (str, optional): One of (`block`, `drop_oldest`, `sample`),
+            default `block`
+    """
+
+    def __init__(
+        self, manager: SubscriptionManager, maxsize: int = 1000, overflow: str = "block"
+    ):
+        if maxsize < 1:
+            raise ValueError("maxsize must be at least 1")
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy: {overflow}")
+        self.manager = manager
+        self.maxsize = maxsize
+        self.overflow = overflow
+        self.dropped: Counter = Counter()
+        self.errors: Dict[str, BaseException] = {}
+        self._buffers: Dict[str, Deque[str]] = {}
+        self._subscriptions: Dict[str, Tuple[Future, Future]] = {}
+        self._received: Counter = Counter()
+        self._space: Dict[str, asyncio.Event] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._cond = threading.Condition()
+        self._closed = False
+
+    def __len__(self) -> int:
+        with self._cond:
+            return sum(len(buffer) for buffer in self._buffers.values())
+
+    def __iter__(self) -> Iterator[Tuple[str, str]]:
+        while True:
+            batch = self.get_batch(self.maxsize)
+            if not batch:
+                return
+            yield from batch
+
+    def __enter__(self) -> MessageStream:
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def active(self) -> List[str]:
+        """Jobs whose messages are still being received"""
+        with self._cond:
+            return list(self._subscriptions)
+
+    @property
+    def done(self) -> bool:
+        """Whether every job has completed and every message has been consumed"""
+        with self._cond:
+            return self._exhausted()
+
+    def add(self, job_id: str):
+        """Start receiving a job's messages
+
+        Args:
+            job_id (str): Job to receive messages from
+        """
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Message stream is closed")
+            if job_id in self._subscriptions:
+                return
+            self._buffers.setdefault(job_id, deque())
+            complete = self.manager.watch(job_id)
+            # Messages received before the complete event are still buffered
+            messages = self.manager.subscribe_messages(
+                job_id, self._put, until=complete
+            )
+            self._subscriptions[job_id] = (messages, complete)
+        messages.add_done_callback(lambda f: self._finish(job_id, f))
+        complete.add_done_callback(lambda f: self._record(job_id, f))
+
+    def remove(self, job_id: str):
+        """Stop receiving a job's messages, buffered messages are kept"""
+        self._finish(job_id)
+
+    def get_batch(
+        self, max_items: int = 100, timeout: Optional[float] = None
+    ) -> List[Tuple[str, str]]:
+        """Wait for messages and take up to `max_items` of them
+
+        When messages of several jobs are buffered, each job contributes an
+        equal share of the batch.
+
+        Args:
+            max_items (int, optional): Maximum number of messages returned,
+                default 100
+            timeout (float, optional): Maximum time, in seconds, to wait for a
+                message. Default, wait until a message arrives or every job
+                has completed
+
+        Returns:
+            list<tuple>: `(job_id, message)` pairs, each job's messages in the
+                order they were received. Empty if the timeout expired or no
+                messages remain
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while not any(self._buffers.values()):
+                if self._closed or self._exhausted():
+                    return []
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return []
+                self._cond.wait(remaining)
+            return self._drain(max_items)
+
+    def close(self):
+        """Stop receiving messages and discard buffered messages"""
+        with self._cond:
+            self._closed = True
+            subscriptions = list(self._subscriptions.values())
+            self._subscriptions.clear()
+            self._buffers.clear()
+            self._cond.notify_all()
+        for messages, complete in subscriptions:
+            messages.cancel()
+            complete.cancel()
+        self._wake(list(self._space))
+
+    def _exhausted(self) -> bool:
+        return not self._subscriptions and not any(self._buffers.values())
+
+    def _drain(self, max_items: int) -> List[Tuple[str, str]]:
+        """Take messages from the buffers, an equal share from each job"""
+        batch: List[Tuple[str, str]] = []
+        ready = [job_id for job_id, buffer in self._buffers.items() if buffer]
+        while ready and len(batch) < max_items:
+            share = max(1, (max_items - len(batch)) // len(ready))
+            for job_id in ready:
+                buffer = self._buffers[job_id]
+                for _ in range(min(share, len(buffer), max_items - len(batch))):
+                    batch.append((job_id, buffer.popleft()))
+            ready = [job_id for job_id in ready if self._buffers[job_id]]
+        drained = {job_id for job_id, _ in batch}
+        for job_id in drained:
+            self._received.pop(job_id, None)
+            if not self._buffers[job_id] and job_id not in self._subscriptions:
+                del self._buffers[job_id]
+        self._wake([job_id for job_id in drained if job_id in self._space])
+        return batch
+
+    def _wake(self, job_ids: List[str]):
+        """Resume producers blocked on full buffers"""
+        if self._loop is None:
+            return
+        for job_id in job_ids:
+            event = self._space.get(job_id)
+            if event is not None:
+                self._loop.call_soon_threadsafe(event.set)
+
+    async def _put(self, job_id: str, message: str):
+        """Add a message to a job's buffer, applying the overflow policy"""
+        self._loop = asyncio.get_event_loop()
+        while True:
+            with self._cond:
+                buffer = self._buffers.get(job_id)
+                if buffer is None or self._closed:
+                    return
+                self._received[job_id] += 1
+                if len(buffer) < self.maxsize:
+                    buffer.append(message)
+                    self._cond.notify_all()
+                    return
+                if self.overflow == "drop_oldest":
+                    buffer.popleft()
+                    buffer.append(message)
+                    self.dropped[job_id] += 1
+                    return
+                if self.overflow == "sample":
+                    self.dropped[job_id] += 1
+                    if random.random() < self.maxsize / self._received[job_id]:
+                        del buffer[random.randrange(len(buffer))]
+                        buffer.append(message)
+                    return
+                self._received[job_id] -= 1
+                event = self._space.setdefault(job_id, asyncio.Event())
+                event.clear()
+            await event.wait()
+
+    def _record(self, job_id: str, future: Future):
+        """Keep the error a job's subscription failed with"""
+        if not future.cancelled():
+            error = future.exception()
+            if error is not None:
+                self.errors.setdefault(job_id, error)
+
+    def _finish(self, job_id: str, future: Optional[Future] = None):
+        """Stop a job's subscriptions, keeping its buffered messages"""
+        if future is not None:
+            self._record(job_id, future)
+        with self._cond:
+            subscriptions = self._subscriptions.pop(job_id, None)
+            if subscriptions is None:
+                return
+            if not self._buffers.get(job_id):
+                self._buffers.pop(job_id, None)
+            self._cond.notify_all()
+        for subscription in subscriptions:
+            subscription.cancel()
+        self._wake([job_id])
+        self._space.pop(job_id, None)
@@ -0,0 +1,536 @@
+# Copyright 2020 Resilient Solutions Inc. All rights reserved.
+# Use of this source code is governed by a BSD-style
+# license that can be found in the LICENSE file.
+
+from __future__ import annotations
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import Future
+from contextvars import ContextVar
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    AsyncGenerator,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterable,
+    Optional,
+    Tuple,
+)
+
+from gql import Client
+from gql.client import AsyncClientSession
+from gql.dsl import DSLField, query as dsl_query
+from gql.transport.exceptions import TransportError, TransportQueryError
+from gql.transport.websockets import WebsocketsTransport
+from websockets.exceptions import ConnectionClosed
+
+from .stream import MessageStream
+from .tracker import RESULT_FIELDS, TERMINAL_STATUSES
+
+if TYPE_CHECKING:
+    from .client import MothrClient
+
+
+log = logging.getLogger(__name__)
+
+# Errors after which the websocket is re-established and the job resubscribed
+RECONNECT_ERRORS = (
+    TransportError,
+    ConnectionClosed,
+    ConnectionError,
+    OSError,
+    asyncio.TimeoutError,
+)
+
+# Set once the operation of the subscription running in a task has been sent
+_SENT: ContextVar[Optional[asyncio.Event]] = ContextVar("sent", default=None)
+
+
+class SubscriptionManager:  # pylint: disable=too-many-instance-attributes
+    """Wait for job completion over a single, persistent websocket
+
+    Every ``subscribeJobComplete`` operation is multiplexed over one websocket
+    connection owned by an event loop running in a background thread. If the
+    connection drops it is re-established and every pending subscription is
+    resubscribed. After subscribing, the job status is queried once so jobs that
+    finished before the subscription was active are still resolved.
+
+    Args:
+        client (MothrClient): Client connection to MOTHR
+        reconnect_delay (float, optional): Initial delay, in seconds, before
+            reconnecting after the websocket closes, default 0.5
+        max_reconnect_delay (float, optional): Maximum delay, in seconds, between
+            reconnection attempts, default 30
+    """
+
+    def __init__(
+        self,
+        client: MothrClient,
+        reconnect_delay: float = 0.5,
+        max_reconnect_delay: float = 30.0,
+    ):
+        self.client = client
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._connect_lock: Optional[asyncio.Lock] = None
+        self._session: Optional[AsyncClientSession] = None
+        self._generation = 0
+        self._tasks: Dict[Future, asyncio.Future] = {}
+
+    def __len__(self) -> int:
+        return len(self._tasks)
+
+    def watch(
+        self, job_id: str, callback: Optional[Callable[[Dict], None]] = None
+    ) -> Future:
+        """Subscribe to a job's complete event
+
+        Args:
+            job_id (str): Job to watch
+            callback (callable, optional): Called with the job result once the job
+                completes
+
+        Returns:
+            `concurrent.futures.Future`: Resolved with the job result once the job
+                is `complete`, `failed` or `cancelled`
+        """
+        future = self._spawn(f"Job {job_id}", lambda s: self._wait_complete(s, job_id))
+        if callback is not None:
+            future.add_done_callback(
+                lambda f: f.cancelled() or f.exception() or callback(f.result())
+            )
+        return future
+
+    def wait(self, job_id: str, timeout: Optional[float] = None) -> Dict:
+        """Block until a job's complete event is received
+
+        Args:
+            job_id (str): Job to wait for
+            timeout (float, optional): Maximum time, in seconds, to wait
+
+        Returns:
+            dict: The job result
+        """
+        return self.watch(job_id).result(timeout=timeout)
+
+    def listen(self, event: str, callback: Callable[[Dict], Any]) -> Future:
+        """Subscribe to an event channel
+
+        The subscription is re-established if the websocket closes, events
+        published while reconnecting are missed.
+
+        Args:
+            event (str): Event channel to subscribe to
+            callback (callable): Called with each event's `channel` and `message`
+
+        Returns:
+            `concurrent.futures.Future`: Cancel to stop listening, resolved with an
+                exception if the subscription fails
+        """
+        return self._spawn(f"Event {event}", lambda s: self._listen(s, event, callback))
+
+    def subscribe_messages(
+        self,
+        job_id: str,
+        callback: Callable[[str, str], Awaitable],
+        until: Optional[Future] = None,
+    ) -> Future:
+        """Subscribe to a job's intermediate messages
+
+        The subscription is re-established if the websocket closes, messages
+        published while reconnecting are missed. See `stream` to consume the
+        messages of many jobs from another thread.
+
+        Args:
+            job_id (str): Job publishing the messages
+            callback (coroutine function): Awaited with the job ID and each
+                message on the subscription event loop, no further messages are
+                read from the subscription until it returns
+            until (`concurrent.futures.Future`, optional): Once done, e.g. the
+                future returned by `watch`, the messages already received are
+                passed to `callback` and the subscription stops
+
+        Returns:
+            `concurrent.futures.Future`: Cancel to stop listening, resolved with
+                None once `until` is done and the received messages are read,
+                or with an exception if the subscription fails
+        """
+        stopped = self._stopped(until)
+        return self._spawn(
+            f"Messages of job {job_id}",
+            lambda s: self._messages(s, job_id, callback, stopped),
+        )
+
+    def stream(
+        self,
+        job_ids: Iterable[str] = (),
+        maxsize: int = 1000,
+        overflow: str = "block",
+    ) -> MessageStream:
+        """Merge the intermediate messages of many jobs into one stream
+
+        Args:
+            job_ids (list<str>, optional): Jobs to receive messages from, more
+                can be added with `MessageStream.add`
+            maxsize (int, optional): Maximum number of buffered messages per job,
+                default 1000
+            overflow (str, optional): What to do with messages received while a
+                job's buffer is full, one of (`block`, `drop_oldest`, `sample`),
+                default `block`
+
+        Returns:
+            MessageStream: Stream of `(job_id, message)` pairs
+        """
+        stream = MessageStream(self, maxsize=maxsize, overflow=overflow)
+        for job_id in job_ids:
+            stream.add(job_id)
+        return stream
+
+    def close(self):
+        """Cancel pending subscriptions and close the websocket"""
+        with self._lock:
+            loop, thread = self._loop, self._thread
+            self._loop = self._thread = None
+        if loop is None or thread is None:
+            return
+        asyncio.run_coroutine_threadsafe(self._shutdown(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+
+    def _spawn(
+        self, name: str, operation: Callable[[AsyncClientSession], Awaitable]
+    ) -> Future:
+        """Run a subscription operation on the websocket's event loop"""
+        future: Future = Future()
+        loop = self._start()
+        coroutine = self._reconnecting(future, name, operation)
+        asyncio.run_coroutine_threadsafe(self._register(coroutine, future), loop)
+        return future
+
+    def _start(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(
+                    target=self._run,
+                    args=(self._loop,),
+                    name="mothrpy-subscriptions",
+                    daemon=True,
+                )
+                self._thread.start()
+            return self._loop
+
+    @staticmethod
+    def _run(loop: asyncio.AbstractEventLoop):
+        asyncio.set_event_loop(loop)
+        loop.run_forever()
+
+    async def _register(self, coroutine: Awaitable, future: Future):
+        loop = asyncio.get_event_loop()
+        task = asyncio.ensure_future(coroutine)
+        self._tasks[future] = task
+        task.add_done_callback(lambda _: self._tasks.pop(future, None))
+        future.add_done_callback(
+            lambda f: f.cancelled() and loop.call_soon_threadsafe(task.cancel)
+        )
+
+    async def _reconnecting(
+        self,
+        future: Future,
+        name: str,
+        operation: Callable[[AsyncClientSession], Awaitable[Dict]],
+    ):
+        """Run a subscription operation until it succeeds, reconnecting on errors"""
+        delay = self.reconnect_delay
+        while not future.done():
+            generation = self._generation
+            try:
+                session, generation = await self._connect()
+                result = await operation(session)
+            except asyncio.CancelledError:  # pylint: disable=try-except-raise
+                # Still a subclass of Exception on Python 3.7
+                raise
+            except TransportQueryError as e:
+                _set_exception(future, ValueError(f"{name}: {e}"))
+                return
+            except RECONNECT_ERRORS as e:
+                log.warning("%s subscription lost: %r", name, e)
+                if self.client.metrics is not None:
+                    self.client.metrics.increment("subscription_reconnects_total")
+                await self._reset(generation)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.max_reconnect_delay)
+                continue
+            except Exception as e:
+                _set_exception(future, e)
+                return
+            _set_result(future, result)
+
+    async def _wait_complete(self, session: AsyncClientSession, job_id: str) -> Dict:
+        start = time.perf_counter()
+        task = await subscription_task(self._subscribe(session, job_id))
+        try:
+            # A job that finished before the subscription became active never
+            # publishes its complete event, look it up once to close that race
+            job = await self._query_job(job_id)
+            if job is not None and job["status"] in TERMINAL_STATUSES:
+                result = job
+            else:
+                result = await task
+        finally:
+            # gql ends a cancelled subscription without raising, which fails
+            # the task with a ConnectionError that must still be retrieved
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        if self.client.metrics is not None:
+            self.client.metrics.observe(
+                "subscription_seconds",
+                time.perf_counter() - start,
+                operation="subscribeJobComplete",
+            )
+        return result
+
+    async def _subscribe(self, session: AsyncClientSession, job_id: str) -> Dict:
+        q = self.client.ds.Subscription.subscribe_job_complete.args(jobId=job_id)
+        q = self.client.select(q, "Job", RESULT_FIELDS)
+        result = await first_result(session, q)
+        if result is None:
+            raise ConnectionError("Subscription closed before the job completed")
+        return result["subscribeJobComplete"]
+
+    async def _listen(
+        self,
+        session: AsyncClientSession,
+        event: str,
+        callback: Callable[[Dict], Any],
+    ) -> Dict:
+        q = self.client.ds.Subscription.subscribe_event.args(event=event)
+        q = self.client.select(q, "Event", ["channel", "message"])
+        generator = subscribe(session, q)
+        try:
+            async for result in generator:
+                if result["subscribeEvent"] is not None:
+                    callback(result["subscribeEvent"])
+        finally:
+            await generator.aclose()
+        raise ConnectionError(f"Subscription to event {event} closed")
+
+    async def _messages(
+        self,
+        session: AsyncClientSession,
+        job_id: str,
+        callback: Callable[[str, str], Awaitable],
+        stopped: asyncio.Future,
+    ) -> None:
+        q = self.client.ds.Subscription.subscribe_job_messages.args(jobId=job_id)
+        generator = subscribe(session, q)
+        try:
+            while True:
+                result = await _received(generator, stopped)
+                if result is None:
+                    break
+                if result["subscribeJobMessages"] is not None:
+                    await callback(job_id, result["subscribeJobMessages"])
+        finally:
+            await generator.aclose()
+        if not stopped.done():
+            raise ConnectionError(f"Subscription to messages of job {job_id} closed")
+
+    def _stopped(self, until: Optional[Future]) -> asyncio.Future:
+        """Future of the subscription event loop done once `until` is done"""
+        loop = self._start()
+        stopped = loop.create_future()
+
+        def stop():
+            if not stopped.done():
+                stopped.set_result(None)
+
+        if until is not None:
+            until.add_done_callback(lambda _: loop.call_soon_threadsafe(stop))
+        return stopped
+
+    async def _query_job(self, job_id: str) -> Optional[Dict]:
+        loop = asyncio.get_event_loop()
+        q = self.client._job_query(job_id, RESULT_FIELDS)
+        try:
+            resp = await loop.run_in_executor(None, self.client.ds.query, q)
+        except Exception as e:
+            log.warning("Status check for job %s failed: %r", job_id, e)
+            return None
+        return resp["job"]
+
+    async def _connect(self) -> Tuple[AsyncClientSession, int]:
+        if self._connect_lock is None:
+            self._connect_lock = asyncio.Lock()
+        async with self._connect_lock:
+            if self._session is None:
+                transport = _Transport(
+                    url=self.client.ws_url, headers=dict(self.client.headers)
+                )
+                ws_client = Client(transport=transport, schema=self.client.ds.schema)
+                await transport.connect()
+                self._session = AsyncClientSession(client=ws_client)
+                self._generation += 1
+            return self._session, self._generation
+
+    async def _reset(self, generation: int):
+        """Drop the connection if it has not already been replaced"""
+        if self._connect_lock is None:
+            return
+        async with self._connect_lock:
+            if self._session is None or generation != self._generation:
+                return
+            session, self._session = self._session, None
+        try:
+            await session.transport.close()
+        except Exception as e:
+            log.debug("Error closing websocket: %r", e)
+
+    async def _shutdown(self):
+        futures, tasks = list(self._tasks), list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for future in futures:
+            future.cancel()
+        await self._reset(self._generation)
+
+
+class _Transport(WebsocketsTransport):
+    """Websocket transport reporting when each subscription has been sent"""
+
+    async def _send_query(self, *args, **kwargs) -> int:
+        query_id = await super()._send_query(*args, **kwargs)
+        # The listener for the operation is registered before the task yields
+        subscription_sent()
+        return query_id
+
+
+async def subscription_task(coroutine: Awaitable) -> asyncio.Future:
+    """Run a subscription in a task, returning once its operation is sent
+
+    The protocol does not acknowledge operations, but once the operation is
+    sent, events the server publishes for it are received. Returns early if the
+    task ends before sending it, e.g. when the connection is lost.
+
+    Args:
+        coroutine (coroutine): Subscribes over the websocket
+
+    Returns:
+        `asyncio.Future`: The task running the subscription
+    """
+    sent = asyncio.Event()
+    token = _SENT.set(sent)
+    try:
+        task = asyncio.ensure_future(coroutine)
+    finally:
+        _SENT.reset(token)
+    waiter = asyncio.ensure_future(sent.wait())
+    try:
+        await asyncio.wait([task, waiter], return_when=asyncio.FIRST_COMPLETED)
+    except asyncio.CancelledError:
+        task.cancel()
+        raise
+    finally:
+        waiter.cancel()
+    return task
+
+
+async def subscribe(
+    session: AsyncClientSession, field: DSLField
+) -> AsyncGenerator[Dict, None]:
+    """Subscribe to a field, like `gql.client.AsyncClientSession.subscribe`
+
+    Closing the session's generator leaves the transport's generator it wraps
+    suspended, with its operation still registered, so closing the websocket
+    waits for the transport's close timeout. The transport's generator is
+    closed here with the one returned, which stops the operation.
+
+    Yields:
+        dict: Data of each result
+
+    Raises:
+        TransportQueryError: If a result has errors
+    """
+    document = dsl_query(field, operation="subscription")
+    session.client.validate(document)
+    generator = session.transport.subscribe(document)
+    try:
+        async for result in generator:
+            if result.errors:
+                raise TransportQueryError(
+                    str(result.errors[0]), errors=result.errors, data=result.data
+                )
+            if result.data is not None:
+                yield result.data
+    finally:
+        await generator.aclose()
+
+
+async def first_result(session: AsyncClientSession, field: DSLField) -> Optional[Dict]:
+    """Subscribe until the first result is received, then stop the subscription
+
+    Returns:
+        dict: The first result, None if the subscription closed without one
+    """
+    generator = subscribe(session, field)
+    try:
+        async for result in generator:
+            return result
+    finally:
+        await generator.aclose()
+    return None
+
+
+async def _received(
+    generator: AsyncGenerator, stopped: asyncio.Future
+) -> Optional[Dict]:
+    """Next result of a subscription, None once it ends
+
+    Once `stopped` is done, results already received are still returned but
+    the subscription ends as soon as it would wait for another one.
+    """
+    # anext() is only built in from Python 3.10
+    # pylint: disable=unnecessary-dunder-call
+    task = asyncio.ensure_future(generator.__anext__())
+    try:
+        if not stopped.done():
+            await asyncio.wait([task, stopped], return_when=asyncio.FIRST_COMPLETED)
+        if not task.done():
+            # Let a result that is already queued be read without waiting
+            await asyncio.sleep(0)
+    finally:
+        if not task.done():
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+    if task.cancelled():
+        return None
+    try:
+        return task.result()
+    except StopAsyncIteration:
+        return None
+
+
+def subscription_sent():
+    """Report that the subscription of the current task has been sent"""
+    sent = _SENT.get()
+    if sent is not None:
+        sent.set()
+
+
+def _set_result(future: Future, result: Dict):
+    if not future.done():
+        future.set_result(result)
+
+
+def _set_exception(future: Future, exception: Exception):
+    if not future.done():
+        future.set_exception(exception)
@@ -0,0 +1,340 @@
+# Copyright 2020 Resilient Solutions Inc. All rights reserved.
+# Use of this source code is governed by a BSD-style
+# license that can be found in the LICENSE file.
+
+from __future__ import annotations
+import logging
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional
+
+from gql.transport.exceptions import TransportQueryError
+
+from .batch import MAX_BATCH_SIZE, alias, chunks, errors_by_alias
+from .polling import PollPolicy
+
+if TYPE_CHECKING:
+    from .client import MothrClient
+
+
+log = logging.getLogger(__name__)
+
+# Job statuses that will not change again
+TERMINAL_STATUSES = ("complete", "failed", "cancelled")
+
+# Fields returned for a finished job
+RESULT_FIELDS = ["jobId", "service", "status", "result", "error"]
+
+
+class _Schedule:  # pylint: disable=too-few-public-methods
+    """When a tracked job is next polled"""
+
+    __slots__ = ("service", "version", "started", "due")
+
+    def __init__(
+        self, service: Optional[str], version: Optional[str], started: float, due: float
+    ):
+        self.service = service
+        self.version = version
+        self.started = started
+        self.due = due
+
+
+class JobTracker:  # pylint: disable=too-many-instance-attributes
+    """Track many outstanding jobs with a single status query per poll
+
+    Every job being tracked is polled with one aliased multi-``job`` query per
+    chunk, the result fields are fetched in the same query so finished jobs are
+    resolved without an additional request.
+
+    Args:
+        client (MothrClient): Client connection to MOTHR
+        poll_frequency (float, optional): Frequency, in seconds, to poll for job
+            status. Default, poll 0.25 seconds.
+        fields (list<str>, optional): Fields returned for finished jobs,
+            default `jobId`, `service`, `status`, `result` and `error`
+        chunk_size (int, optional): Maximum number of jobs queried in a single
+            request, default 100
+        policy (PollPolicy, optional): Decides when each job is next polled.
+            Jobs due within `poll_frequency` of each other are polled in the
+            same query. Default, poll every job every `poll_frequency` seconds
+        max_poll_errors (int, optional): Consecutive polls of a job failing with
+            an error other than a GraphQL error, e.g. a network error, before
+            the job's future fails with it. Default 5
+    """
+
+    # pylint: disable=too-many-arguments
+    def __init__(
+        self,
+        client: MothrClient,
+        poll_frequency: float = 0.25,
+        fields: Optional[List[str]] = None,
+        chunk_size: int = MAX_BATCH_SIZE,
+        policy: Optional[PollPolicy] = None,
+        max_poll_errors: int = 5,
+    ):
+        self.client = client
+        self.poll_frequency = poll_frequency
+        self.fields = fields if fields is not None else list(RESULT_FIELDS)
+        if "status" not in self.fields:
+            self.fields.append("status")
+        self.chunk_size = chunk_size
+        self.policy = policy
+        self.max_poll_errors = max_poll_errors
+        self._jobs: Dict[str, List[Future]] = {}
+        self._polls: Dict[str, int] = {}
+        self._errors: Dict[str, int] = {}
+        self._schedules: Dict[str, _Schedule] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._jobs)
+
+    def track(
+        self,
+        job_id: str,
+        callback: Optional[Callable[[Dict], None]] = None,
+        service: Optional[str] = None,
+        version: Optional[str] = None,
+    ) -> Future:
+        """Start tracking a job
+
+        Args:
+            job_id (str): Job to track
+            callback (callable, optional): Called with the job result once the job
+                reaches a terminal status
+            service (str, optional): Service executing the job, passed to the
+                poll policy
+            version (str, optional): Version of the service requested, passed to
+                the poll policy
+
+        Returns:
+            `concurrent.futures.Future`: Resolved with the job result once the job
+                is `complete`, `failed` or `cancelled`
+        """
+        future: Future = Future()
+        if callback is not None:
+            future.add_done_callback(
+                lambda f: f.cancelled() or f.exception() or callback(f.result())
+            )
+        with self._lock:
+            self._jobs.setdefault(job_id, []).append(future)
+            if self.policy is not None and job_id not in self._schedules:
+                now = time.monotonic()
+                due = now + self.policy.delay(0, service, version)
+                self._schedules[job_id] = _Schedule(service, version, now, due)
+                self._wake.set()
+            if self._thread is None:
+                self._stop.clear()
+                self._thread = threading.Thread(
+                    target=self._run, name="mothrpy-tracker", daemon=True
+                )
+                self._thread.start()
+        return future
+
+    def wait(
+        self,
+        job_id: str,
+        timeout: Optional[float] = None,
+        service: Optional[str] = None,
+        version: Optional[str] = None,
+    ) -> Dict:
+        """Block until a job reaches a terminal status
+
+        Args:
+            job_id (str): Job to wait for
+            timeout (float, optional): Maximum time, in seconds, to wait
+            service (str, optional): Service executing the job
+            version (str, optional): Version of the service requested
+
+        Returns:
+            dict: The job result
+
+        Raises:
+            TimeoutError: If the job has not finished within `timeout`, the job
+                is no longer tracked for this call
+        """
+        future = self.track(job_id, service=service, version=version)
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            self.untrack(job_id, future)
+            raise
+
+    def untrack(self, job_id: str, future: Optional[Future] = None):
+        """Stop tracking a job
+
+        Args:
+            job_id (str): Job to stop tracking
+            future (`concurrent.futures.Future`, optional): Only cancel this
+                future returned by `track`. The job is still polled while
+                other futures wait on it. Default, cancel every future
+        """
+        with self._lock:
+            futures = self._jobs.get(job_id, [])
+            for f in futures:
+                if future is None or f is future:
+                    f.cancel()
+            if all(f.cancelled() for f in futures):
+                self._forget(job_id)
+
+    def _forget(self, job_id: str):
+        """Drop the state of a job, the lock must be held"""
+        self._jobs.pop(job_id, None)
+        self._polls.pop(job_id, None)
+        self._errors.pop(job_id, None)
+        self._schedules.pop(job_id, None)
+
+    def poll(self) -> int:
+        """Query the status of every tracked job once
+
+        Returns:
+            int: Number of jobs still being tracked
+        """
+        return self._poll()
+
+    def _poll(self, until: Optional[float] = None) -> int:
+        """Query the status of tracked jobs due by `until`, or every job"""
+        with self._lock:
+            # Stop polling jobs nobody is waiting on anymore
+            for job_id, futures in list(self._jobs.items()):
+                if all(f.cancelled() for f in futures):
+                    self._forget(job_id)
+            job_ids = [
+                job_id
+                for job_id in self._jobs
+                if until is None
+                or job_id not in self._schedules
+                or self._schedules[job_id].due <= until
+            ]
+        for chunk in chunks(job_ids, self.chunk_size):
+            self._poll_chunk(chunk)
+        return len(self)
+
+    def _poll_chunk(self, job_ids):
+        if self.client.metrics is not None:
+            for job_id in job_ids:
+                self._polls[job_id] = self._polls.get(job_id, 0) + 1
+        extra = (
+            [f for f in self.policy.fields if f not in self.fields]
+            if self.policy
+            else []
+        )
+        queries = [
+            self.client._job_query(job_id, self.fields + extra).alias(alias(i))
+            for i, job_id in enumerate(job_ids)
+        ]
+        errors: Dict[Optional[str], str] = {}
+        try:
+            resp = self.client.ds.query(*queries)
+        except TransportQueryError as e:
+            resp = e.data or {}
+            errors = errors_by_alias(e)
+        except Exception as e:
+            log.warning("Polling the status of %d jobs failed: %r", len(job_ids), e)
+            for job_id in job_ids:
+                self._retry(job_id, e)
+            return
+        for i, job_id in enumerate(job_ids):
+            job = resp.get(alias(i))
+            self._errors.pop(job_id, None)
+            if job is None:
+                error = errors.get(alias(i), errors.get(None, "job not found"))
+                self._resolve(job_id, exception=ValueError(f"Job {job_id}: {error}"))
+            elif job["status"] in TERMINAL_STATUSES:
+                self._observe(job_id, job)
+                for field in extra:
+                    job.pop(field, None)
+                self._resolve(job_id, result=job)
+            else:
+                self._reschedule(job_id)
+
+    def _observe(self, job_id: str, job: Dict):
+        """Pass a finished job to the poll policy"""
+        schedule = self._schedules.get(job_id)
+        if self.policy is not None and schedule is not None:
+            self.policy.observe(schedule.service, schedule.version, job)
+
+    def _retry(self, job_id: str, exception: Exception):
+        """Poll a job again after a failed poll, or fail it after too many"""
+        errors = self._errors[job_id] = self._errors.get(job_id, 0) + 1
+        if errors >= self.max_poll_errors:
+            self._resolve(job_id, exception=exception)
+        else:
+            self._reschedule(job_id)
+
+    def _reschedule(self, job_id: str):
+        """Set when a job that has not finished is next polled"""
+        schedule = self._schedules.get(job_id)
+        if self.policy is not None and schedule is not None:
+            now = time.monotonic()
+            elapsed = now - schedule.started
+            schedule.due = now + self.policy.delay(
+                elapsed, schedule.service, schedule.version
+            )
+
+    def _resolve(
+        self,
+        job_id: str,
+        result: Optional[Dict] = None,
+        exception: Optional[Exception] = None,
+    ):
+        with self._lock:
+            futures = self._jobs.pop(job_id, [])
+            polls = self._polls.pop(job_id, None)
+            self._errors.pop(job_id, None)
+            self._schedules.pop(job_id, None)
+        if polls is not None and self.client.metrics is not None:
+            self.client.metrics.observe("job_polls", polls)
+        for future in futures:
+            if future.done():
+                continue
+            if exception is not None:
+                future.set_exception(exception)
+            else:
+                future.set_result(result)
+
+    def _next_poll(self) -> float:
+        """Time, in seconds, until the next job is due to be polled"""
+        if self.policy is None:
+            return self.poll_frequency
+        with self._lock:
+            due = min((s.due for s in self._schedules.values()), default=None)
+        if due is None:
+            return self.poll_frequency
+        return max(0.0, due - time.monotonic())
+
+    def _run(self):
+        while True:
+            self._wake.wait(self._next_poll())
+            self._wake.clear()
+            if self._stop.is_set():
+                break
+            if self.policy is None:
+                self.poll()
+            else:
+                self._poll(until=time.monotonic() + self.poll_frequency)
+            with self._lock:
+                if not self._jobs:
+                    self._thread = None
+                    return
+        with self._lock:
+            self._thread = None
+
+    def close(self):
+        """Stop polling and cancel every outstanding job future"""
+        self._stop.set()
+        self._wake.set()
+        with self._lock:
+            futures = [f for fs in self._jobs.values() for f in fs]
+            self._jobs.clear()
+            self._polls.clear()
+            self._errors.clear()
+            self._schedules.clear()
+        for future in futures:
+            future.cancel()
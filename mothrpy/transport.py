@@ -0,0 +1,244 @@
+# Copyright 2020 Resilient Solutions Inc. All rights reserved.
+# Use of this source code is governed by a BSD-style
+# license that can be found in the LICENSE file.
+
+import json
+import threading
+import time
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+import requests
+from gql.transport.exceptions import TransportProtocolError, TransportServerError
+from gql.transport.requests import RequestsHTTPTransport
+from graphql import DocumentNode, ExecutionResult, print_ast
+from requests.adapters import HTTPAdapter, Retry
+
+from .auth import AUTH_OPERATIONS, AuthManager, is_auth_error
+from .metrics import Metrics, operation_name
+from .payload import (
+    CHUNK_SIZE,
+    INCREMENTAL_THRESHOLD,
+    JSONBody,
+    StreamSource,
+    decode_json,
+    iter_text,
+)
+
+
+class PooledHTTPTransport(  # pylint: disable=too-many-instance-attributes
+    RequestsHTTPTransport
+):
+    """Thread-safe HTTP transport backed by a keep-alive connection pool
+
+    Unlike `RequestsHTTPTransport`, the underlying `requests.Session` is created
+    once and kept open between requests, so connections are reused and the
+    transport can be shared by many threads. Each thread checks out its own
+    connection from the pool.
+
+    Variables holding a `StreamSource` are read into the request body as it
+    is sent. Such requests, and every request when `compress` or
+    `stream_responses` is set, are sent with a chunked body, and responses
+    larger than 1 MiB are decoded as they are read rather than in one piece.
+
+    Args:
+        url (str): The GraphQL server URL
+        pool_connections (int, optional): Number of per-host connection pools
+            to cache, default 10
+        pool_maxsize (int, optional): Maximum number of connections kept open to
+            a single host, default 10
+        pool_block (bool, optional): Wait for a free connection when a pool is
+            exhausted instead of opening a temporary one, default False
+        metrics (Metrics, optional): Records request latency, errors and bytes
+            transferred
+        compress (bool, optional): gzip request bodies, default False
+        stream_responses (bool, optional): Decode large responses as they are
+            read, default False
+        auth_manager (AuthManager, optional): Refreshes expired access tokens,
+            requests rejected for their token are sent once more after a refresh
+        kwargs: Arguments passed to `RequestsHTTPTransport`
+    """
+
+    # pylint: disable=too-many-arguments
+    def __init__(
+        self,
+        url: str,
+        pool_connections: int = 10,
+        pool_maxsize: int = 10,
+        pool_block: bool = False,
+        metrics: Optional[Metrics] = None,
+        compress: bool = False,
+        stream_responses: bool = False,
+        **kwargs: Any,
+    ):
+        self.auth_manager: Optional[AuthManager] = kwargs.pop("auth_manager", None)
+        super().__init__(url, **kwargs)
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.pool_block = pool_block
+        self.metrics = metrics
+        self.compress = compress
+        self.stream_responses = stream_responses
+        self._lock = threading.Lock()
+
+    def connect(self):
+        """Create the pooled session, if it does not already exist"""
+        if self.session is not None:
+            return
+        with self._lock:
+            if self.session is not None:
+                return
+            session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=self.pool_connections,
+                pool_maxsize=self.pool_maxsize,
+                pool_block=self.pool_block,
+                max_retries=Retry(
+                    total=self.retries,
+                    backoff_factor=0.1,
+                    status_forcelist=[500, 502, 503, 504],
+                )
+                if self.retries > 0
+                else 0,
+            )
+            for prefix in "http://", "https://":
+                session.mount(prefix, adapter)
+            if self.metrics is not None:
+                session.hooks["response"].append(self._record_bytes)
+            self.session = session
+
+    def execute(  # type: ignore
+        self, document: DocumentNode, *args: Any, **kwargs: Any
+    ) -> ExecutionResult:
+        auth = self.auth_manager
+        if auth is None or operation_name(document) in AUTH_OPERATIONS:
+            return self._execute(document, *args, **kwargs)
+        token = auth.token
+        if auth.can_refresh and auth.expiring(0):
+            token = auth.refresh(stale=token)
+        try:
+            result = self._execute(document, *args, **kwargs)
+        except TransportServerError as e:
+            if not auth.can_refresh or not is_auth_error(str(e)):
+                raise
+        else:
+            errors = [str(error) for error in result.errors or []]
+            if not auth.can_refresh or not any(map(is_auth_error, errors)):
+                return result
+        auth.refresh(stale=token)
+        return self._execute(document, *args, **kwargs)
+
+    def _execute(
+        self, document: DocumentNode, *args: Any, **kwargs: Any
+    ) -> ExecutionResult:
+        if self.metrics is None:
+            return self._send(document, *args, **kwargs)
+        operation = operation_name(document)
+        start = time.perf_counter()
+        try:
+            result = self._send(document, *args, **kwargs)
+        except Exception:
+            self.metrics.request(operation, time.perf_counter() - start, error=True)
+            raise
+        error = bool(result.errors)
+        self.metrics.request(operation, time.perf_counter() - start, error=error)
+        return result
+
+    def _send(
+        self,
+        document: DocumentNode,
+        variable_values: Optional[Dict[str, Any]] = None,
+        operation_name: Optional[str] = None,  # pylint: disable=redefined-outer-name
+        timeout: Optional[int] = None,
+    ) -> ExecutionResult:
+        streams = any(
+            isinstance(v, StreamSource) for v in (variable_values or {}).values()
+        )
+        if not (streams or self.compress or self.stream_responses):
+            return super().execute(document, variable_values, operation_name, timeout)
+        if not self.session:
+            raise TransportProtocolError("Transport is not connected")
+        payload: Dict[str, Any] = {"query": print_ast(document)}
+        if variable_values:
+            payload["variables"] = variable_values
+        if operation_name:
+            payload["operationName"] = operation_name
+        body = JSONBody(payload, compress=self.compress)
+        headers = {**(self.headers or {}), "Content-Type": "application/json"}
+        if self.compress:
+            headers["Content-Encoding"] = "gzip"
+        response = self.session.request(
+            self.method,
+            self.url,
+            data=body,
+            headers=headers,
+            auth=self.auth,
+            cookies=self.cookies,
+            timeout=timeout or self.default_timeout,
+            verify=self.verify,
+            stream=True,
+            **self.kwargs,
+        )
+        try:
+            result, received = self._read_json(response)
+        except ValueError:
+            try:
+                response.raise_for_status()
+            except requests.HTTPError as e:
+                raise TransportServerError(str(e)) from e
+            raise TransportProtocolError(
+                "Server did not return a GraphQL result"
+            ) from None
+        finally:
+            response.close()
+        if self.metrics is not None:
+            self.metrics.increment("bytes_sent_total", body.sent)
+            self.metrics.increment("bytes_received_total", received)
+        if not isinstance(result, dict) or not ("errors" in result or "data" in result):
+            raise TransportProtocolError("Server did not return a GraphQL result")
+        return ExecutionResult(errors=result.get("errors"), data=result.get("data"))
+
+    @staticmethod
+    def _read_json(response: requests.Response) -> Tuple[Any, int]:
+        """Decode a JSON response, incrementally unless it is small
+
+        Returns:
+            tuple: The decoded response and the number of bytes read
+        """
+        length = response.headers.get("Content-Length")
+        if length is not None and int(length) <= INCREMENTAL_THRESHOLD:
+            content = response.content
+            return json.loads(content), len(content)
+        received = [0]
+
+        def count(chunks: Iterator[bytes]) -> Iterator[bytes]:
+            for chunk in chunks:
+                received[0] += len(chunk)
+                yield chunk
+
+        raw = count(response.iter_content(CHUNK_SIZE))
+        result = decode_json(iter_text(raw, response.encoding or "utf-8"))
+        return result, received[0]
+
+    def _record_bytes(self, response: requests.Response, *_, **__):
+        assert self.metrics is not None
+        body = response.request.body
+        if isinstance(body, JSONBody):
+            # Counted once the streamed response has been read
+            return
+        sent = len(body) if isinstance(body, (bytes, str)) else 0
+        self.metrics.increment("bytes_sent_total", sent)
+        self.metrics.increment("bytes_received_total", len(response.content))
+
+    def close(self):
+        """Keep the session open so connections are reused by later requests
+
+        gql closes the transport after every request made with
+        `gql.Client.execute`, use `shutdown` to close the connection pool.
+        """
+
+    def shutdown(self):
+        """Close every pooled connection"""
+        with self._lock:
+            if self.session is not None:
+                self.session.close()
+                self.session = None
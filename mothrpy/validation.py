@@ -0,0 +1,243 @@
+# Copyright 2020 Resilient Solutions Inc. All rights reserved.
+# Use of this source code is governed by a BSD-style
+# license that can be found in the LICENSE file.
+
+from __future__ import annotations
+import re
+import threading
+import time
+from collections import Counter
+from typing import (
+    TYPE_CHECKING,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+if TYPE_CHECKING:
+    from .client import MothrClient
+    from .request import JobRequest
+
+
+# Matches s3://<bucket>/<key>
+S3_URI = re.compile(r"^s3\:\/\/[a-zA-Z0-9\-\.]+[a-zA-Z]\/\S*?$")
+
+PARAMETER_TYPES = ("input", "output", "parameter")
+
+# Fields of a service definition needed to compile its spec
+SPEC_FIELDS = [
+    "name",
+    "version",
+    "streamInput",
+    "parameters.name",
+    "parameters.type",
+    "parameters.required",
+]
+
+
+class ServiceSpec:  # pylint: disable=too-few-public-methods
+    """Checks job request arguments against a service definition
+
+    The service's `ServiceParameter` list is compiled once into lookup tables,
+    so checking a request only walks its own parameters. A request is invalid
+    if it:
+
+    - Leaves out a required parameter. Named parameters are matched by name,
+      unnamed ones by counting the request parameters of their type
+    - Gives a named parameter a different `ParameterType` than the service
+    - Has an `input` or `output` parameter, or an entry of `inputs` or
+      `outputs`, that is not an S3 URI
+    - Sets `inputStream` for a service without `streamInput`
+
+    Args:
+        service (dict): Service record with the fields in `SPEC_FIELDS`
+    """
+
+    __slots__ = ("name", "version", "stream_input", "types", "required", "counts")
+
+    def __init__(self, service: Dict):
+        self.name: Optional[str] = service.get("name")
+        self.version: Optional[str] = service.get("version")
+        self.stream_input = bool(service.get("streamInput"))
+        self.types: Dict[str, str] = {}
+        required = []
+        counts: Counter = Counter()
+        for param in service.get("parameters") or ():
+            param_type = param.get("type") or "parameter"
+            name = param.get("name")
+            if name:
+                self.types[name] = param_type
+                if param.get("required"):
+                    required.append(name)
+            elif param.get("required"):
+                counts[param_type] += 1
+        self.required: Tuple[str, ...] = tuple(required)
+        self.counts: Tuple[Tuple[str, int], ...] = tuple(counts.items())
+
+    def errors(self, req_args: Dict) -> List[str]:
+        """Check job request arguments
+
+        Args:
+            req_args (dict): Arguments submitted with the request
+
+        Returns:
+            list<str>: Why the request is invalid, empty if it is valid
+        """
+        errors = self._parameter_errors(req_args.get("parameters") or ())
+        for key in ("inputs", "outputs"):
+            for uri in req_args.get(key) or ():
+                if not (isinstance(uri, str) and S3_URI.match(uri)):
+                    errors.append(f"{key} entry {uri} is not an S3 URI")
+        if req_args.get("inputStream") is not None and not self.stream_input:
+            errors.append(f"service {self.name} does not accept inputStream")
+        return errors
+
+    def _parameter_errors(self, params: Iterable[Dict]) -> List[str]:
+        """Check request parameters, including that required ones are given"""
+        errors = []
+        is_s3 = S3_URI.match
+        names = set()
+        counts: Dict[str, int] = {}
+        for param in params:
+            param_type = param.get("type") or "parameter"
+            name = param.get("name")
+            expected = self.types.get(name) if name else None
+            if expected is None:
+                counts[param_type] = counts.get(param_type, 0) + 1
+            else:
+                names.add(name)
+                if expected != param_type:
+                    errors.append(
+                        f"parameter {name} must be {expected}, not {param_type}"
+                    )
+            if param_type == "parameter":
+                continue
+            value = param.get("value")
+            if param_type not in PARAMETER_TYPES:
+                errors.append(f"unknown parameter type {param_type}")
+            elif not (isinstance(value, str) and is_s3(value)):
+                errors.append(f"{param_type} parameter {value} is not an S3 URI")
+        for name in self.required:
+            if name not in names:
+                errors.append(f"missing required parameter {name}")
+        for param_type, count in self.counts:
+            found = counts.get(param_type, 0)
+            if found < count:
+                errors.append(
+                    f"missing {count - found} required {param_type} parameters"
+                )
+        return errors
+
+
+class RequestValidator:
+    """Rejects invalid job requests before they are submitted
+
+    Service definitions are fetched with one `service` query per service and
+    version, compiled into a `ServiceSpec` and kept for `ttl` seconds, so
+    validating a batch only sends requests for services it has not seen yet.
+    Requests without a version are checked against the `latest` version.
+
+    Args:
+        services (list<str>, optional): Services whose requests are validated,
+            default every service
+        ttl (float, optional): Time, in seconds, compiled specs are kept,
+            default 300
+        timer (callable, optional): Clock used to expire specs,
+            default `time.monotonic`
+    """
+
+    def __init__(
+        self,
+        services: Optional[Iterable[str]] = None,
+        ttl: float = 300.0,
+        timer: Callable[[], float] = time.monotonic,
+    ):
+        self.services = None if services is None else set(services)
+        self.ttl = ttl
+        self.timer = timer
+        self._specs: Dict[Tuple[str, str], Tuple[float, Optional[ServiceSpec]]] = {}
+        self._lock = threading.Lock()
+
+    def enabled(self, service: Optional[str]) -> bool:
+        """Whether requests of a service are validated"""
+        return service is not None and (
+            self.services is None or service in self.services
+        )
+
+    def spec(
+        self, client: MothrClient, service: str, version: Optional[str] = None
+    ) -> Optional[ServiceSpec]:
+        """Compiled definition of a service, fetched if it is not cached
+
+        Args:
+            client (MothrClient): Client connection to MOTHR
+            service (str): Name of the service
+            version (str, optional): Version of the service, default `latest`
+
+        Returns:
+            ServiceSpec: The compiled definition, None if the service does not
+                exist
+        """
+        key = (service, version or "latest")
+        with self._lock:
+            entry = self._specs.get(key)
+        if entry is not None and entry[0] > self.timer():
+            return entry[1]
+        records = client.service(key[0], version=key[1], fields=SPEC_FIELDS)
+        spec = ServiceSpec(records[0]) if records else None
+        with self._lock:
+            self._specs[key] = (self.timer() + self.ttl, spec)
+        return spec
+
+    def validate(
+        self, client: MothrClient, requests: Sequence[JobRequest]
+    ) -> List[Optional[ValueError]]:
+        """Check job requests against their services' definitions
+
+        Args:
+            client (MothrClient): Client connection to MOTHR
+            requests (list<JobRequest>): Job requests to check
+
+        Returns:
+            list<ValueError|None>: None for each valid request, or a ValueError
+                describing why the request is invalid
+        """
+        specs: Dict[Tuple[str, Optional[str]], Optional[ServiceSpec]] = {}
+        results: List[Optional[ValueError]] = []
+        for request in requests:
+            args = request.req_args
+            service = args.get("service")
+            if not self.enabled(service):
+                results.append(None)
+                continue
+            key = (service, args.get("version"))
+            if key not in specs:
+                specs[key] = self.spec(client, *key)
+            spec = specs[key]
+            if spec is None:
+                version = key[1] or "latest"
+                results.append(ValueError(f"unknown service {service} {version}"))
+                continue
+            errors = spec.errors(args)
+            results.append(ValueError("; ".join(errors)) if errors else None)
+        return results
+
+    def invalidate(self, service: Optional[str] = None) -> int:
+        """Drop compiled specs
+
+        Args:
+            service (str, optional): Only drop the specs of this service, every
+                spec is dropped by default
+
+        Returns:
+            int: Number of specs dropped
+        """
+        with self._lock:
+            keys = [k for k in self._specs if service is None or k[0] == service]
+            for key in keys:
+                del self._specs[key]
+        return len(keys)
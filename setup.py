@@ -16,7 +16,16 @@ setuptools.setup(
     include_package_data=True,
     install_requires=["gql[requests,websockets]==3.0.0a4"],
     extras_require={
-        "dev": ["mock", "pytest", "pytest-cov", "pytest-mypy", "pytest-pylint"]
+        "async": ["gql[aiohttp]==3.0.0a4"],
+        "analytics": ["numpy"],
+        "dev": [
+            "gql[aiohttp]==3.0.0a4",
+            "mock",
+            "pytest",
+            "pytest-cov",
+            "pytest-mypy",
+            "pytest-pylint",
+        ],
     },
     classifiers=[
         "Programming Language :: Python :: 3",
@@ -24,4 +33,5 @@ setuptools.setup(
         "Operating System :: OS Independent",
     ],
     python_requires=">=3.7",
+    entry_points={"console_scripts": ["mothrpy=mothrpy.cli:main"]},
 )
@@ -0,0 +1,82 @@
+import threading
+import time
+
+import mock
+import pytest
+from gql.transport.exceptions import TransportQueryError
+from mothrpy import AdmissionController, JobRequest, Limit, Metrics, MothrClient
+
+
+class TestAdmissionController:
+    def test_rate(self):
+        controller = AdmissionController(default=Limit(rate=20, burst=1))
+        start = time.monotonic()
+        for _ in range(5):
+            with controller.admit([("echo", None)]):
+                pass
+        assert time.monotonic() - start >= 0.15
+        # Other services have their own bucket
+        with controller.admit([("other", None)]) as ticket:
+            assert ticket.waited < 0.05
+
+    def test_max_in_flight(self):
+        controller = AdmissionController(queues={"gpu": Limit(max_in_flight=2)})
+        lock = threading.Lock()
+        active, peak = [0], [0]
+
+        def submit():
+            with controller.admit([("echo", "gpu")]):
+                with lock:
+                    active[0] += 1
+                    peak[0] = max(peak[0], active[0])
+                time.sleep(0.02)
+                with lock:
+                    active[0] -= 1
+
+        threads = [threading.Thread(target=submit) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert peak[0] == 2
+        assert controller.limit(queue="gpu") == 2
+        assert controller.limit(service="echo") == float("inf")
+
+    def test_aimd(self):
+        now = [0.0]
+        controller = AdmissionController(
+            total=Limit(max_in_flight=5),
+            adaptive=True,
+            target_latency=1.0,
+            initial=4,
+            timer=lambda: now[0],
+        )
+        with controller.admit([("echo", None)]):
+            now[0] += 0.5
+        assert controller.limit() == 4.25
+        for _ in range(2):
+            with pytest.raises(ValueError):
+                with controller.admit([("echo", None)]):
+                    raise ValueError("submit failed")
+        # Decreased once per target latency
+        assert controller.limit() == 2.125
+        with controller.admit([("echo", None)]):
+            now[0] += 2
+        assert controller.limit() == 2.125 / 2
+        for _ in range(100):
+            with controller.admit([("echo", None)]):
+                pass
+        assert controller.limit() == 5
+
+    @mock.patch("gql.dsl.DSLSchema.mutate")
+    def test_client(self, mock_mutate):
+        mock_mutate.side_effect = TransportQueryError(
+            "failed", errors=[{"message": "queue full"}]
+        )
+        metrics = Metrics()
+        controller = AdmissionController(total=Limit(max_in_flight=10), adaptive=True)
+        client = MothrClient(admission=controller, metrics=metrics)
+        requests = [JobRequest(client=client, service="echo") for _ in range(3)]
+        assert all(isinstance(r, ValueError) for r in client.submit_many(requests))
+        assert controller.limit() == 4
+        assert "admission_wait_seconds" in metrics.prometheus()
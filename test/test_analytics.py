@@ -0,0 +1,75 @@
+import math
+
+import mock
+import pytest
+from mothrpy import JobTable, MothrClient
+from mothrpy import analytics
+
+JOBS = [
+    {
+        "jobId": f"job-{i}",
+        "service": "echo" if i < 4 else "convert",
+        "queue": "cpu",
+        "status": "complete",
+        "worker": {"workerId": f"worker-{i % 2}"},
+        "submittedAt": f"2021-01-01T00:00:{i:02d}Z",
+        "waitTime": float(i),
+        "runTime": 10.0 if i < 5 else None,
+        "maxMemory": 1024,
+        "numCpu": 2,
+        "cpuUsage": 50,
+    }
+    for i in range(6)
+]
+
+
+@pytest.mark.parametrize(
+    "value, fraction",
+    [
+        ("2021-01-01T00:00:05Z", 0.0),
+        ("2021-01-01T00:00:05.123456789Z", 0.123456),
+        ("2021-01-01T00:00:05.12345Z", 0.12345),
+        ("2021-01-01T02:00:05.5+02:00", 0.5),
+    ],
+)
+def test_parse_time(value, fraction):
+    start = analytics.parse_time("2021-01-01T00:00:00Z")
+    assert analytics.parse_time(value) - start == pytest.approx(5 + fraction)
+
+
+class TestJobTable:
+    @pytest.mark.parametrize("numpy", [True, False])
+    def test_summary(self, numpy):
+        with mock.patch.object(analytics, "np", analytics.np if numpy else None):
+            table = JobTable(JOBS, analytics.JOB_FIELDS)
+            summary = table.summary(by="service", percentiles=(50, 90))
+            assert len(table) == 6
+            assert table["service"][3:5] == ["echo", "convert"]
+            assert math.isnan(table["runTime"][5])
+            assert summary["echo"]["count"] == 4
+            assert summary["echo"]["waitTime"] == {
+                "mean": 1.5,
+                "min": 0.0,
+                "max": 3.0,
+                "p50": 1.5,
+                "p90": pytest.approx(2.7),
+            }
+            # First submitted at 0s, last finished at 3 + 3 + 10s
+            assert summary["echo"]["throughput"] == pytest.approx(4 / 16)
+            assert summary["convert"]["runTime"]["max"] == 10.0
+            assert set(table.summary(by="worker")) == {"worker-0", "worker-1"}
+            assert table.summary(by=None)[None]["count"] == 6
+
+    def test_not_scalar(self):
+        with pytest.raises(ValueError):
+            JobTable([{"parameters": [{"value": "a"}]}], ["parameters"])
+
+    @mock.patch("gql.dsl.DSLSchema.query")
+    def test_client(self, mock_query):
+        mock_query.return_value = {"jobs": JOBS}
+        client = MothrClient()
+        table = client.jobs(status="complete", fields=["jobId", "service", "runTime"])
+        assert table["jobId"] == [job["jobId"] for job in JOBS]
+        assert table.summary()["convert"]["throughput"] is None
+        field = mock_query.call_args[0][0]
+        assert [a.name.value for a in field.ast_field.arguments] == ["status"]
@@ -0,0 +1,187 @@
+import asyncio
+
+import mock
+import pytest
+from gql.transport.exceptions import TransportClosed
+from graphql import ExecutionResult
+from mothrpy import AsyncMothrClient, JobRequest
+
+TRANSPORT_SUBSCRIBE = "gql.transport.websockets.WebsocketsTransport.subscribe"
+
+
+def execution_results(subscribe):
+    """Adapt a mock subscription yielding data to the websocket transport"""
+
+    async def transport_subscribe(self, document, *args, **kwargs):
+        generator = subscribe(self, document, *args, **kwargs)
+        try:
+            async for data in generator:
+                yield ExecutionResult(data=data)
+        finally:
+            await generator.aclose()
+
+    return transport_subscribe
+
+
+class TestAsyncMothrClient:
+    def setup_method(self, _):
+        self.submit_response = {
+            "submitJob": {"job": {"jobId": "test", "status": "submitted"}}
+        }
+
+    @mock.patch("gql.client.AsyncClientSession.execute", new_callable=mock.AsyncMock)
+    def test_login(self, mock_execute):
+        mock_execute.return_value = {
+            "login": {"token": "access-token", "refresh": "refresh-token"}
+        }
+
+        async def login():
+            async with AsyncMothrClient() as client:
+                return await client.login(username="test", password="password")
+
+        access, refresh = asyncio.run(login())
+        assert access == "access-token"
+        assert refresh == "refresh-token"
+
+    @mock.patch("gql.client.AsyncClientSession.execute", new_callable=mock.AsyncMock)
+    def test_services(self, mock_execute):
+        mock_execute.return_value = {
+            "services": [
+                {"name": "test-service", "version": "latest"},
+                {"name": "test-service", "version": "dev"},
+            ]
+        }
+
+        async def services():
+            async with AsyncMothrClient() as client:
+                return await client.services()
+
+        assert len(asyncio.run(services())) == 2
+
+    @mock.patch("gql.client.AsyncClientSession.execute", new_callable=mock.AsyncMock)
+    def test_run_job(self, mock_execute):
+        mock_execute.side_effect = [
+            self.submit_response,
+            {"job": {"status": "submitted"}},
+            {"job": {"status": "running"}},
+            {"job": {"status": "complete"}},
+            {"job": {"jobId": "test", "status": "complete", "result": "done"}},
+        ]
+
+        async def run_job():
+            async with AsyncMothrClient() as client:
+                request = JobRequest(client=client, service="test")
+                return request, await client.run_job(request, poll_frequency=0.01)
+
+        request, result = asyncio.run(run_job())
+        assert result["result"] == "done"
+        assert request.job_id == "test"
+        assert request.status == "complete"
+
+    @mock.patch("gql.client.AsyncClientSession.execute", new_callable=mock.AsyncMock)
+    def test_run_job_fail(self, mock_execute):
+        mock_execute.side_effect = [
+            self.submit_response,
+            {"job": {"status": "failed"}},
+            {"job": {"jobId": "test", "status": "failed", "error": "failed"}},
+        ]
+
+        async def run_job():
+            async with AsyncMothrClient() as client:
+                request = JobRequest(client=client, service="test")
+                return await client.run_job(request)
+
+        with pytest.raises(RuntimeError):
+            asyncio.run(run_job())
+
+    @mock.patch("gql.client.AsyncClientSession.execute", new_callable=mock.AsyncMock)
+    def test_max_concurrency(self, mock_execute):
+        in_flight = []
+        peak = []
+
+        async def execute(*args, **kwargs):
+            in_flight.append(1)
+            peak.append(len(in_flight))
+            await asyncio.sleep(0.01)
+            in_flight.pop()
+            return {"job": {"status": "running"}}
+
+        mock_execute.side_effect = execute
+
+        async def query_jobs():
+            async with AsyncMothrClient(max_concurrency=3) as client:
+                requests = [
+                    JobRequest(client=client, service="test") for _ in range(10)
+                ]
+                for i, request in enumerate(requests):
+                    request.job_id = str(i)
+                await asyncio.gather(
+                    *[client.query_job(request, ["status"]) for request in requests]
+                )
+
+        asyncio.run(query_jobs())
+        assert max(peak) == 3
+
+    @mock.patch(
+        "gql.transport.websockets.WebsocketsTransport.close",
+        new_callable=mock.AsyncMock,
+    )
+    @mock.patch(
+        "gql.transport.websockets.WebsocketsTransport.connect",
+        new_callable=mock.AsyncMock,
+    )
+    def test_subscribe(self, mock_connect, mock_close):
+        closed = []
+
+        async def subscribe(*args, **kwargs):
+            try:
+                yield {"subscribeJobComplete": {"jobId": "test", "status": "complete"}}
+                await asyncio.sleep(60)
+            finally:
+                closed.append(True)
+
+        async def wait():
+            async with AsyncMothrClient() as client:
+                request = JobRequest(client=client, service="test")
+                request.job_id = "test"
+                result = await client.subscribe(request)
+                # The subscription is stopped as soon as the event is received
+                assert closed == [True]
+                return result
+
+        with mock.patch(TRANSPORT_SUBSCRIBE, execution_results(subscribe)):
+            assert asyncio.run(wait())["status"] == "complete"
+
+    @mock.patch(
+        "gql.transport.websockets.WebsocketsTransport.close",
+        new_callable=mock.AsyncMock,
+    )
+    @mock.patch(
+        "gql.transport.websockets.WebsocketsTransport.connect",
+        new_callable=mock.AsyncMock,
+    )
+    def test_subscribe_reconnect(self, mock_connect, mock_close):
+        calls = []
+
+        async def subscribe(*args, **kwargs):
+            calls.append(True)
+            if len(calls) == 1:
+                raise TransportClosed("Websocket closed")
+            yield {"subscribeJobComplete": {"jobId": "test", "status": "complete"}}
+
+        async def wait():
+            async with AsyncMothrClient(token="old") as client:
+                request = JobRequest(client=client, service="test")
+                request.job_id = "test"
+                with pytest.raises(TransportClosed):
+                    await client.subscribe(request)
+                client._set_token("new")
+                result = await client.subscribe(request)
+                # The websocket is connected again with the current token
+                headers = client.ws_client.transport.headers
+                assert headers == {"Authorization": "Bearer new"}
+                return result
+
+        with mock.patch(TRANSPORT_SUBSCRIBE, execution_results(subscribe)):
+            assert asyncio.run(wait())["status"] == "complete"
+        assert mock_connect.call_count == 2
@@ -0,0 +1,76 @@
+import base64
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import mock
+from mothrpy import AuthManager, MothrClient
+from mothrpy.auth import is_auth_error, token_expiry
+
+
+def jwt(exp):
+    claims = base64.urlsafe_b64encode(json.dumps({"exp": exp}).encode())
+    return f"header.{claims.decode().rstrip('=')}.signature"
+
+
+def graphql_response(body):
+    response = mock.Mock()
+    response.json.return_value = body
+    return response
+
+
+class TestAuthManager:
+    def test_token_expiry(self):
+        assert token_expiry(jwt(1600000000)) == 1600000000
+        assert token_expiry("not-a-jwt") is None
+        assert is_auth_error("Token is expired")
+        assert not is_auth_error("job not found")
+
+    def test_single_flight(self):
+        calls = []
+        auth = AuthManager("stale", "refresh-token")
+
+        def refresher():
+            calls.append(1)
+            time.sleep(0.1)
+            auth.set_tokens("fresh")
+            return "fresh"
+
+        auth.bind(refresher)
+        with ThreadPoolExecutor(max_workers=16) as pool:
+            tokens = list(pool.map(lambda _: auth.refresh(stale="stale"), range(64)))
+        assert tokens == ["fresh"] * 64
+        assert len(calls) == 1
+
+    def test_refresh_ahead(self):
+        refreshed = threading.Event()
+        auth = AuthManager(jwt(time.time() + 60.2), "refresh-token", margin=60)
+
+        def refresher():
+            auth.set_tokens(jwt(time.time() + 3600))
+            refreshed.set()
+            return auth.token
+
+        auth.bind(refresher)
+        clients = [MothrClient(auth=auth), MothrClient(auth=auth)]
+        assert refreshed.wait(timeout=5)
+        assert not auth.expiring()
+        for client in clients:
+            assert client.headers["Authorization"] == f"Bearer {auth.token}"
+        auth.close()
+
+    @mock.patch("requests.Session.request")
+    def test_retry_after_refresh(self, mock_request):
+        mock_request.side_effect = [
+            graphql_response({"errors": [{"message": "token is expired"}]}),
+            graphql_response({"data": {"refresh": {"token": "new-token"}}}),
+            graphql_response({"data": {"services": [{"name": "test"}]}}),
+        ]
+        client = MothrClient(token="old-token")
+        client.auth.set_tokens("old-token", "refresh-token")
+        assert client.services() == [{"name": "test"}]
+        assert mock_request.call_count == 3
+        headers = mock_request.call_args_list[-1][1]["headers"]
+        assert headers["Authorization"] == "Bearer new-token"
+        assert client.token == "new-token"
@@ -0,0 +1,190 @@
+import itertools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import mock
+import pytest
+from mothrpy import JobRequest, MothrClient, ResultCache, TTLCache
+
+
+class TestTTLCache:
+    def test_expire(self):
+        now = [0.0]
+        cache = TTLCache(ttl=10, timer=lambda: now[0])
+        cache.set("key", {"name": "test"})
+        assert cache.get("key") == {"name": "test"}
+        now[0] = 10.0
+        assert cache.get("key") is None
+        assert len(cache) == 0
+
+    def test_lru(self):
+        cache = TTLCache(maxsize=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        assert cache.get("a") == 1
+        assert cache.get("b") is None
+        assert cache.get("c") == 3
+
+    def test_copies(self):
+        cache = TTLCache()
+        value = [{"name": "test"}]
+        cache.set("key", value)
+        value[0]["name"] = "changed"
+        cache.get("key")[0]["name"] = "changed"
+        assert cache.get("key") == [{"name": "test"}]
+
+    def test_invalidate(self):
+        cache = TTLCache()
+        cache.set(("service", "a"), 1)
+        cache.set(("service", "b"), 2)
+        assert cache.invalidate(lambda key: key[1] == "a") == 1
+        assert cache.get(("service", "b")) == 2
+        assert cache.invalidate() == 1
+        assert len(cache) == 0
+
+
+class TestResultCache:
+    def test_eviction(self, tmp_path):
+        now = [0.0]
+        path = str(tmp_path / "results.sqlite")
+        cache = ResultCache(
+            path, ["test"], max_entries=2, max_age=10, timer=lambda: now[0]
+        )
+        assert cache.key({"service": "test"}) == cache.key(
+            {"version": "latest", "service": "test"}
+        )
+        cache.set("failed", {"status": "failed"})
+        assert cache.get("failed") is None
+        for key in "abc":
+            now[0] += 1
+            cache.set(key, {"service": "test", "status": "complete", "result": key})
+        assert len(cache) == 2
+        assert cache.get("a") is None
+        assert cache.get("c")["result"] == "c"
+        now[0] = 20.0
+        assert cache.get("c") is None
+        cache.close()
+
+        # Results persist across processes
+        cache = ResultCache(path, ["test"], max_bytes=200)
+        cache.set("d", {"service": "test", "status": "complete", "result": "x" * 60})
+        cache.set("e", {"service": "test", "status": "complete", "result": "y" * 60})
+        assert cache.get("d") is None
+        assert cache.get("e") is not None
+        assert cache.invalidate("test") == 1
+
+    @mock.patch("gql.dsl.DSLSchema.mutate")
+    @mock.patch("gql.dsl.DSLSchema.query")
+    def test_run_job_cached(self, mock_query, mock_mutate):
+        mock_mutate.return_value = {
+            "submitJob": {"job": {"jobId": "test", "status": "submitted"}}
+        }
+        mock_query.side_effect = [
+            {"job": {"status": "complete"}},
+            {"job": {"jobId": "test", "service": "test", "status": "complete"}},
+        ]
+        client = MothrClient(result_cache=ResultCache(":memory:", ["test"]))
+        results = [
+            JobRequest(client=client, service="test").add_parameter("a").run_job()
+            for _ in range(3)
+        ]
+        assert results[0] == results[2]
+        assert mock_mutate.call_count == 1
+        assert mock_query.call_count == 2
+
+        mock_query.side_effect = [
+            {"job": {"status": "complete"}},
+            {"job": {"jobId": "test", "service": "other", "status": "complete"}},
+        ]
+        JobRequest(client=client, service="other").run_job()
+        assert mock_mutate.call_count == 2
+
+    def test_coalesce(self):
+        cache = ResultCache(":memory:", ["test"])
+        calls = []
+
+        def submit():
+            calls.append(1)
+            time.sleep(0.1)
+            return "job"
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            job_ids = list(pool.map(lambda _: cache.coalesce("key", submit), range(8)))
+        assert job_ids == ["job"] * 8
+        assert len(calls) == 1
+        cache.set("key", {"status": "failed"})
+        cache.coalesce("key", submit)
+        assert len(calls) == 2
+        # A finished job whose result was never stored is not reused
+        assert cache.coalesce("key", submit, running=lambda job_id: False) == "job"
+        assert len(calls) == 3
+
+    @mock.patch("gql.dsl.DSLSchema.mutate")
+    @mock.patch("gql.dsl.DSLSchema.query")
+    def test_timeout_releases_job(self, mock_query, mock_mutate):
+        job_ids = iter(["j1", "j2", "j3"])
+        mock_mutate.side_effect = lambda field: (
+            {"cancelJob": {"status": "cancelled"}}
+            if field.ast_field.name.value == "cancelJob"
+            else {"submitJob": {"job": {"jobId": next(job_ids), "status": "queued"}}}
+        )
+        mock_query.return_value = {"job": {"status": "running"}}
+        client = MothrClient(result_cache=ResultCache(":memory:", ["test"]))
+        with pytest.raises(TimeoutError):
+            JobRequest(client=client, service="test").run_job(
+                poll_frequency=0.01, timeout=0.05
+            )
+        assert JobRequest(client=client, service="test").submit() == "j2"
+        # Nor is a job that finished while nobody waited on it
+        mock_query.return_value = {"job": {"status": "complete"}}
+        assert JobRequest(client=client, service="test").submit() == "j3"
+
+    @mock.patch("gql.dsl.DSLSchema.mutate")
+    @mock.patch("gql.dsl.DSLSchema.query")
+    def test_timeout_leaves_shared_job(self, mock_query, mock_mutate):
+        mock_mutate.side_effect = lambda field: (
+            {"cancelJob": {"status": "cancelled"}}
+            if field.ast_field.name.value == "cancelJob"
+            else {"submitJob": {"job": {"jobId": "j1", "status": "queued"}}}
+        )
+        mock_query.return_value = {"job": {"status": "running"}}
+        client = MothrClient(result_cache=ResultCache(":memory:", ["test"]))
+        first = JobRequest(client=client, service="test")
+        assert first.submit() == "j1"
+        second = JobRequest(client=client, service="test")
+        with pytest.raises(TimeoutError):
+            second.run_job(poll_frequency=0.01, timeout=0.05)
+        # The job still has a waiter, so it is neither cancelled nor forgotten
+        assert mock_mutate.call_count == 1
+        assert JobRequest(client=client, service="test").submit() == "j1"
+        assert mock_mutate.call_count == 1
+
+    @mock.patch("gql.dsl.DSLSchema.mutate")
+    @mock.patch("gql.dsl.DSLSchema.query")
+    def test_map_cached(self, mock_query, mock_mutate):
+        counter = itertools.count()
+        mock_mutate.side_effect = lambda *fields: {
+            f"job{i}": {"job": {"jobId": f"job-{next(counter)}", "status": "queued"}}
+            for i in range(len(fields))
+        }
+        mock_query.side_effect = lambda *fields: {
+            f"job{i}": {
+                "jobId": f.ast_field.arguments[0].value.value,
+                "service": "test",
+                "status": "complete",
+            }
+            for i, f in enumerate(fields)
+        }
+        client = MothrClient(result_cache=ResultCache(":memory:", ["test"]))
+        client.tracker.poll_frequency = 0.01
+        params = [[{"type": "parameter", "value": str(i)}] for i in range(3)]
+        first = list(client.map("test", params))
+        assert mock_mutate.call_count == 1
+        assert mock_query.call_count >= 1
+        queries = mock_query.call_count
+        assert list(client.map("test", params)) == first
+        assert mock_mutate.call_count == 1
+        assert mock_query.call_count == queries
@@ -0,0 +1,130 @@
+import io
+import itertools
+import json
+
+import mock
+import pytest
+from mothrpy.cli import _last_line_end, main
+
+
+def submit_jobs(counter):
+    def mutate(*fields):
+        return {
+            f.ast_field.alias.value: {
+                "job": {"jobId": f"job-{next(counter)}", "status": "queued"}
+            }
+            for f in fields
+        }
+
+    return mutate
+
+
+def poll_jobs(*fields):
+    return {
+        f.ast_field.alias.value: {
+            "jobId": f.ast_field.arguments[0].value.value,
+            "status": "complete",
+            "result": "done",
+        }
+        for f in fields
+    }
+
+
+class TestCli:
+    @mock.patch("gql.dsl.DSLSchema.mutate")
+    @mock.patch("gql.dsl.DSLSchema.query")
+    def test_run(self, mock_query, mock_mutate, tmp_path):
+        mock_mutate.side_effect = submit_jobs(itertools.count())
+        mock_query.side_effect = poll_jobs
+        jobs = tmp_path / "jobs.jsonl"
+        jobs.write_text(
+            "\n".join(
+                [
+                    json.dumps({"id": "a", "service": "echo"}),
+                    json.dumps({"parameters": [{"type": "parameter", "value": "b"}]}),
+                    "",
+                    "not json",
+                    json.dumps({"id": "c", "service": "echo"}),
+                ]
+            )
+        )
+        out = tmp_path / "results.jsonl"
+        # A previous run finished job a and was stopped while writing job c
+        out.write_text(json.dumps({"id": "a", "status": "complete"}) + '\n{"id": "c"')
+        status = main(
+            [
+                "run",
+                "--in",
+                str(jobs),
+                "--out",
+                str(out),
+                "-j",
+                "2",
+                "--service",
+                "echo",
+                "--resume",
+                "--progress",
+                "0",
+            ]
+        )
+        assert status == 1
+        results = {}
+        for line in out.read_text().splitlines():
+            result = json.loads(line)
+            results[result["id"]] = result
+        assert set(results) == {"a", 2, 4, "c"}
+        assert results[2]["status"] == "complete"
+        assert results["c"]["result"] == "done"
+        assert results[4]["status"] == "failed"
+        assert sum(len(call[0]) for call in mock_mutate.call_args_list) == 2
+
+    @mock.patch("gql.dsl.DSLSchema.mutate")
+    @mock.patch("gql.dsl.DSLSchema.query")
+    def test_run_error(self, mock_query, mock_mutate, tmp_path, capsys):
+        counter = itertools.count()
+        cancelled = []
+
+        def mutate(*fields):
+            if fields[0].ast_field.name.value == "cancelJob":
+                cancelled.extend(f.ast_field.arguments[0].value.value for f in fields)
+                return {
+                    f.ast_field.alias.value: {"status": "cancelled"} for f in fields
+                }
+            if mock_mutate.call_count > 1:
+                raise ConnectionError("Connection refused")
+            return submit_jobs(counter)(*fields)
+
+        mock_mutate.side_effect = mutate
+        mock_query.side_effect = lambda *fields: {
+            f.ast_field.alias.value: {
+                "jobId": f.ast_field.arguments[0].value.value,
+                "status": "complete"
+                if f.ast_field.arguments[0].value.value == "job-0"
+                else "running",
+                "result": "done",
+            }
+            for f in fields
+        }
+        jobs = tmp_path / "jobs.jsonl"
+        jobs.write_text("\n".join(json.dumps({"id": i}) for i in range(4)))
+        out = tmp_path / "results.jsonl"
+        args = ["run", "--in", str(jobs), "--out", str(out), "-j", "2"]
+        assert main(args + ["--service", "echo", "--progress", "0"]) == 1
+        assert [json.loads(line)["id"] for line in out.read_text().splitlines()] == [0]
+        # The job still running when the run stopped is cancelled
+        assert cancelled == ["job-1"]
+        err = capsys.readouterr().err
+        assert "done: 3 submitted, 1 complete" in err
+        assert err.endswith("mothrpy: Connection refused\n")
+
+    def test_usage(self, capsys):
+        with pytest.raises(SystemExit):
+            main([])
+        assert main(["run", "-j", "0"]) == 2
+        assert "--jobs" in capsys.readouterr().err
+
+    @pytest.mark.parametrize("block_size", [1, 4, 1 << 16])
+    def test_last_line_end(self, block_size):
+        for data in (b"", b"partial", b"a\n", b'{"id": 1}\n{"id"', b"ab\n" * 5 + b"c"):
+            expected = data.rfind(b"\n") + 1 if not data.endswith(b"\n") else len(data)
+            assert _last_line_end(io.BytesIO(data), block_size) == expected
@@ -1,6 +1,7 @@
 import mock
 import pytest
-from mothrpy import MothrClient
+from gql.transport.exceptions import TransportQueryError
+from mothrpy import JobRequest, MothrClient
 
 
 class TestMothrClient:
@@ -13,6 +14,7 @@ class TestMothrClient:
         access, refresh = client.login(username="test", password="password")
         assert access == "access-token"
         assert refresh == "refresh-token"
+        assert client.headers["Authorization"] == "Bearer access-token"
 
     @mock.patch("gql.dsl.DSLSchema.mutate")
     def test_refresh(self, mock_mutate):
@@ -61,3 +63,80 @@ class TestMothrClient:
         client = MothrClient()
         services = client.services()
         assert len(services) == 4
+
+    @mock.patch("gql.dsl.DSLSchema.query")
+    def test_service_cache(self, mock_query):
+        mock_query.side_effect = lambda q: {
+            "service": [{"name": "test", "version": "latest"}],
+            "services": [{"name": "test", "version": "latest"}],
+        }
+        client = MothrClient(service_cache_ttl=60)
+        assert client.service("test") == client.service("test")
+        client.service("test", fields=["name"])
+        client.services()
+        client.services()
+        assert mock_query.call_count == 3
+        assert client.invalidate_services("other") == 1
+        assert client.invalidate_services("test") == 2
+        client.service("test")
+        assert mock_query.call_count == 4
+
+    @mock.patch("gql.dsl.DSLSchema.query")
+    def test_service_cache_disabled(self, mock_query):
+        mock_query.return_value = {"service": [{"name": "test"}]}
+        client = MothrClient()
+        client.service("test")
+        client.service("test")
+        assert mock_query.call_count == 2
+        with pytest.raises(ValueError):
+            client.watch_services("services")
+
+    @mock.patch("gql.dsl.DSLSchema.mutate")
+    def test_submit_many(self, mock_mutate):
+        mock_mutate.side_effect = [
+            {
+                "job0": {"job": {"jobId": "job-1", "status": "submitted"}},
+                "job1": {"job": {"jobId": "job-2", "status": "submitted"}},
+            },
+            {"job0": {"job": {"jobId": "job-3", "status": "submitted"}}},
+        ]
+        client = MothrClient()
+        requests = [JobRequest(client=client, service="test") for _ in range(3)]
+        job_ids = client.submit_many(requests, chunk_size=2)
+        assert job_ids == ["job-1", "job-2", "job-3"]
+        assert mock_mutate.call_count == 2
+        assert len(mock_mutate.call_args_list[0][0]) == 2
+        assert requests[2].job_id == "job-3"
+        assert requests[2].status == "submitted"
+
+    @mock.patch("gql.dsl.DSLSchema.mutate")
+    def test_submit_many_partial_failure(self, mock_mutate):
+        mock_mutate.side_effect = TransportQueryError(
+            "service not found",
+            errors=[{"message": "service not found", "path": ["job1"]}],
+            data={
+                "job0": {"job": {"jobId": "job-1", "status": "submitted"}},
+                "job1": None,
+            },
+        )
+        client = MothrClient()
+        requests = [JobRequest(client=client, service="test") for _ in range(2)]
+        job_ids = client.submit_many(requests)
+        assert job_ids[0] == "job-1"
+        assert isinstance(job_ids[1], ValueError)
+        assert "service not found" in str(job_ids[1])
+        assert requests[1].job_id is None
+
+    @mock.patch("gql.dsl.DSLSchema.mutate")
+    def test_cancel_many(self, mock_mutate):
+        mock_mutate.side_effect = TransportQueryError(
+            "job not found",
+            errors=[{"message": "job not found", "path": ["job1"]}],
+            data={"job0": {"jobId": "job-1", "status": "cancelled"}, "job1": None},
+        )
+        client = MothrClient()
+        results = client.cancel_many(["job-1", "job-2"])
+        assert results[0]["status"] == "cancelled"
+        assert isinstance(results[1], ValueError)
+        assert mock_mutate.call_count == 1
+        assert len(mock_mutate.call_args[0]) == 2
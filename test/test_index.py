@@ -0,0 +1,110 @@
+import asyncio
+import time
+
+import mock
+import pytest
+from gql.transport.exceptions import TransportClosed
+from graphql import ExecutionResult, print_ast
+from mothrpy import JobStateIndex, MothrClient
+from mothrpy.subscriptions import subscription_sent
+
+TRANSPORT_SUBSCRIBE = "gql.transport.websockets.WebsocketsTransport.subscribe"
+
+
+def execution_results(subscribe):
+    """Adapt a mock subscription yielding data to the websocket transport"""
+
+    async def transport_subscribe(self, document, *args, **kwargs):
+        generator = subscribe(self, document, *args, **kwargs)
+        try:
+            async for data in generator:
+                yield ExecutionResult(data=data)
+        finally:
+            await generator.aclose()
+
+    return transport_subscribe
+
+
+def job_event(job_id, status):
+    return {"subscribeJobs": {"jobId": job_id, "type": status}}
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+@mock.patch(
+    "gql.transport.websockets.WebsocketsTransport.close", new_callable=mock.AsyncMock
+)
+@mock.patch(
+    "gql.transport.websockets.WebsocketsTransport.connect", new_callable=mock.AsyncMock
+)
+@mock.patch("gql.dsl.DSLSchema.query")
+class TestJobStateIndex:
+    def test_events(self, mock_query, mock_connect, mock_close):
+        mock_query.return_value = {"submitted": [{"jobId": "a"}], "running": []}
+
+        async def subscribe(*args, **kwargs):
+            subscription_sent()
+            await asyncio.sleep(0.1)
+            yield job_event("a", "running")
+            yield job_event("b", "submitted")
+            yield job_event("a", "complete")
+            yield job_event("b", "failed")
+            await asyncio.sleep(60)
+
+        client = MothrClient()
+        with mock.patch(TRANSPORT_SUBSCRIBE, execution_results(subscribe)):
+            index = client.job_index
+            assert index.wait_ready(timeout=5)
+            wait_for(lambda: index.status("b") == "failed")
+        assert index.status("a") == "complete"
+        assert index.status("c") is None
+        assert index.jobs("failed") == ["b"]
+        assert index.counts()["complete"] == 1
+        assert mock_query.call_count == 1
+        assert index.prune() == 2
+        assert len(index) == 0
+        client.close()
+
+    def test_reconcile(self, mock_query, mock_connect, mock_close):
+        mock_query.side_effect = [
+            {"submitted": [{"jobId": "a"}, {"jobId": "b"}], "running": []},
+            {"submitted": [], "running": [{"jobId": "b"}]},
+            {"job0": {"jobId": "a", "status": "complete"}},
+        ]
+        attempts = []
+
+        async def subscribe(*args, **kwargs):
+            subscription_sent()
+            attempts.append(1)
+            if len(attempts) == 1:
+                await asyncio.sleep(0.1)
+                raise TransportClosed("connection lost")
+            await asyncio.sleep(60)
+            yield job_event("a", "running")
+
+        client = MothrClient()
+        client.subscriptions.reconnect_delay = 0.01
+        index = JobStateIndex(client)
+        with mock.patch(TRANSPORT_SUBSCRIBE, execution_results(subscribe)):
+            index.start()
+            wait_for(lambda: index.reconciliations == 2)
+        assert index.status("a") == "complete"
+        assert index.status("b") == "running"
+        lookup = print_ast(mock_query.call_args[0][0].ast_field)
+        assert 'jobId: "a"' in lookup
+        client.close()
+
+    def test_monotonic(self, mock_query, mock_connect, mock_close):
+        index = JobStateIndex(MothrClient())
+        assert index.update("a", "running")
+        assert not index.update("a", "submitted")
+        assert index.update("a", "cancelled")
+        assert not index.update("a", "complete")
+        assert index.status("a") == "cancelled"
+        with pytest.raises(ValueError):
+            JobStateIndex(MothrClient(), statuses=["pending"])
@@ -0,0 +1,73 @@
+import itertools
+
+import mock
+import pytest
+from gql.transport.exceptions import TransportQueryError
+from mothrpy import JobRequest, MothrClient, SubmissionJournal
+
+
+def submit_jobs(counter):
+    def mutate(*fields):
+        return {
+            f.ast_field.alias.value: {
+                "job": {"jobId": f"job-{next(counter)}", "status": "queued"}
+            }
+            for f in fields
+        }
+
+    return mutate
+
+
+def requests(client):
+    return [
+        JobRequest(client=client, service="echo").add_parameter(value=value)
+        for value in ("a", "a", "b")
+    ]
+
+
+class TestSubmissionJournal:
+    def test_batching(self, tmp_path):
+        path = str(tmp_path / "journal.sqlite")
+        journal = SubmissionJournal(path, flush_interval=60, batch_size=2)
+        journal.record("key", "job-0")
+        assert len(SubmissionJournal(path)) == 0
+        journal.record("key", "job-1")
+        assert len(SubmissionJournal(path)) == 2
+        journal.record("other", "job-2")
+        journal.close()
+        reopened = SubmissionJournal(path)
+        assert reopened.claim("key") == ("job-0", None)
+        assert reopened.claim("key") == ("job-1", None)
+        assert reopened.claim("key") is None
+        with pytest.raises(ValueError):
+            SubmissionJournal(path, sync="sometimes")
+
+    @mock.patch("gql.dsl.DSLSchema.mutate")
+    @mock.patch("gql.dsl.DSLSchema.query")
+    def test_resume(self, mock_query, mock_mutate, tmp_path):
+        path = str(tmp_path / "journal.sqlite")
+        mock_mutate.side_effect = submit_jobs(itertools.count())
+        client = MothrClient(journal=SubmissionJournal(path))
+        assert client.submit_many(requests(client)) == ["job-0", "job-1", "job-2"]
+        client.close()
+
+        # Restart, job-2 no longer exists
+        mock_query.side_effect = TransportQueryError(
+            "job not found",
+            errors=[{"message": "job not found", "path": ["job2"]}],
+            data={
+                "job0": {"status": "complete"},
+                "job1": {"status": "running"},
+                "job2": None,
+            },
+        )
+        journal = SubmissionJournal(path)
+        client = MothrClient(journal=journal)
+        counts = journal.resume(client)
+        assert counts == {"complete": 1, "running": 1, "missing": 1}
+        resumed = requests(client)
+        assert client.submit_many(resumed) == ["job-0", "job-1", "job-3"]
+        assert resumed[0].status == "complete"
+        assert len(mock_mutate.call_args[0]) == 1
+        client.close()
+        assert len(SubmissionJournal(path)) == 3
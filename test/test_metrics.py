@@ -0,0 +1,95 @@
+import json
+import urllib.request
+
+import mock
+import requests
+from mothrpy import JobRequest, Metrics, MothrClient
+
+
+def adapter_response(data):
+    def send(request, **kwargs):
+        response = requests.Response()
+        response.status_code = 200
+        response._content = json.dumps({"data": data}).encode("utf-8")
+        response.request = request
+        return response
+
+    return send
+
+
+class TestMetrics:
+    def test_prometheus(self):
+        metrics = Metrics()
+        metrics.request("job", 0.02)
+        metrics.request("job", 2, error=True)
+        metrics.increment("bytes_sent_total", 100)
+        text = metrics.prometheus()
+        assert "# TYPE mothrpy_request_seconds histogram" in text
+        assert 'mothrpy_request_seconds_bucket{operation="job",le="0.025"} 1' in text
+        assert 'mothrpy_request_seconds_bucket{operation="job",le="+Inf"} 2' in text
+        assert 'mothrpy_request_seconds_count{operation="job"} 2' in text
+        assert 'mothrpy_request_errors_total{operation="job"} 1' in text
+        assert "mothrpy_bytes_sent_total 100" in text
+
+    def test_prometheus_precision(self):
+        metrics = Metrics()
+        metrics.increment("bytes_sent_total", 123456789)
+        metrics.observe("request_seconds", 0.1)
+        metrics.observe("request_seconds", 1234.5678)
+        text = metrics.prometheus()
+        assert "mothrpy_bytes_sent_total 123456789" in text
+        assert f"mothrpy_request_seconds_sum {0.1 + 1234.5678!r}" in text
+        assert 'mothrpy_request_seconds_bucket{le="0.001"} 0' in text
+        assert 'mothrpy_request_seconds_bucket{le="10"} 1' in text
+
+    def test_callback(self):
+        callback = mock.Mock()
+        metrics = Metrics(callback=callback)
+        metrics.observe("job_polls", 3)
+        callback.assert_called_once_with("job_polls", 3, {})
+        assert metrics.histogram("job_polls").count == 1
+
+    @mock.patch("requests.adapters.HTTPAdapter.send")
+    def test_client_requests(self, mock_send):
+        mock_send.side_effect = adapter_response(
+            {"service": [{"name": "test", "version": "latest"}]}
+        )
+        metrics = Metrics()
+        client = MothrClient(metrics=metrics)
+        client.service("test")
+        assert metrics.counter("requests_total", operation="service") == 1
+        assert metrics.histogram("request_seconds", operation="service").count == 1
+        assert metrics.counter("bytes_sent_total") > 0
+        assert metrics.counter("bytes_received_total") > 0
+        assert metrics.histogram("resolve_field_seconds") is None
+        client.close()
+
+    @mock.patch("gql.dsl.DSLSchema.mutate")
+    @mock.patch("gql.dsl.DSLSchema.query")
+    def test_job_polls(self, mock_query, mock_mutate):
+        mock_mutate.return_value = {
+            "submitJob": {"job": {"jobId": "test", "status": "submitted"}}
+        }
+        mock_query.side_effect = [
+            {"job": {"status": "running"}},
+            {"job": {"status": "running"}},
+            {"job": {"status": "complete"}},
+            {"job": {"jobId": "test", "status": "complete"}},
+        ]
+        metrics = Metrics()
+        request = JobRequest(client=MothrClient(metrics=metrics), service="test")
+        request.run_job(poll_frequency=0)
+        assert metrics.histogram("job_polls").sum == 3
+
+    def test_serve(self):
+        metrics = Metrics()
+        metrics.increment("requests_total", operation="job")
+        server = metrics.serve(0, addr="127.0.0.1")
+        try:
+            url = f"http://127.0.0.1:{server.server_address[1]}/metrics"
+            with urllib.request.urlopen(url, timeout=5) as response:
+                body = response.read().decode("utf-8")
+        finally:
+            server.shutdown()
+            server.server_close()
+        assert 'mothrpy_requests_total{operation="job"} 1' in body
@@ -0,0 +1,143 @@
+import itertools
+
+import mock
+import pytest
+from mothrpy import MothrClient
+
+
+def submit_jobs(counter):
+    def mutate(*fields):
+        return {
+            f"job{i}": {"job": {"jobId": f"job-{next(counter)}", "status": "queued"}}
+            for i in range(len(fields))
+        }
+
+    return mutate
+
+
+def job_id(field):
+    return field.ast_field.arguments[0].value.value
+
+
+class TestParallel:
+    @mock.patch("gql.dsl.DSLSchema.mutate")
+    @mock.patch("gql.dsl.DSLSchema.query")
+    def test_map(self, mock_query, mock_mutate):
+        mock_mutate.side_effect = submit_jobs(itertools.count())
+        polls = itertools.count()
+
+        def query(*fields):
+            # Later jobs finish first
+            n = next(polls)
+            return {
+                f"job{i}": {
+                    "jobId": job_id(f),
+                    "status": "complete" if n >= 3 - i else "running",
+                    "result": job_id(f),
+                }
+                for i, f in enumerate(fields)
+            }
+
+        mock_query.side_effect = query
+        client = MothrClient()
+        client.tracker.poll_frequency = 0.01
+        params = ([{"type": "parameter", "value": str(i)}] for i in range(3))
+        results = list(client.map("test", params, max_in_flight=3))
+        assert [r["result"] for r in results] == ["job-0", "job-1", "job-2"]
+        assert mock_mutate.call_count == 1
+        assert len(mock_mutate.call_args[0]) == 3
+
+    @mock.patch("gql.dsl.DSLSchema.mutate")
+    @mock.patch("gql.dsl.DSLSchema.query")
+    def test_as_completed_window(self, mock_query, mock_mutate):
+        mock_mutate.side_effect = submit_jobs(itertools.count())
+        mock_query.side_effect = lambda *fields: {
+            f"job{i}": {"jobId": job_id(f), "status": "complete"}
+            for i, f in enumerate(fields)
+        }
+        consumed = []
+
+        def params():
+            for i in range(5):
+                consumed.append(i)
+                yield {"inputs": [f"s3://bucket/{i}"]}
+
+        client = MothrClient()
+        client.tracker.poll_frequency = 0.01
+        results = client.as_completed("test", params(), max_in_flight=2)
+        index, result = next(results)
+        assert consumed == [0, 1]
+        assert result["jobId"] == f"job-{index}"
+        assert sorted(i for i, _ in [(index, result), *results]) == [0, 1, 2, 3, 4]
+        assert all(len(c[0]) <= 2 for c in mock_mutate.call_args_list)
+
+    @mock.patch("gql.dsl.DSLSchema.mutate")
+    @mock.patch("gql.dsl.DSLSchema.query")
+    def test_map_failed(self, mock_query, mock_mutate):
+        mock_mutate.side_effect = submit_jobs(itertools.count())
+        mock_query.side_effect = lambda *fields: {
+            f"job{i}": {"jobId": job_id(f), "status": "failed", "error": "failed"}
+            for i, f in enumerate(fields)
+        }
+        client = MothrClient()
+        client.tracker.poll_frequency = 0.01
+        with pytest.raises(RuntimeError):
+            list(client.map("test", [[], []]))
+        results = list(client.map("test", [[], []], return_failed=True))
+        assert [r["status"] for r in results] == ["failed", "failed"]
+
+    @mock.patch("gql.dsl.DSLSchema.mutate")
+    @mock.patch("gql.dsl.DSLSchema.query")
+    def test_fail_fast(self, mock_query, mock_mutate):
+        cancelled = []
+
+        def mutate(*fields):
+            if fields[0].ast_field.name.value == "cancelJob":
+                cancelled.extend(job_id(f) for f in fields)
+                return {f"job{i}": {"status": "cancelled"} for i in range(len(fields))}
+            return submit_jobs(itertools.count())(*fields)
+
+        mock_mutate.side_effect = mutate
+        mock_query.side_effect = lambda *fields: {
+            f"job{i}": {
+                "jobId": job_id(f),
+                "status": "failed" if job_id(f) == "job-0" else "running",
+                "error": "failed",
+            }
+            for i, f in enumerate(fields)
+        }
+        client = MothrClient()
+        client.tracker.poll_frequency = 0.01
+        with pytest.raises(RuntimeError):
+            list(client.map("test", [[] for _ in range(10)], fail_fast=True))
+        assert sorted(cancelled) == [f"job-{i}" for i in range(1, 10)]
+
+    @mock.patch("gql.dsl.DSLSchema.mutate")
+    @mock.patch("gql.dsl.DSLSchema.query")
+    def test_job_timeout(self, mock_query, mock_mutate):
+        counter = itertools.count()
+
+        def mutate(*fields):
+            if fields[0].ast_field.name.value == "cancelJob":
+                return {f"job{i}": {"status": "cancelled"} for i in range(len(fields))}
+            return submit_jobs(counter)(*fields)
+
+        mock_mutate.side_effect = mutate
+        mock_query.side_effect = lambda *fields: {
+            f"job{i}": {
+                "jobId": job_id(f),
+                "status": "complete" if job_id(f) == "job-0" else "running",
+            }
+            for i, f in enumerate(fields)
+        }
+        client = MothrClient()
+        client.tracker.poll_frequency = 0.01
+        params = [[], []]
+        results = list(client.map("test", params, job_timeout=0.1, return_failed=True))
+        assert [r["status"] for r in results] == ["complete", "cancelled"]
+        with pytest.raises(TimeoutError):
+            list(client.map("test", params, timeout=0.1))
+
+    def test_max_in_flight(self):
+        with pytest.raises(ValueError):
+            MothrClient().map("test", [], max_in_flight=0)
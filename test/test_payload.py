@@ -0,0 +1,122 @@
+import gzip
+import io
+import json
+import os
+
+import mock
+import pytest
+from mothrpy import JobRequest, MothrClient, ResultCache, StreamSource
+from mothrpy import payload
+from mothrpy.payload import JSONBody, decode_json
+
+TEXT = 'héllo "wörld" \\ 😀\n' * 100
+
+
+def json_response(data):
+    content = json.dumps({"data": data}).encode("utf-8")
+    response = mock.Mock()
+    response.headers = {"Content-Length": str(len(content))}
+    response.content = content
+    return response
+
+
+class TestStreamSource:
+    @pytest.mark.parametrize(
+        "source",
+        [
+            lambda path: path,
+            lambda path: str(path),
+            lambda path: open(path, "rb"),
+            lambda path: open(path, encoding="utf-8"),
+            lambda path: memoryview(path.read_bytes()),
+        ],
+    )
+    def test_chunks(self, tmp_path, source):
+        path = tmp_path / "input.txt"
+        path.write_text(TEXT, encoding="utf-8")
+        value = source(path)
+        stream = StreamSource(value, chunk_size=7)
+        assert stream.read() == TEXT
+        # Read again from the start, e.g. when a request is retried
+        assert "".join(stream.chunks()) == TEXT
+        if hasattr(value, "close"):
+            value.close()
+
+    def test_key(self, tmp_path):
+        def key(source):
+            return ResultCache.key({"service": "echo", "inputStream": source})
+
+        keys = {key(StreamSource(bytes([i]))) for i in range(5)}
+        assert len(keys) == 5
+        path = tmp_path / "input.txt"
+        path.write_text("a")
+        first = key(StreamSource(path))
+        assert first == key(StreamSource(b"a"))
+        path.write_text("b")
+        assert key(StreamSource(path)) != first
+        # Reading a pipe to hash it would leave nothing to send
+        read, write = os.pipe()
+        with open(read, "rb") as f:
+            os.close(write)
+            assert key(StreamSource(f)) is None
+
+    def test_body(self):
+        payload = {"query": "q", "variables": {"a": StreamSource(TEXT.encode())}}
+        body = JSONBody(payload, compress=True)
+        content = b"".join(body)
+        assert body.sent == len(content)
+        assert json.loads(gzip.decompress(content))["variables"]["a"] == TEXT
+
+
+class TestDecodeJson:
+    # Every string is large, or none are
+    @pytest.mark.parametrize("large_string", [1, 1 << 16])
+    def test_chunk_boundaries(self, large_string):
+        doc = {
+            "data": {
+                "job": {"result": TEXT, "values": [1, -2.5e3, True, None]},
+                TEXT: ["\ud83d", "\\", 0.5],
+            }
+        }
+        with mock.patch.object(payload, "LARGE_STRING", large_string):
+            for ensure_ascii in (True, False):
+                text = json.dumps(doc, ensure_ascii=ensure_ascii)
+                for size in (1, 3, 64):
+                    chunks = [text[i : i + size] for i in range(0, len(text), size)]
+                    assert decode_json(chunks) == doc
+
+    @pytest.mark.parametrize("large_string", [1, 1 << 16])
+    def test_invalid(self, large_string):
+        with mock.patch.object(payload, "LARGE_STRING", large_string):
+            for text in ('{"a": 1', '{"a" 1}', "[1, 2] 3", '"abc', '"a\\x"'):
+                with pytest.raises(ValueError):
+                    decode_json([text[:2], text[2:]])
+
+
+class TestInputStream:
+    @mock.patch("requests.Session.request")
+    def test_submit(self, mock_request):
+        mock_request.return_value = json_response(
+            {"submitJob": {"job": {"jobId": "job-1", "status": "queued"}}}
+        )
+        client = MothrClient()
+        request = JobRequest(
+            client=client, service="echo", input_stream=io.BytesIO(TEXT.encode())
+        )
+        assert request.submit() == "job-1"
+        kwargs = mock_request.call_args[1]
+        assert kwargs["stream"]
+        payload = json.loads(b"".join(kwargs["data"]))
+        assert "$inputStream: String" in payload["query"]
+        assert payload["variables"] == {"inputStream": TEXT}
+
+    @mock.patch("gql.dsl.DSLSchema.mutate")
+    def test_inline(self, mock_mutate):
+        mock_mutate.return_value = {
+            "submitJob": {"job": {"jobId": "job-1", "status": "queued"}}
+        }
+        client = MothrClient()
+        request = JobRequest(client=client, service="echo", input_stream="inline")
+        request.submit()
+        assert request.req_args["inputStream"] == "inline"
+        assert mock_mutate.call_count == 1
@@ -0,0 +1,106 @@
+import re
+
+import mock
+import pytest
+from graphql import print_ast
+from mothrpy import JobRequest, MothrClient
+
+
+def submit_jobs(submitted):
+    def mutate(*fields):
+        resp = {}
+        for i, field in enumerate(fields):
+            query = print_ast(field.ast_field)
+            if "cancelJob" in query:
+                return {"cancelJob": {"jobId": "slow", "status": "cancelled"}}
+            service = re.search(r'service: "(\w+)"', query).group(1)
+            submitted.append(query)
+            resp[f"job{i}"] = {"job": {"jobId": service, "status": "queued"}}
+        return resp
+
+    return mutate
+
+
+def poll_jobs(statuses):
+    def query(*fields):
+        resp = {}
+        for i, field in enumerate(fields):
+            job_id = field.ast_field.arguments[0].value.value
+            status = statuses.get(job_id, "complete")
+            resp[f"job{i}"] = {"jobId": job_id, "status": status, "error": ""}
+        return resp
+
+    return query
+
+
+@mock.patch("gql.dsl.DSLSchema.mutate")
+@mock.patch("gql.dsl.DSLSchema.query")
+class TestPipeline:
+    def test_run(self, mock_query, mock_mutate):
+        submitted = []
+        mock_mutate.side_effect = submit_jobs(submitted)
+        mock_query.side_effect = poll_jobs({"c": "failed"})
+        client = MothrClient()
+        client.tracker.poll_frequency = 0.01
+
+        pipeline = client.pipeline(return_failed=True)
+        pipeline.add(
+            "a", JobRequest(client=client, service="a").add_output("s3://bucket/a")
+        )
+        pipeline.add("b", JobRequest(client=client, service="b"), depends=["a"])
+        pipeline.add("c", JobRequest(client=client, service="c"), depends=["a"])
+        pipeline.add("d", JobRequest(client=client, service="d"), depends=["c"])
+        pipeline.add(
+            "e",
+            lambda upstream: JobRequest(
+                client=client, service="e", inputs=[upstream["b"]["jobId"]]
+            ),
+            depends=["b"],
+        )
+        results = pipeline.run()
+
+        assert {name: r["status"] for name, r in results.items()} == {
+            "a": "complete",
+            "b": "complete",
+            "c": "failed",
+            "d": "cancelled",
+            "e": "complete",
+        }
+        assert len(submitted) == 4
+        assert mock_mutate.call_count == 3  # b and c are submitted together
+        assert "s3://bucket/a" in submitted[1] and "s3://bucket/a" in submitted[2]
+        assert pipeline.downstream("a") == ["b", "e", "c", "d"]
+
+    def test_failure_raises(self, mock_query, mock_mutate):
+        mock_mutate.side_effect = submit_jobs([])
+        mock_query.side_effect = poll_jobs({"a": "failed"})
+        client = MothrClient()
+        client.tracker.poll_frequency = 0.01
+        pipeline = client.pipeline()
+        pipeline.add("a", JobRequest(client=client, service="a"))
+        with pytest.raises(RuntimeError):
+            pipeline.run()
+        with pytest.raises(RuntimeError):
+            pipeline.run()
+
+    def test_cancel_on_close(self, mock_query, mock_mutate):
+        mock_mutate.side_effect = submit_jobs([])
+        mock_query.side_effect = poll_jobs({"slow": "running"})
+        client = MothrClient()
+        client.tracker.poll_frequency = 0.01
+        pipeline = client.pipeline()
+        pipeline.add("fast", JobRequest(client=client, service="fast"))
+        pipeline.add("slow", JobRequest(client=client, service="slow"))
+        results = pipeline.as_completed()
+        assert next(results)[0] == "fast"
+        results.close()
+        cancel = print_ast(mock_mutate.call_args[0][0].ast_field)
+        assert 'cancelJob(jobId: "slow")' in cancel
+
+    def test_add(self, mock_query, mock_mutate):
+        pipeline = MothrClient().pipeline()
+        pipeline.add("a", JobRequest(service="a"))
+        with pytest.raises(ValueError):
+            pipeline.add("a", JobRequest(service="a"))
+        with pytest.raises(ValueError):
+            pipeline.add("b", JobRequest(service="b"), depends=["missing"])
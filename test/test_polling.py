@@ -0,0 +1,77 @@
+import mock
+import pytest
+from mothrpy import AdaptivePolicy, BackoffPolicy, JobRequest, MothrClient
+
+
+class TestPolling:
+    def test_backoff(self):
+        policy = BackoffPolicy(initial=0.1, factor=2, maximum=10, jitter=0)
+        assert policy.delay(0) == 0.1
+        assert policy.delay(3) == 3
+        assert policy.delay(60) == 10
+        with pytest.raises(ValueError):
+            BackoffPolicy(factor=1)
+
+    def test_adaptive(self):
+        policy = AdaptivePolicy(initial=0.1, factor=2, jitter=0, smoothing=0.5)
+        assert policy.delay(0, "test", "latest") == 0.1
+        policy.observe("test", "latest", {"status": "failed", "runTime": 1})
+        assert policy.estimate("test", "latest") is None
+
+        policy.observe(
+            "test", "latest", {"status": "complete", "waitTime": 1, "runTime": 3}
+        )
+        policy.observe(
+            "test", "latest", {"status": "complete", "waitTime": 1, "runTime": 5}
+        )
+        assert policy.estimate("test", "latest") == (1, 4)
+        # Poll at the expected completion time, then back off from it
+        assert policy.delay(0, "test", "latest") == 5
+        assert policy.delay(4, "test", "latest") == 1
+        assert policy.delay(5, "test", "latest") == 0.1
+        assert policy.delay(7, "test", "latest") == 2
+        assert policy.delay(0, "test", "1.0") == 0.1
+
+    @mock.patch("gql.dsl.DSLSchema.mutate")
+    @mock.patch("gql.dsl.DSLSchema.query")
+    def test_run_job_policy(self, mock_query, mock_mutate):
+        mock_mutate.return_value = {
+            "submitJob": {"job": {"jobId": "test", "status": "submitted"}}
+        }
+        mock_query.side_effect = [
+            {"job": {"status": "running", "waitTime": 0.5, "runTime": None}},
+            {"job": {"status": "complete", "waitTime": 0.5, "runTime": 2}},
+            {"job": {"jobId": "test", "status": "complete", "result": "done"}},
+        ]
+        policy = AdaptivePolicy(initial=0.01, jitter=0)
+        client = MothrClient(poll_policy=policy)
+        result = JobRequest(client=client, service="test").run_job()
+        assert result["result"] == "done"
+        assert policy.estimate("test", "latest") == (0.5, 2)
+
+    @mock.patch("gql.dsl.DSLSchema.mutate")
+    @mock.patch("gql.dsl.DSLSchema.query")
+    def test_run_job_track_policy(self, mock_query, mock_mutate):
+        mock_mutate.return_value = {
+            "submitJob": {"job": {"jobId": "test", "status": "submitted"}}
+        }
+        mock_query.side_effect = [
+            {"job0": {"jobId": "test", "status": "running"}},
+            {
+                "job0": {
+                    "jobId": "test",
+                    "status": "complete",
+                    "waitTime": 1,
+                    "runTime": 2,
+                }
+            },
+        ]
+        policy = AdaptivePolicy(initial=0.01, jitter=0)
+        client = MothrClient(poll_policy=policy)
+        client.tracker.poll_frequency = 0
+        result = JobRequest(client=client, service="test").run_job(mode="track")
+        assert result["status"] == "complete"
+        assert "waitTime" not in result
+        assert policy.estimate("test", "latest") == (1, 2)
+        assert mock_query.call_count == 2
+        client.close()
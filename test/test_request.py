@@ -36,6 +36,20 @@ class TestJobRequest:
         with pytest.raises(RuntimeError):
             request.run_job()
 
+    @mock.patch("gql.dsl.DSLSchema.mutate")
+    @mock.patch("gql.dsl.DSLSchema.query")
+    def test_run_job_timeout(self, mock_query, mock_mutate):
+        mock_mutate.side_effect = [
+            self.submit_response,
+            {"cancelJob": {"jobId": "test", "status": "cancelled"}},
+        ]
+        mock_query.return_value = {"job": {"status": "running"}}
+        request = JobRequest(service="test")
+        with pytest.raises(TimeoutError):
+            request.run_job(poll_frequency=0.01, timeout=0.05)
+        assert request.status == "cancelled"
+        assert mock_mutate.call_args[0][0].ast_field.name.value == "cancelJob"
+
     @mock.patch("gql.dsl.DSLSchema.mutate")
     @mock.patch("gql.dsl.DSLSchema.query")
     def test_run_job_fail_return_failed(self, mock_query, mock_mutate):
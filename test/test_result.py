@@ -0,0 +1,63 @@
+import mock
+import pytest
+from mothrpy import JobRequest, JobResult, MothrClient
+
+
+def selected(q):
+    return [f.name.value for f in q.ast_field.selection_set.selections]
+
+
+class TestJobResult:
+    @mock.patch("gql.dsl.DSLSchema.query")
+    def test_lazy_fields(self, mock_query):
+        mock_query.side_effect = [
+            {"job": {"jobId": "test", "service": "echo", "status": "complete"}},
+            {"job": {"result": "done"}},
+        ]
+        request = JobRequest(client=MothrClient(), service="echo")
+        request.job_id = "test"
+        job = request.lazy_result()
+        assert selected(mock_query.call_args[0][0]) == ["jobId", "service", "status"]
+        assert request.status == "complete"
+        assert job.status == "complete"
+        assert mock_query.call_count == 1
+        assert job["result"] == "done"
+        assert job.result == "done"
+        assert mock_query.call_count == 2
+        assert selected(mock_query.call_args[0][0]) == ["result"]
+
+    @mock.patch("gql.dsl.DSLSchema.query")
+    def test_object_fields(self, mock_query):
+        mock_query.return_value = {
+            "job": {"parameters": [{"type": "parameter", "value": "hello"}]}
+        }
+        job = JobResult(MothrClient(), "test", {"status": "complete"})
+        assert job.parameters[0]["value"] == "hello"
+        q = mock_query.call_args[0][0]
+        parameters = q.ast_field.selection_set.selections[0]
+        assert {f.name.value for f in parameters.selection_set.selections} == {
+            "type",
+            "name",
+            "value",
+            "delimiter",
+        }
+        with pytest.raises(AttributeError):
+            job.not_a_field
+
+    @mock.patch("gql.dsl.DSLSchema.query")
+    def test_drop(self, mock_query):
+        mock_query.return_value = {"job": {"result": "done", "error": ""}}
+        job = JobResult(
+            MothrClient(),
+            "test",
+            {"jobId": "test", "status": "complete", "result": "x"},
+        )
+        job.drop()
+        assert job.loaded == ("jobId", "status")
+        assert job.to_dict(["status", "result", "error"]) == {
+            "status": "complete",
+            "result": "done",
+            "error": "",
+        }
+        assert mock_query.call_count == 1
+        assert not hasattr(job, "__dict__")
@@ -0,0 +1,69 @@
+import mock
+import pytest
+from gql.dsl import query
+from graphql import print_ast
+from mothrpy import MothrClient
+from mothrpy.client import get_schema
+from mothrpy.selection import CachedValidationClient, SelectionCache, document_shape
+
+
+class TestSelectionCache:
+    def setup_method(self, _):
+        self.client = MothrClient()
+        self.cache = SelectionCache(self.client.ds.schema)
+
+    def test_nested_fields(self):
+        selection_set = self.cache.selection_set(
+            "Service", ["name", "parameters.name", "parameters.file_type.name"]
+        )
+        printed = print_ast(selection_set)
+        assert printed.count("parameters") == 1
+        assert "fileType {" in printed
+
+    def test_cached(self):
+        first = self.cache.selection_set("Job", ["jobId", "worker.queue"])
+        second = self.cache.selection_set("Job", ["jobId", "worker.queue"])
+        assert first is second
+        assert len(self.cache) == 1
+
+    def test_unknown_field(self):
+        with pytest.raises(KeyError):
+            self.cache.selection_set("Job", ["worker.foo"])
+        with pytest.raises(KeyError):
+            self.cache.selection_set("Job", ["status.foo"])
+
+    def test_maxsize(self):
+        cache = SelectionCache(self.client.ds.schema, maxsize=2)
+        for field in ["jobId", "status", "result"]:
+            cache.selection_set("Job", [field])
+        assert len(cache) <= 2
+
+    def test_resolve_field(self):
+        field = self.client.resolve_field(self.client.ds.Job, "user.roles")
+        assert "user {\n  roles\n}" in print_ast(field.ast)
+
+    def test_select_copies(self):
+        field = self.client.resolve_field(self.client.ds.Job, "parameters.name")
+        field.select(self.client.ds.Parameter.value)
+        assert "value" in print_ast(field.ast)
+        field = self.client.resolve_field(self.client.ds.Job, "parameters.name")
+        assert "value" not in print_ast(field.ast)
+        service = self.client._service_query("svc", "*", ["name"])
+        service.select(self.client.ds.Service.version)
+        service = self.client._service_query("svc", "*", ["name"])
+        selections = service.ast_field.selection_set.selections
+        assert [s.name.value for s in selections] == ["name"]
+
+    def test_document_shape(self):
+        first = query(self.client._job_query("job-1", ["status"]))
+        second = query(self.client._job_query("job-2", ["status"]))
+        other = query(self.client._job_query("job-1", ["status", "error"]))
+        assert document_shape(first) == document_shape(second)
+        assert document_shape(first) != document_shape(other)
+
+    @mock.patch("gql.Client.validate")
+    def test_validate_once(self, mock_validate):
+        client = CachedValidationClient(schema=get_schema())
+        for job_id in ["job-1", "job-2", "job-3"]:
+            client.validate(query(self.client._job_query(job_id, ["status"])))
+        assert mock_validate.call_count == 1
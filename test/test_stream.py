@@ -0,0 +1,68 @@
+import asyncio
+import threading
+from concurrent.futures import Future
+
+import mock
+import pytest
+from mothrpy import MessageStream
+
+
+def stream(maxsize, overflow):
+    manager = mock.Mock()
+    manager.subscribe_messages.side_effect = lambda *args, **kwargs: Future()
+    manager.watch.side_effect = lambda *args: Future()
+    message_stream = MessageStream(manager, maxsize=maxsize, overflow=overflow)
+    message_stream.add("job")
+    return message_stream
+
+
+async def publish(message_stream, count, job_id="job"):
+    for i in range(count):
+        await message_stream._put(job_id, i)
+
+
+class TestMessageStream:
+    def test_drop_oldest(self):
+        message_stream = stream(3, "drop_oldest")
+        asyncio.run(publish(message_stream, 5))
+        assert message_stream.get_batch(10) == [("job", 2), ("job", 3), ("job", 4)]
+        assert message_stream.dropped["job"] == 2
+        assert message_stream.get_batch(10, timeout=0.01) == []
+
+    def test_sample(self):
+        message_stream = stream(10, "sample")
+        asyncio.run(publish(message_stream, 1000))
+        messages = [m for _, m in message_stream.get_batch(100)]
+        assert len(messages) == 10
+        assert messages == sorted(messages)
+        assert message_stream.dropped["job"] == 990
+
+    def test_block(self):
+        message_stream = stream(2, "block")
+        loop = asyncio.new_event_loop()
+        thread = threading.Thread(target=loop.run_forever, daemon=True)
+        thread.start()
+        producer = asyncio.run_coroutine_threadsafe(publish(message_stream, 50), loop)
+        received = []
+        while len(received) < 50:
+            batch = message_stream.get_batch(3, timeout=5)
+            assert len(batch) <= 2
+            received.extend(m for _, m in batch)
+        assert received == list(range(50))
+        producer.result(timeout=5)
+        assert not message_stream.dropped
+        message_stream.remove("job")
+        assert message_stream.done
+        assert list(message_stream) == []
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+
+    def test_batch_shares(self):
+        message_stream = stream(100, "block")
+        message_stream.add("other")
+        asyncio.run(publish(message_stream, 20))
+        asyncio.run(publish(message_stream, 20, job_id="other"))
+        batch = message_stream.get_batch(10)
+        assert [job_id for job_id, _ in batch].count("other") == 5
+        with pytest.raises(ValueError):
+            MessageStream(mock.Mock(), overflow="newest")
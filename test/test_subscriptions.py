@@ -0,0 +1,226 @@
+import asyncio
+import re
+import threading
+import time
+
+import mock
+import pytest
+from gql.transport.exceptions import TransportClosed
+from graphql import ExecutionResult, print_ast
+from mothrpy import JobRequest, MothrClient, SubscriptionManager
+from mothrpy.subscriptions import subscription_sent
+
+TRANSPORT_SUBSCRIBE = "gql.transport.websockets.WebsocketsTransport.subscribe"
+
+
+def execution_results(subscribe):
+    """Adapt a mock subscription yielding data to the websocket transport"""
+
+    async def transport_subscribe(self, document, *args, **kwargs):
+        generator = subscribe(self, document, *args, **kwargs)
+        try:
+            async for data in generator:
+                yield ExecutionResult(data=data)
+        finally:
+            await generator.aclose()
+
+    return transport_subscribe
+
+
+def job_complete(job_id="test", status="complete"):
+    return {"subscribeJobComplete": {"jobId": job_id, "status": status}}
+
+
+@mock.patch(
+    "gql.transport.websockets.WebsocketsTransport.close", new_callable=mock.AsyncMock
+)
+@mock.patch(
+    "gql.transport.websockets.WebsocketsTransport.connect", new_callable=mock.AsyncMock
+)
+@mock.patch("gql.dsl.DSLSchema.query")
+class TestSubscriptionManager:
+    def test_wait(self, mock_query, mock_connect, mock_close):
+        mock_query.return_value = {"job": {"jobId": "test", "status": "running"}}
+
+        async def subscribe(*args, **kwargs):
+            subscription_sent()
+            yield job_complete()
+
+        manager = SubscriptionManager(MothrClient())
+        with mock.patch(TRANSPORT_SUBSCRIBE, execution_results(subscribe)):
+            futures = [manager.watch("test") for _ in range(3)]
+            results = [f.result(timeout=5) for f in futures]
+        assert all(r["status"] == "complete" for r in results)
+        assert mock_connect.call_count == 1
+        manager.close()
+
+    def test_stream(self, mock_query, mock_connect, mock_close):
+        mock_query.return_value = {"job": {"jobId": "test", "status": "running"}}
+
+        async def subscribe(_, document):
+            subscription_sent()
+            query = print_ast(document)
+            job_id = re.search(r'jobId: "(\w+)"', query).group(1)
+            if "subscribeJobMessages" in query:
+                for i in range(5):
+                    yield {"subscribeJobMessages": f"{job_id} {i}"}
+                await asyncio.sleep(60)
+            await asyncio.sleep(0.2)
+            yield job_complete(job_id)
+
+        manager = SubscriptionManager(MothrClient())
+        with mock.patch(TRANSPORT_SUBSCRIBE, execution_results(subscribe)):
+            with manager.stream(["a", "b"], maxsize=10) as stream:
+                messages = list(stream)
+        assert len(messages) == 10
+        assert [m for j, m in messages if j == "a"] == [f"a {i}" for i in range(5)]
+        assert mock_connect.call_count == 1
+        manager.close()
+
+    def test_stream_block_drains_on_complete(
+        self, mock_query, mock_connect, mock_close
+    ):
+        mock_query.return_value = {"job": {"jobId": "test", "status": "running"}}
+
+        async def subscribe(_, document):
+            subscription_sent()
+            if "subscribeJobMessages" in print_ast(document):
+                # Messages are queued by the transport as they are received
+                queue = asyncio.Queue()
+                for i in range(20):
+                    queue.put_nowait({"subscribeJobMessages": str(i)})
+                while True:
+                    yield await queue.get()
+            await asyncio.sleep(0.1)
+            yield job_complete()
+
+        manager = SubscriptionManager(MothrClient())
+        with mock.patch(TRANSPORT_SUBSCRIBE, execution_results(subscribe)):
+            with manager.stream(["test"], maxsize=2) as stream:
+                # The job completes while its buffer is full
+                time.sleep(0.5)
+                messages = [m for _, m in stream]
+        assert messages == [str(i) for i in range(20)]
+        assert not stream.dropped
+        assert not stream.errors
+        assert stream.active == []
+        manager.close()
+
+    def test_finished_before_subscribe(self, mock_query, mock_connect, mock_close):
+        mock_query.return_value = {"job": {"jobId": "test", "status": "failed"}}
+
+        async def subscribe(*args, **kwargs):
+            subscription_sent()
+            await asyncio.sleep(60)
+            yield job_complete()
+
+        manager = SubscriptionManager(MothrClient())
+        with mock.patch(TRANSPORT_SUBSCRIBE, execution_results(subscribe)):
+            result = manager.wait("test", timeout=5)
+        assert result["status"] == "failed"
+        manager.close()
+
+    def test_subscribed_before_query(self, mock_query, mock_connect, mock_close):
+        order = []
+
+        def query(_):
+            order.append("query")
+            return {"job": {"jobId": "test", "status": "running"}}
+
+        mock_query.side_effect = query
+
+        async def subscribe(*args, **kwargs):
+            # The operation takes a while to send
+            await asyncio.sleep(0.2)
+            order.append("subscribe")
+            subscription_sent()
+            yield job_complete()
+
+        manager = SubscriptionManager(MothrClient())
+        with mock.patch(TRANSPORT_SUBSCRIBE, execution_results(subscribe)):
+            assert manager.wait("test", timeout=5)["status"] == "complete"
+        assert order == ["subscribe", "query"]
+        manager.close()
+
+    def test_reconnect(self, mock_query, mock_connect, mock_close):
+        mock_query.return_value = {"job": {"jobId": "test", "status": "running"}}
+        attempts = []
+
+        async def subscribe(*args, **kwargs):
+            subscription_sent()
+            attempts.append(1)
+            if len(attempts) == 1:
+                raise TransportClosed("connection lost")
+            yield job_complete()
+
+        manager = SubscriptionManager(MothrClient(), reconnect_delay=0.01)
+        with mock.patch(TRANSPORT_SUBSCRIBE, execution_results(subscribe)):
+            result = manager.wait("test", timeout=5)
+        assert result["status"] == "complete"
+        assert mock_connect.call_count == 2
+        assert mock_query.call_count == 2
+        manager.close()
+
+    @mock.patch("gql.dsl.DSLSchema.mutate")
+    def test_run_job_subscribe(self, mock_mutate, mock_query, mock_connect, mock_close):
+        mock_mutate.return_value = {
+            "submitJob": {"job": {"jobId": "test", "status": "submitted"}}
+        }
+        mock_query.return_value = {"job": {"jobId": "test", "status": "running"}}
+
+        async def subscribe(*args, **kwargs):
+            subscription_sent()
+            yield job_complete(status="failed")
+
+        request = JobRequest(client=MothrClient(), service="test")
+        with mock.patch(TRANSPORT_SUBSCRIBE, execution_results(subscribe)):
+            result = request.run_job(mode="subscribe", return_failed=True)
+        assert result["status"] == "failed"
+        assert request.status == "failed"
+        request.client.subscriptions.close()
+
+    @mock.patch("gql.dsl.DSLSchema.mutate")
+    def test_run_job_timeout(self, mock_mutate, mock_query, mock_connect, mock_close):
+        mock_mutate.side_effect = [
+            {"submitJob": {"job": {"jobId": "test", "status": "submitted"}}},
+            {"cancelJob": {"jobId": "test", "status": "cancelled"}},
+        ]
+        mock_query.return_value = {"job": {"jobId": "test", "status": "running"}}
+
+        async def subscribe(*args, **kwargs):
+            subscription_sent()
+            await asyncio.sleep(60)
+            yield job_complete()
+
+        request = JobRequest(client=MothrClient(), service="test")
+        manager = request.client.subscriptions
+        with mock.patch(TRANSPORT_SUBSCRIBE, execution_results(subscribe)):
+            with pytest.raises(TimeoutError):
+                request.run_job(mode="subscribe", timeout=0.2)
+            # The subscription is stopped along with the job
+            deadline = time.monotonic() + 5
+            while len(manager) and time.monotonic() < deadline:
+                time.sleep(0.01)
+        assert len(manager) == 0
+        assert request.status == "cancelled"
+        manager.close()
+
+    def test_watch_services(self, mock_query, mock_connect, mock_close):
+        mock_query.return_value = {"service": [{"name": "test", "version": "latest"}]}
+        invalidated = threading.Event()
+
+        async def subscribe(*args, **kwargs):
+            subscription_sent()
+            yield {"subscribeEvent": {"channel": "services", "message": "test"}}
+            invalidated.set()
+            await asyncio.sleep(60)
+
+        client = MothrClient(service_cache_ttl=60)
+        client.service("test")
+        with mock.patch(TRANSPORT_SUBSCRIBE, execution_results(subscribe)):
+            future = client.watch_services("services")
+            assert invalidated.wait(timeout=5)
+        client.service("test")
+        assert mock_query.call_count == 2
+        future.cancel()
+        client.close()
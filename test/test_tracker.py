@@ -0,0 +1,92 @@
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+import mock
+import pytest
+from gql.transport.exceptions import TransportQueryError
+from mothrpy import JobRequest, JobTracker, MothrClient
+
+
+class TestJobTracker:
+    @mock.patch("gql.dsl.DSLSchema.query")
+    def test_poll(self, mock_query):
+        mock_query.side_effect = [
+            {
+                "job0": {"jobId": "job-1", "status": "running"},
+                "job1": {"jobId": "job-2", "status": "complete", "result": "done"},
+            },
+            {"job0": {"jobId": "job-1", "status": "failed", "error": "failed"}},
+        ]
+        tracker = JobTracker(MothrClient(), poll_frequency=60)
+        callback = mock.Mock()
+        first = tracker.track("job-1")
+        second = tracker.track("job-2", callback=callback)
+        assert tracker.poll() == 1
+        assert len(mock_query.call_args_list[0][0]) == 2
+        assert second.result(timeout=1)["result"] == "done"
+        callback.assert_called_once_with(second.result())
+        assert not first.done()
+        assert tracker.poll() == 0
+        assert first.result(timeout=1)["status"] == "failed"
+        tracker.close()
+
+    @mock.patch("gql.dsl.DSLSchema.query")
+    def test_wait_timeout(self, mock_query):
+        mock_query.return_value = {"job0": {"jobId": "job-1", "status": "running"}}
+        tracker = JobTracker(MothrClient(), poll_frequency=0.01)
+        with pytest.raises(FutureTimeoutError):
+            tracker.wait("job-1", timeout=0.05)
+        assert len(tracker) == 0
+        tracker.close()
+
+    @mock.patch("gql.dsl.DSLSchema.query")
+    def test_poll_missing_job(self, mock_query):
+        mock_query.side_effect = TransportQueryError(
+            "job not found",
+            errors=[{"message": "job not found", "path": ["job0"]}],
+            data={"job0": None},
+        )
+        tracker = JobTracker(MothrClient(), poll_frequency=60)
+        future = tracker.track("job-1")
+        tracker.poll()
+        with pytest.raises(ValueError):
+            future.result(timeout=1)
+        tracker.close()
+
+    @mock.patch("gql.dsl.DSLSchema.query")
+    def test_poll_errors(self, mock_query):
+        error = ConnectionError("Connection reset")
+        mock_query.side_effect = [
+            error,
+            error,
+            {"job0": {"jobId": "job-1", "status": "running"}},
+            error,
+            error,
+            error,
+        ]
+        tracker = JobTracker(MothrClient(), poll_frequency=60, max_poll_errors=3)
+        future = tracker.track("job-1")
+        # Transient errors keep the job tracked, a successful poll resets them
+        assert [tracker.poll() for _ in range(5)] == [1, 1, 1, 1, 1]
+        assert not future.done()
+        assert tracker.poll() == 0
+        with pytest.raises(ConnectionError):
+            future.result(timeout=1)
+        tracker.close()
+
+    @mock.patch("gql.dsl.DSLSchema.mutate")
+    @mock.patch("gql.dsl.DSLSchema.query")
+    def test_run_job_track(self, mock_query, mock_mutate):
+        mock_mutate.return_value = {
+            "submitJob": {"job": {"jobId": "test", "status": "submitted"}}
+        }
+        mock_query.side_effect = [
+            {"job0": {"jobId": "test", "status": "running"}},
+            {"job0": {"jobId": "test", "status": "complete", "result": "done"}},
+        ]
+        client = MothrClient()
+        client.tracker.poll_frequency = 0.01
+        request = JobRequest(client=client, service="test")
+        result = request.run_job(mode="track")
+        assert result["result"] == "done"
+        assert request.status == "complete"
+        assert mock_query.call_count == 2
@@ -0,0 +1,51 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import mock
+from mothrpy import MothrClient
+
+
+def graphql_response(data):
+    response = mock.Mock()
+    response.json.return_value = {"data": data}
+    return response
+
+
+class TestPooledHTTPTransport:
+    @mock.patch("requests.Session.request")
+    def test_concurrent_requests(self, mock_request):
+        mock_request.return_value = graphql_response(
+            {"services": [{"name": "test-service", "version": "latest"}]}
+        )
+        client = MothrClient(pool_maxsize=8)
+        with ThreadPoolExecutor(max_workers=16) as pool:
+            results = list(pool.map(lambda _: client.services(), range(200)))
+        assert all(len(services) == 1 for services in results)
+        assert mock_request.call_count == 200
+        session = client.transport.session
+        assert session is not None
+        assert session.get_adapter("http://localhost")._pool_maxsize == 8
+        client.close()
+        assert client.transport.session is None
+
+    @mock.patch("requests.Session.request")
+    def test_session_reused(self, mock_request):
+        mock_request.return_value = graphql_response({"services": []})
+        client = MothrClient()
+        client.services()
+        session = client.transport.session
+        client.services()
+        assert client.transport.session is session
+
+    @mock.patch("gql.dsl.DSLSchema.mutate")
+    def test_authorization_swapped(self, mock_mutate):
+        mock_mutate.side_effect = [
+            {"login": {"token": "access-token", "refresh": "refresh-token"}},
+            {"refresh": {"token": "refreshed-access-token"}},
+        ]
+        client = MothrClient(token="initial-token")
+        headers = client.transport.headers
+        client.login(username="test", password="password")
+        client.refresh_token()
+        assert headers == {"Authorization": "Bearer initial-token"}
+        assert client.transport.headers is client.headers
+        assert client.headers["Authorization"] == "Bearer refreshed-access-token"
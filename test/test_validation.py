@@ -0,0 +1,82 @@
+import mock
+import pytest
+from mothrpy import JobRequest, MothrClient, RequestValidator, ServiceSpec
+
+SERVICE = {
+    "name": "convert",
+    "version": "1.0",
+    "streamInput": False,
+    "parameters": [
+        {"name": "--in", "type": "input", "required": True},
+        {"name": "--format", "type": "parameter", "required": False},
+        {"name": None, "type": "output", "required": True},
+    ],
+}
+
+
+class TestServiceSpec:
+    def test_valid(self):
+        spec = ServiceSpec(SERVICE)
+        args = {
+            "parameters": [
+                {"type": "input", "name": "--in", "value": "s3://bucket/in.csv"},
+                {"type": "output", "value": "s3://bucket/out.csv"},
+            ],
+            "inputs": ["s3://bucket/extra"],
+        }
+        assert spec.errors(args) == []
+
+    def test_invalid(self):
+        spec = ServiceSpec(SERVICE)
+        args = {
+            "parameters": [
+                {"type": "input", "name": "--format", "value": "s3://bucket/in"},
+                {"type": "parameter", "value": "csv"},
+            ],
+            "outputs": ["bucket/out"],
+            "inputStream": "data",
+        }
+        assert spec.errors(args) == [
+            "parameter --format must be parameter, not input",
+            "missing required parameter --in",
+            "missing 1 required output parameters",
+            "outputs entry bucket/out is not an S3 URI",
+            "service convert does not accept inputStream",
+        ]
+
+
+class TestRequestValidator:
+    @mock.patch("gql.dsl.DSLSchema.mutate")
+    @mock.patch("gql.dsl.DSLSchema.query")
+    def test_submit(self, mock_query, mock_mutate):
+        mock_query.return_value = {"service": [SERVICE]}
+        mock_mutate.side_effect = lambda *fields: {
+            f.ast_field.alias.value: {"job": {"jobId": "job-1", "status": "queued"}}
+            for f in fields
+        }
+        validator = RequestValidator(services=["convert"])
+        client = MothrClient(validator=validator)
+        valid = (
+            JobRequest(client=client, service="convert")
+            .add_input("s3://bucket/in", name="--in")
+            .add_output("s3://bucket/out")
+        )
+        invalid = JobRequest(client=client, service="convert")
+        other = JobRequest(client=client, service="echo")
+        results = client.submit_many([invalid, valid, other])
+        assert isinstance(results[0], ValueError)
+        assert "missing required parameter --in" in str(results[0])
+        assert results[1:] == ["job-1", "job-1"]
+        assert len(mock_mutate.call_args[0]) == 2
+        with pytest.raises(ValueError):
+            invalid.submit()
+        # The service definition is fetched once
+        assert mock_query.call_count == 1
+        assert validator.invalidate("convert") == 1
+
+    @mock.patch("gql.dsl.DSLSchema.query")
+    def test_unknown_service(self, mock_query):
+        mock_query.return_value = {"service": []}
+        client = MothrClient(validator=RequestValidator())
+        request = JobRequest(client=client, service="missing")
+        assert "unknown service missing latest" in str(client.validate([request])[0])